@@ -3,13 +3,15 @@
 ########################################################################
 miami_path = True    # Package-wide variable, Auto setting for University of Miami
                      # change it to False if you are not using the file structure of University of Miami
-parallel_num = 8     # max core number used in parallel processing
 figsize_single_min = 6.0        # default min size in inch, for single plot
 figsize_single_max = 12.0        # default min size in inch, for single plot
 figsize_multi = [20.0, 12.0]    # default size in inch, for multiple subplots
+# settings used by low-level modules, i.e. parallel_num, compression of HDF5 datasets, are in _settings.py
 
 
 ###################### Do not change below this line ###################
+from ._settings import parallel_num, compression, design_matrix_cache_dir
+
 from . import _datetime
 from . import _gmt
 from . import _readfile
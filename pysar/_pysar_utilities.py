@@ -38,11 +38,17 @@ import time
 import datetime
 import glob
 import warnings
+import hashlib
+import collections
 
 import h5py
 import numpy as np
 import multiprocessing
+from scipy import sparse
+from scipy.sparse.linalg import splu, lsqr
+from scipy.sparse.csgraph import connected_components
 
+import _settings as settings
 import _readfile as readfile
 import _writefile as writefile
 import _datetime as ptime
@@ -643,6 +649,7 @@ def add_attribute(File, atr_new=dict()):
         return File
 
     # Update attributes
+    readfile.close_pooled_hdf5(File)
     h5 = h5py.File(File,'r+')
     if k in multi_dataset_hdf5_file+single_dataset_hdf5_file:
         for key, value in atr_new.items():
@@ -662,6 +669,7 @@ def add_attribute(File, atr_new=dict()):
                 else:
                     h5[k][epoch].attrs[key] = value
     h5.close()
+    readfile.invalidate_attribute_cache(File)
     return File
 
 
@@ -685,12 +693,12 @@ def check_parallel(file_num=1):
         return 1, enable_parallel, None, None
 
     # Find proper number of cores for parallel processing
-    num_cores = min(multiprocessing.cpu_count(), file_num, pysar.parallel_num)
+    num_cores = min(multiprocessing.cpu_count(), file_num, settings.parallel_num)
     if num_cores <= 1:
         enable_parallel = False
         print('parallel processing is disabled because min of the following two numbers <= 1:')
         print('available cpu number of the computer: '+str(multiprocessing.cpu_count()))
-        print('pysar.__init__.py: parallel_num: '+str(pysar.parallel_num))
+        print('pysar/_settings.py: parallel_num: '+str(settings.parallel_num))
     else:
         print('parallel processing using %d cores ...'%(num_cores))
     
@@ -899,9 +907,10 @@ def check_drop_ifgram(h5, atr, ifgram_list, print_msg=True):
 
     ifgram_list_out = list(ifgram_list)
     k = atr['FILE_TYPE']
-    for ifgram in ifgram_list:
-        if h5[k][ifgram].attrs['drop_ifgram'] == 'yes':
-            ifgram_list_out.remove(ifgram)
+    atr_list = readfile.read_epoch_attribute_list(h5, k, ifgram_list)
+    for i in range(len(ifgram_list)):
+        if atr_list[i].get('drop_ifgram') == 'yes':
+            ifgram_list_out.remove(ifgram_list[i])
     
     if len(ifgram_list) > len(ifgram_list_out) and print_msg:
         print("remove interferograms with 'drop_ifgram'='yes'")
@@ -1134,7 +1143,7 @@ def temporal_average(File, outFile=None):
     print('writing >>> '+outFile)
     h5mean = h5py.File(outFile, 'w')
     group  = h5mean.create_group('mask')
-    dset = group.create_dataset(os.path.basename('mask'), data=dMean, compression='gzip')
+    dset = group.create_dataset(os.path.basename('mask'), data=dMean, **writefile.compression_kwargs())
     for key,value in atr.items():
         group.attrs[key] = value
     h5mean.close()
@@ -1534,12 +1543,14 @@ def date_list(h5file):
 
 
 ######################################
-def design_matrix(ifgramFile=None, date12_list=[]):
+def design_matrix(ifgramFile=None, date12_list=[], sparse_matrix=False):
     '''Make the design matrix for the inversion based on date12_list.
     Input:
         ifgramFile  - string, name/path of interferograms file
         date12_list - list of string, date12 used in calculation in YYMMDD-YYMMDD format
                       use all date12 from ifgramFile if input is empty
+        sparse_matrix - bool, return A/B as scipy.sparse.csr_matrix, for network with large number of
+                        acquisitions and interferograms
     Outputs:
         A - 2D np.array in size (igram_num, date_num-1)
             representing date combination for each interferogram
@@ -1561,14 +1572,30 @@ def design_matrix(ifgramFile=None, date12_list=[]):
     date_num = len(date6_list)
     igram_num = len(date12_list)
 
+    date_idx = dict((date6_list[i], i) for i in range(date_num))
+    idx = np.array([[date_idx[j] for j in date12.split('-')] for date12 in date12_list], dtype=int).reshape(-1,2)
+    m_idx, s_idx = idx[:,0], idx[:,1]
+
+    if sparse_matrix:
+        # A: -1/1 for master/slave date; B: dt of each date interval between master and slave date
+        row = np.arange(igram_num)
+        A = sparse.csr_matrix((np.hstack((-1*np.ones(igram_num), np.ones(igram_num))),\
+                               (np.hstack((row, row)), np.hstack((m_idx, s_idx)))), shape=(igram_num, date_num))
+        span = s_idx - m_idx
+        row = np.repeat(row, span)
+        col = np.arange(row.size) - np.repeat(np.cumsum(span) - span, span) + np.repeat(m_idx, span)
+        dt = np.diff(tbase)
+        B = sparse.csr_matrix((dt[col], (row, col)), shape=(igram_num, date_num-1))
+        A = A[:,1:]
+        return A,B
+
     A = np.zeros((igram_num, date_num))
     B = np.zeros(np.shape(A))
     #t = np.zeros((igram_num, 2))
     for i in range(igram_num):
-        m_idx, s_idx = [date6_list.index(j) for j in date12_list[i].split('-')]
-        A[i, m_idx] = -1
-        A[i, s_idx] = 1
-        B[i, m_idx:s_idx] = tbase[m_idx+1:s_idx+1] - tbase[m_idx:s_idx]
+        A[i, m_idx[i]] = -1
+        A[i, s_idx[i]] = 1
+        B[i, m_idx[i]:s_idx[i]] = tbase[m_idx[i]+1:s_idx[i]+1] - tbase[m_idx[i]:s_idx[i]]
         #t[i,:] = [tbase[m_idx], tbase[s_idx]]
     # Remove the 1st date assuming it's zero
     A = A[:,1:]
@@ -1578,14 +1605,451 @@ def design_matrix(ifgramFile=None, date12_list=[]):
 
 
 ######################################
-def timeseries_inversion(ifgramFile, timeseriesFile):
+def network_md5(date12_list):
+    '''MD5 hash of network of interferograms, as key of design matrix cache and NETWORK_MD5 attribute of
+    timeseries file from L2 inversion, for timeseries_inversion_incremental()
+    Input : date12_list - list of string, date12 in YYMMDD-YYMMDD format, with dropped interferograms excluded
+    Output: string, hex digest
+    '''
+    return hashlib.md5(','.join(date12_list).encode('utf-8')).hexdigest()
+
+
+design_matrix_cache = collections.OrderedDict()
+design_matrix_cache_size = 16
+
+def design_matrix_factorization(date12_list, cache_dir=None, print_msg=True):
+    '''Design matrix of network inversion and its SVD / pseudo-inverse, with cache.
+    Results are cached in memory (up to design_matrix_cache_size networks), keyed by hash of the date12 list,
+    so that all modules with the same network (same interferograms dropped) share one factorization.
+    Disk cache (designMatrix.h5 file in cache_dir) is used only if cache_dir is set explicitly;
+    failure of reading/writing it, i.e. read-only directory or file locked by another process, is ignored.
+    Inputs:
+        date12_list - list of string, date12 used in calculation in YYMMDD-YYMMDD format,
+                      with dropped interferograms excluded already
+        cache_dir   - string, directory of the on-disk cache file,
+                      default: environment variable PYSAR_DESIGN_MATRIX_CACHE_DIR if set,
+                               settings.design_matrix_cache_dir otherwise (None, to cache in memory only)
+    Output:
+        inv_mat - dict, with the following items, arrays are shared by all callers thus read-only,
+                  copy them before modification:
+                  A/B        - 2D np.array, design matrix, see design_matrix()
+                  B_inv      - 2D np.array in size of (date_num-1, igram_num), pseudo-inverse of B
+                  BtB_inv    - 2D np.array in size of (date_num-1, date_num-1), (pseudo-)inverse of B^T*B
+                  s          - 1D np.array, singular values of B
+                  rank       - int, rank of B
+                  subset_num - int, number of connected subsets of the network
+    Example:
+        inv_mat = design_matrix_factorization(date12_list)
+        B_inv = inv_mat['B_inv']
+    '''
+    key = network_md5(date12_list)
+    key_list = ['A','B','B_inv','BtB_inv','s']
+
+    if not cache_dir:
+        cache_dir = os.environ.get('PYSAR_DESIGN_MATRIX_CACHE_DIR', settings.design_matrix_cache_dir)
+
+    # In-memory cache
+    if key in design_matrix_cache:
+        return dict(design_matrix_cache[key])
+
+    # On-disk cache
+    inv_mat = None
+    if cache_dir:
+        cache_file = os.path.join(cache_dir, 'designMatrix.h5')
+        try:
+            if os.path.isfile(cache_file):
+                h5 = h5py.File(cache_file, 'r')
+                if key in h5 and all(k in h5[key] for k in key_list):
+                    inv_mat = dict()
+                    for k in key_list:
+                        inv_mat[k] = h5[key].get(k)[:]
+                    for k in ['rank','subset_num']:
+                        inv_mat[k] = int(h5[key].attrs[k])
+                    if print_msg:
+                        print('read design matrix and its inverse from cache file: '+cache_file)
+                h5.close()
+        except Exception as e:
+            inv_mat = None
+            if print_msg:
+                print('WARNING: can not read cache file: '+cache_file+', '+str(e)+', calculate without it.')
+
+    # Calculate
+    if not inv_mat:
+        A, B = design_matrix(date12_list=date12_list)
+        U, s, Vt = np.linalg.svd(B, full_matrices=False)
+        tol = s.max() * max(B.shape) * np.finfo(s.dtype).eps
+        rank = int(np.sum(s > tol))
+        s_inv = np.zeros(s.shape)
+        s_inv[:rank] = 1. / s[:rank]
+        B_inv = np.dot(Vt.T * s_inv, U.T)
+        BtB_inv = np.dot(Vt.T * s_inv**2, Vt)
+        # rank = date_num - number of connected subsets of the network
+        subset_num = B.shape[1] + 1 - rank
+        inv_mat = {'A':A, 'B':B, 'B_inv':B_inv, 'BtB_inv':BtB_inv, 's':s, 'rank':rank, 'subset_num':subset_num}
+
+        if cache_dir:
+            if print_msg:
+                print('write design matrix and its inverse into cache file: '+cache_file)
+            try:
+                h5 = h5py.File(cache_file, 'a')
+                try:
+                    # overwrite cache written by older version, with items missing
+                    if key in h5:
+                        del h5[key]
+                    group = h5.create_group(key)
+                    for k in key_list:
+                        group.create_dataset(k, data=inv_mat[k])
+                    for k in ['rank','subset_num']:
+                        group.attrs[k] = inv_mat[k]
+                    group.attrs['DATE12'] = ','.join(date12_list)
+                finally:
+                    h5.close()
+            except Exception as e:
+                if print_msg:
+                    print('WARNING: can not write cache file: '+cache_file+', '+str(e)+', continue without it.')
+
+    if inv_mat['subset_num'] > 1 and print_msg:
+        print('WARNING: network of interferograms has %d subsets, '\
+              'minimum-norm solution using SVD will be applied.' % (inv_mat['subset_num']))
+
+    for k in key_list:
+        inv_mat[k].setflags(write=False)
+    design_matrix_cache[key] = inv_mat
+    while len(design_matrix_cache) > design_matrix_cache_size:
+        design_matrix_cache.popitem(last=False)
+    return dict(inv_mat)
+
+
+######################################
+def split_row_box(length, width, layer_num, memory_limit=4.0, min_box_num=1, print_msg=True):
+    '''Split the whole area into boxes of consecutive rows,
+    so that the data of one box (layer_num layers in float32) fits within memory_limit.
+    Inputs:
+        length/width - int, number of rows/columns of the whole area
+        layer_num    - int, number of float32 layers hold in memory for each pixel,
+                       i.e. ifgram_num + 2*date_num for network inversion
+        memory_limit - float, max memory size in GB used for one box
+        min_box_num  - int, min number of boxes, i.e. number of cores for parallel processing
+    Output:
+        box_list - list of 4-tuple of int, each defined in (x0, y0, x1, y1)
+    Example:
+        box_list = split_row_box(length, width, ifgram_num+2*date_num, memory_limit=4.0)
+    '''
+    row_size = float(width * layer_num * 4) / (1024.**3)
+    row_step = int(max(1, min(length, memory_limit / row_size)))
+    row_step = min(row_step, int(np.ceil(float(length) / min_box_num)))
+    box_list = []
+    for y0 in range(0, length, row_step):
+        box_list.append((0, y0, width, min(y0+row_step, length)))
+    if print_msg:
+        print('split %d rows into %d boxes of %d rows with memory limit of %.1f GB'\
+              % (length, len(box_list), row_step, memory_limit))
+    return box_list
+
+
+def read_ifgram_box(h5ifgram, ifgram_list, box, ref_value=None):
+    '''Read interferograms within the box into 2D matrix, referenced in space if ref_value is given
+    Inputs:
+        h5ifgram    - HDF5 file object of multi_group file, i.e. interferograms, coherence, in stack or cube layout
+        ifgram_list - list of string, group name of interferograms to read
+        box         - 4-tuple of int, area to read, defined in (x0, y0, x1, y1)
+        ref_value   - 1D np.array in size of (ifgram_num,), phase value of reference pixel
+    Output:
+        data - 2D np.array in size of (ifgram_num, pixel_num_of_box) in float32
+    '''
+    k = [i for i in h5ifgram.keys() if i in multi_group_hdf5_file][0]
+    ifgram_num = len(ifgram_list)
+    pixel_num = (box[2]-box[0]) * (box[3]-box[1])
+    data = np.array(readfile.read_epoch_box(h5ifgram, k, ifgram_list, box).reshape(ifgram_num, pixel_num),\
+                    np.float32)
+    if ref_value is not None:
+        data -= np.array(ref_value, np.float32).reshape(-1, 1)
+    return data
+
+
+def ts_inverse_L2(data, B_inv, dt):
+    '''Invert interferograms into phase timeseries with L2 norm minimization using SBAS velocity model
+    Inputs:
+        data  - 2D np.array in size of (ifgram_num, pixel_num), phase of interferograms
+        B_inv - 2D np.array in size of (date_num-1, ifgram_num), pseudo-inverse of design matrix B
+        dt    - 2D np.array in size of (date_num-1, 1), temporal baseline between consecutive dates
+    Output:
+        ts - 2D np.array in size of (date_num, pixel_num), phase timeseries with 1st date as zero
+    '''
+    ts_rate = np.dot(B_inv, data)
+    ts = np.zeros((ts_rate.shape[0]+1, ts_rate.shape[1]), np.float32)
+    ts[1:,:] = np.cumsum(ts_rate * dt, axis=0)
+    return ts
+
+
+def group_pixel_by_pattern(mask):
+    '''Group pixels by their unique pattern of valid interferograms
+    Input:
+        mask - 2D np.array of bool in size of (ifgram_num, pixel_num), True for valid interferogram
+    Output:
+        pattern_list - list of tuple (flag, pixel_idx), with
+                       flag      - 1D np.array of bool in size of (ifgram_num,), valid interferograms of the pattern
+                       pixel_idx - 1D np.array of int, index of pixels sharing the pattern
+    '''
+    # pack bits of each pixel into one void scalar for fast unique
+    pattern = np.ascontiguousarray(np.packbits(mask, axis=0).T)
+    pattern = pattern.view(np.dtype((np.void, pattern.shape[1]))).flatten()
+    pattern_idx = np.unique(pattern, return_inverse=True)[1].flatten()
+
+    pixel_idx_sorted = np.argsort(pattern_idx, kind='mergesort')
+    split_idx = np.cumsum(np.bincount(pattern_idx))[:-1]
+    pattern_list = []
+    for pixel_idx in np.split(pixel_idx_sorted, split_idx):
+        pattern_list.append((mask[:, pixel_idx[0]], pixel_idx))
+    return pattern_list
+
+
+def ts_inverse_L2_masked(data, B, dt, mask):
+    '''Invert interferograms into phase timeseries with L2 norm minimization,
+    excluding invalid interferograms pixel-wisely.
+
+    Pixels are grouped by their pattern of valid interferograms, the pseudo-inverse of the
+    reduced design matrix is calculated once per pattern and applied to all pixels of the group.
+    Inputs:
+        data - 2D np.array in size of (ifgram_num, pixel_num), phase of interferograms
+        B    - 2D np.array in size of (ifgram_num, date_num-1), design matrix of velocity model
+        dt   - 2D np.array in size of (date_num-1, 1), temporal baseline between consecutive dates
+        mask - 2D np.array of bool in size of (ifgram_num, pixel_num), True for valid interferogram
+    Output:
+        ts - 2D np.array in size of (date_num, pixel_num), phase timeseries with 1st date as zero
+    '''
+    ts = np.zeros((B.shape[1]+1, data.shape[1]), np.float32)
+    for flag, pixel_idx in group_pixel_by_pattern(mask):
+        if not np.any(flag):
+            continue
+        B_inv = np.array(np.linalg.pinv(B[flag,:]), np.float32)
+        ts[:, pixel_idx] = ts_inverse_L2(data[np.ix_(flag, pixel_idx)], B_inv, dt)
+    return ts
+
+
+def ts_inverse_L2_sparse(data, B, dt):
+    '''Invert interferograms into phase timeseries with L2 norm minimization using sparse design matrix,
+    for network with large number of acquisitions and interferograms, where dense pseudo-inverse is expensive.
+    Normal equations are solved for all pixels at once with sparse LU factorization of B^T*B;
+    if B^T*B is singular, i.e. network with subsets, minimum-norm solution with LSQR is used pixel by pixel.
+    Inputs:
+        data - 2D np.array in size of (ifgram_num, pixel_num), phase of interferograms
+        B    - scipy.sparse matrix in size of (ifgram_num, date_num-1), design matrix
+        dt   - 2D np.array in size of (date_num-1, 1), temporal baseline between consecutive dates
+    Output:
+        ts - 2D np.array in size of (date_num, pixel_num), phase timeseries with 1st date as zero
+    '''
+    B = sparse.csc_matrix(B)
+    try:
+        lu = splu(sparse.csc_matrix(B.T.dot(B)))
+        ts_rate = lu.solve(np.array(B.T.dot(data), np.float64))
+    except RuntimeError:
+        ts_rate = np.zeros((B.shape[1], data.shape[1]), np.float32)
+        for i in range(data.shape[1]):
+            ts_rate[:,i] = lsqr(B, data[:,i], atol=1e-8, btol=1e-8)[0]
+    ts = np.zeros((ts_rate.shape[0]+1, ts_rate.shape[1]), np.float32)
+    ts[1:,:] = np.cumsum(ts_rate * dt, axis=0)
+    return ts
+
+
+def solve_WLS(data, B, weight):
+    '''Solve weighted least squares (WLS) of all pixels at once,
+    using the normal equations with batched Cholesky decomposition.
+    Inputs:
+        data   - 2D np.array in size of (ifgram_num, pixel_num), observations
+        B      - 2D np.array in size of (ifgram_num, model_num), design matrix
+        weight - 2D np.array in size of (ifgram_num, pixel_num), weight of observations
+    Output:
+        X - 2D np.array in size of (model_num, pixel_num), estimated parameters in float64
+    '''
+    ifgram_num, pixel_num = data.shape
+    model_num = B.shape[1]
+
+    # Normal equations: N = B^T*W*B, r = B^T*W*d, for each pixel
+    BB = (B[:,:,np.newaxis] * B[:,np.newaxis,:]).reshape(ifgram_num, -1)
+    N = np.dot(np.array(weight.T, np.float64), BB).reshape(pixel_num, model_num, model_num)
+    r = np.dot(np.array((weight * data).T, np.float64), B).reshape(pixel_num, model_num, 1)
+    del BB
+
+    try:
+        L = np.linalg.cholesky(N)
+        X = np.linalg.solve(np.transpose(L, (0,2,1)), np.linalg.solve(L, r))
+    except np.linalg.LinAlgError:
+        # singular normal matrix for some pixels, i.e. zero weight or network with multiple subsets
+        X = np.matmul(np.linalg.pinv(N), r)
+    return X.reshape(pixel_num, model_num).T
+
+
+def ts_inverse_WLS(data, B, dt, weight):
+    '''Invert interferograms into phase timeseries with weighted least squares (WLS)
+    Inputs:
+        data   - 2D np.array in size of (ifgram_num, pixel_num), phase of interferograms
+        B      - 2D np.array in size of (ifgram_num, date_num-1), design matrix of velocity model
+        dt     - 2D np.array in size of (date_num-1, 1), temporal baseline between consecutive dates
+        weight - 2D np.array in size of (ifgram_num, pixel_num), weight of interferograms, i.e. coherence
+    Output:
+        ts - 2D np.array in size of (date_num, pixel_num), phase timeseries with 1st date as zero
+    '''
+    ts_rate = solve_WLS(data, B, weight)
+    ts = np.zeros((ts_rate.shape[0]+1, ts_rate.shape[1]), np.float32)
+    ts[1:,:] = np.cumsum(ts_rate * dt, axis=0)
+    return ts
+
+
+def ts_inverse_L1(data, B, B_inv, dt, max_iter=50, tol=1e-4, eps=1e-4):
+    '''Invert interferograms into phase timeseries with L1 norm minimization,
+    using iteratively reweighted least squares (IRLS) on all pixels at once.
+
+    Starting from the L2 solution, each iteration solves WLS with weight of 1/|residual| for
+    pixels not converged yet. Pixels not converged after max_iter use the L2 solution instead.
+    Inputs:
+        data     - 2D np.array in size of (ifgram_num, pixel_num), phase of interferograms
+        B/B_inv  - 2D np.array, design matrix of velocity model and its pseudo-inverse
+        dt       - 2D np.array in size of (date_num-1, 1), temporal baseline between consecutive dates
+        max_iter - int, max number of iterations
+        tol      - float, convergence threshold of max parameter change relative to max parameter
+        eps      - float, min absolute residual in weight calculation, to avoid division by zero
+    Outputs:
+        ts      - 2D np.array in size of (date_num, pixel_num), phase timeseries with 1st date as zero
+        l1_flag - 1D np.array of bool in size of (pixel_num,), True for converged L1 solution,
+                  False for L2 solution
+    '''
+    ts_rate_L2 = np.dot(B_inv, data)
+    ts_rate = np.array(ts_rate_L2, np.float64)
+    l1_flag = np.zeros(data.shape[1], np.bool_)
+    idx = np.arange(data.shape[1])
+    for i in range(max_iter):
+        resid = data[:,idx] - np.dot(B, ts_rate[:,idx])
+        weight = 1. / np.maximum(np.abs(resid), eps)
+        X = solve_WLS(data[:,idx], B, weight)
+
+        # stop iteration for converged pixels
+        dX = np.max(np.abs(X - ts_rate[:,idx]), axis=0)
+        ts_rate[:,idx] = X
+        conv = dX <= tol * np.maximum(np.max(np.abs(X), axis=0), np.finfo(np.float32).tiny)
+        l1_flag[idx[conv]] = True
+        idx = idx[~conv]
+        if idx.size == 0:
+            break
+    ts_rate[:,~l1_flag] = ts_rate_L2[:,~l1_flag]
+
+    ts = np.zeros((ts_rate.shape[0]+1, ts_rate.shape[1]), np.float32)
+    ts[1:,:] = np.cumsum(ts_rate * dt, axis=0)
+    return ts, l1_flag
+
+
+def ifgram_inversion_patch(ifgramFile, ifgram_list, box, inv_dict):
+    '''Invert the interferograms within the box into phase timeseries
+    Inputs:
+        ifgramFile  - string, path of interferograms file
+        ifgram_list - list of string, group name of interferograms used in inversion
+        box         - 4-tuple of int, area to invert, defined in (x0, y0, x1, y1)
+        inv_dict    - dict, with the following items:
+                      method    - string, L2, L2_masked, L2_sparse, WLS or L1
+                      A         - 2D np.array, design matrix of interferograms, for residual
+                      B/B_inv   - 2D np.array, design matrix and its pseudo-inverse
+                                  scipy.sparse matrix and None for L2_sparse
+                      dt        - 2D np.array, see ts_inverse_L2()
+                      ref_value - 1D np.array, phase value of reference pixel for each interferogram
+                      coherence_file - string, path of coherence file, for WLS only
+                      coh_list       - list of string, group name of coherence for each interferogram
+                      residual_rms   - bool, calculate RMS of phase residual or not
+                      ts_var_factor  - 2D np.array in size of (date_num-1, 1), diagonal of T*(B^T*B)^-1*T^T,
+                                       with T as the cumulative sum of dt, for timeseries std only
+                      dof            - int, degree of freedom of residual, for timeseries std only
+    Output:
+        out - dict, with the following items:
+              timeseries - 2D np.array in size of (date_num, pixel_num_of_box), phase timeseries
+              temporal_coherence - 1D np.array in size of (pixel_num_of_box,), temporal coherence
+              residualRMS - 1D np.array in size of (pixel_num_of_box,), RMS of phase residual in radian,
+                            if residual_rms is True
+              L1orL2     - 1D np.array in size of (pixel_num_of_box,), 1 for L1 and 0 for L2 solution,
+                           for L1 only
+              timeseriesStd - 2D np.array in size of (date_num, pixel_num_of_box), phase timeseries std,
+                              if ts_var_factor is given
+    '''
+    out = dict()
+    h5ifgram = h5py.File(ifgramFile, 'r')
+    data = read_ifgram_box(h5ifgram, ifgram_list, box)
+    h5ifgram.close()
+
+    # zero value for no data, i.e. not unwrapped, in interferograms
+    if inv_dict['method'] == 'L2_masked':
+        mask = data != 0.
+    data -= inv_dict['ref_value'].reshape(-1,1)
+
+    if inv_dict['method'] == 'L2_masked':
+        ts = ts_inverse_L2_masked(data, inv_dict['B'], inv_dict['dt'], mask)
+    elif inv_dict['method'] == 'L2_sparse':
+        ts = ts_inverse_L2_sparse(data, inv_dict['B'], inv_dict['dt'])
+    elif inv_dict['method'] == 'WLS':
+        h5coh = h5py.File(inv_dict['coherence_file'], 'r')
+        weight = read_ifgram_box(h5coh, inv_dict['coh_list'], box)
+        h5coh.close()
+        ts = ts_inverse_WLS(data, inv_dict['B'], inv_dict['dt'], weight)
+    elif inv_dict['method'] == 'L1':
+        ts, l1_flag = ts_inverse_L1(data, inv_dict['B'], inv_dict['B_inv'], inv_dict['dt'])
+        out['L1orL2'] = np.array(l1_flag, np.float32)
+    else:
+        ts = ts_inverse_L2(data, inv_dict['B_inv'], inv_dict['dt'])
+    out['timeseries'] = ts
+
+    # Temporal coherence (Tizzani et al., 2007) and residual RMS, with interferograms still in memory
+    # interferograms excluded in L2_masked inversion are excluded here as well
+    resid = data - inv_dict['A'].dot(ts[1:,:])
+    if inv_dict['method'] == 'L2_masked':
+        resid *= mask
+        num = np.sum(mask, axis=0)
+        num[num == 0] = 1
+        out['temporal_coherence'] = np.abs(np.sum(np.exp(1j*resid, dtype=np.complex64)*mask, axis=0)) / num
+    else:
+        num = resid.shape[0]
+        out['temporal_coherence'] = np.abs(np.sum(np.exp(1j*resid, dtype=np.complex64), axis=0)) / num
+    if inv_dict.get('residual_rms', False):
+        out['residualRMS'] = np.sqrt(np.sum(resid**2, axis=0) / num)
+
+    # Posterior std of timeseries: sigma^2 * diag(T*(B^T*B)^-1*T^T), with sigma^2 from residual
+    if inv_dict.get('ts_var_factor', None) is not None:
+        sigma2 = np.sum(resid**2, axis=0) / inv_dict['dof']
+        out['timeseriesStd'] = np.zeros(ts.shape, np.float32)
+        out['timeseriesStd'][1:,:] = np.sqrt(inv_dict['ts_var_factor'] * sigma2)
+    return out
+
+
+def timeseries_inversion(ifgramFile, timeseriesFile, memory_limit=4.0, method='L2', parallel=1, coherenceFile=None,\
+                         residualRMS=False, timeseriesStd=False):
     '''Implementation of the SBAS algorithm.
     modified from sbas.py written by scott baker, 2012 
-    
+
+    Interferograms are read and inverted box by box (consecutive rows),
+    and results are written into the output file directly,
+    so that the max memory usage depends on memory_limit, not on the size of dataset.
+    With parallel > 1, boxes are dispatched to multiple processes, each reading its own
+    box from ifgramFile; results are written by the main process only.
+    Temporal coherence is calculated in the same pass and written into temporalCoherence.h5
+    in the same directory as timeseriesFile, so temporal_coherence.py is not needed afterwards.
+
     Usage:
-    timeseries_inversion(h5flat,h5timeseries)
-      h5flat: hdf5 file with the interferograms 
-      h5timeseries: hdf5 file with the output from the inversion
+    timeseries_inversion(ifgramFile, timeseriesFile, memory_limit=4.0, method='L2', parallel=1, coherenceFile=None,
+                         residualRMS=False, timeseriesStd=False)
+      ifgramFile     : hdf5 file with the interferograms 
+      timeseriesFile : hdf5 file with the output from the inversion
+      memory_limit   : float, max memory size in GB used for one box
+      method         : string, L2        - L2 norm minimization using all interferograms
+                               L2_masked - L2 norm minimization excluding interferograms with zero value
+                                           (not unwrapped) pixel by pixel
+                               L2_sparse - L2 norm minimization with sparse design matrix and factorization,
+                                           for network with large number of acquisitions and interferograms
+                               WLS       - weighted least squares using spatial coherence as weight
+                               L1        - L1 norm minimization using iteratively reweighted least squares,
+                                           with L1orL2.h5 file written for pixels converged (1) or not (0)
+      parallel       : int, number of processes for parallel processing, 1 to disable.
+                       memory_limit is shared by all processes.
+      coherenceFile  : hdf5 file with the spatial coherence of interferograms, for WLS only
+      residualRMS    : bool, write RMS of phase residual between interferograms and time series
+                       into residualRMS.h5 file or not
+      timeseriesStd  : bool, write posterior standard deviation of timeseries into timeseriesStd.h5 file or not,
+                       from residual variance of each pixel and (B^T*B)^-1 of the network, for L2 method only
     '''
     total = time.time()
 
@@ -1596,7 +2060,7 @@ def timeseries_inversion(ifgramFile, timeseriesFile):
     pixel_num = length * width
 
     h5ifgram = h5py.File(ifgramFile,'r')
-    ifgram_list = sorted(h5ifgram['interferograms'].keys())
+    ifgram_list = readfile.read_epoch_list(h5ifgram, 'interferograms')
     ifgram_list = check_drop_ifgram(h5ifgram, atr, ifgram_list)
     ifgram_num = len(ifgram_list)
 
@@ -1614,8 +2078,34 @@ def timeseries_inversion(ifgramFile, timeseriesFile):
     print('number of acquisitions   : '+str(date_num))
 
     # Design matrix
-    A,B = design_matrix(ifgramFile, date12_list)
-    B_inv = np.array(np.linalg.pinv(B), np.float32)
+    if method == 'L2_sparse':
+        A, B = design_matrix(date12_list=date12_list, sparse_matrix=True)
+        B_inv = None
+        # network as graph with acquisitions as nodes and interferograms as edges
+        date_idx = dict((date8_list[i], i) for i in range(date_num))
+        idx = np.array([[date_idx[d] for d in ptime.yyyymmdd(i.split('-'))] for i in date12_list])
+        graph = sparse.csr_matrix((np.ones(ifgram_num), (idx[:,0], idx[:,1])), shape=(date_num, date_num))
+        subset_num = connected_components(graph, directed=False)[0]
+        if subset_num > 1:
+            print('WARNING: network of interferograms has %d subsets, '\
+                  'minimum-norm solution using LSQR will be applied.' % (subset_num))
+    else:
+        inv_mat = design_matrix_factorization(date12_list)
+        A = np.array(inv_mat['A'], np.float32)
+        B = inv_mat['B']
+        B_inv = np.array(inv_mat['B_inv'], np.float32)
+    inv_dict = dict(method=method, A=A, B=B, B_inv=B_inv, dt=dt, residual_rms=residualRMS)
+
+    # Posterior covariance factor of timeseries, same for all pixels, scaled by residual variance of each pixel
+    if timeseriesStd and method != 'L2':
+        print('WARNING: timeseries std is supported for L2 method only, skip it for '+method+' method.')
+        timeseriesStd = False
+    if timeseriesStd:
+        # T: ts[1:] = T * rate, cumulative sum of velocity times dt
+        T = np.tril(np.ones((date_num-1, date_num-1))) * dt.reshape(1,-1)
+        inv_dict['ts_var_factor'] = np.array(np.sum(np.dot(T, inv_mat['BtB_inv']) * T, axis=1).reshape(-1,1),\
+                                             np.float32)
+        inv_dict['dof'] = max(ifgram_num - inv_mat['rank'], 1)
 
     # Reference pixel in space
     try:
@@ -1626,84 +2116,268 @@ def timeseries_inversion(ifgramFile, timeseriesFile):
         print('ERROR: No ref_x/y found! Can not inverse interferograms without reference in space.')
         print('run seed_data.py '+ifgramFile+' --mark-attribute for a quick referencing.')
         sys.exit(1)
-
-    ##### Inversion Function
-    def ts_inverse(dataLine, B_inv, dt, date_num):
-        numPoint = dataLine.shape[1]
-        tmp_rate = np.dot(B_inv, dataLine)
-        defo1 = tmp_rate * np.tile(dt,(1,numPoint))
-        defo0 = np.array([0.]*numPoint,np.float32)
-        defo  = np.vstack((defo0, np.cumsum(defo1,axis=0)))
-        return defo
-
-    ##### Read Interferograms
-    print('Reading interferograms ...')
-    data = np.zeros((ifgram_num,pixel_num), np.float32)
-    prog_bar = ptime.progress_bar(maxValue=ifgram_num, prefix='loading: ')
-    for j in range(ifgram_num):
-        ifgram = ifgram_list[j]
-        group = h5ifgram['interferograms'][ifgram]
-        d = group.get(ifgram)[:]
-        d -= d[ref_y, ref_x]
-        data[j] = d.flatten(1)
-        prog_bar.update(j+1, suffix=date12_list[j])
+    ref_value = read_ifgram_box(h5ifgram, ifgram_list, (ref_x, ref_y, ref_x+1, ref_y+1)).flatten()
     h5ifgram.close()
-    prog_bar.close()
-
-    ##### Inversion
-    print('Inversing time series ...')
-    dataPoint = np.zeros((ifgram_num,1),np.float32)
-    dataLine  = np.zeros((ifgram_num,width),np.float32)
-    tempDeformation = np.zeros((date_num,pixel_num),np.float32)
-
-    prog_bar = ptime.progress_bar(maxValue=length, prefix='calculating: ')
-    for i in range(length):
-        dataLine = data[:,i*width:(i+1)*width]
-        defoLine = ts_inverse(dataLine, B_inv, dt, date_num)
-        tempDeformation[:,i*width:(i+1)*width] = defoLine
-        prog_bar.update(i+1, every=length/100)
-    prog_bar.close()
-    del data
+    inv_dict['ref_value'] = ref_value
+
+    # Coherence as weight, matched with interferograms by date12
+    if method == 'WLS':
+        if not coherenceFile or not os.path.isfile(coherenceFile):
+            print('ERROR: coherence file is required for WLS inversion, input is: '+str(coherenceFile))
+            sys.exit(1)
+        print('use spatial coherence from file '+coherenceFile+' as weight')
+        h5coh = h5py.File(coherenceFile, 'r')
+        coh_list_all = readfile.read_epoch_list(h5coh, 'coherence')
+        h5coh.close()
+        coh_date12_list = ptime.list_ifgram2date12(coh_list_all)
+        try:
+            inv_dict['coh_list'] = [coh_list_all[coh_date12_list.index(i)] for i in date12_list]
+        except ValueError:
+            print('ERROR: not all interferograms have coherence in file '+coherenceFile)
+            sys.exit(1)
+        inv_dict['coherence_file'] = coherenceFile
 
-    ##### Time Series Data Preparation
-    print('converting phase to range')
-    timeseries = np.zeros((date_num,length,width),np.float32)
-    phase2range = -1*float(atr['WAVELENGTH'])/(4.*np.pi)
-    for i in range(date_num):
-        timeseries[i] = tempDeformation[i].reshape(width,length).T
-        timeseries[i] *= phase2range
-    del tempDeformation
-  
     ##### Output Time Series File
     print('writing >>> '+timeseriesFile)
-    print('number of dates: '+str(date_num))
     h5timeseries = h5py.File(timeseriesFile,'w')
     group = h5timeseries.create_group('timeseries')
-    prog_bar = ptime.progress_bar(maxValue=date_num, prefix='writing: ')
-    for i in range(date_num):
-        date = date8_list[i]
-        dset = group.create_dataset(date, data=timeseries[i], compression='gzip')
-        prog_bar.update(i+1, suffix=date)
+    for date in date8_list:
+        group.create_dataset(date, shape=(length, width), dtype=np.float32, chunks=True, **writefile.compression_kwargs())
+
+    if timeseriesStd:
+        tsStdFile = os.path.join(os.path.dirname(timeseriesFile), 'timeseriesStd.h5')
+        print('writing >>> '+tsStdFile)
+        h5std = h5py.File(tsStdFile,'w')
+        group_std = h5std.create_group('timeseries')
+        for date in date8_list:
+            group_std.create_dataset(date, shape=(length, width), dtype=np.float32, chunks=True, **writefile.compression_kwargs())
+
+    # Auxiliary output files, key in output of ifgram_inversion_patch(): [file name, FILE_TYPE, UNIT]
+    out_dir = os.path.dirname(timeseriesFile)
+    aux_file_dict = dict()
+    aux_file_dict['temporal_coherence'] = [os.path.join(out_dir, 'temporalCoherence.h5'), 'temporal_coherence', '1']
+    if residualRMS:
+        aux_file_dict['residualRMS'] = [os.path.join(out_dir, 'residualRMS.h5'), 'rmse', 'radian']
+    if method == 'L1':
+        aux_file_dict['L1orL2'] = [os.path.join(out_dir, 'L1orL2.h5'), 'mask', '1']
+    h5aux_dict = dict()
+    for key, (fname, k, unit) in aux_file_dict.items():
+        print('writing >>> '+fname)
+        atr_aux = atr.copy()
+        atr_aux['FILE_TYPE'] = k
+        atr_aux['UNIT'] = unit
+        h5aux_dict[key] = writefile.create_hdf5_file(atr_aux, fname)
+
+    ##### Inversion box by box
+    print('Inversing time series ...')
+    num_cores, enable_parallel = 1, False
+    if parallel > 1:
+        num_cores, enable_parallel, Parallel, delayed = check_parallel(min(parallel, length))
+    # interferograms, residual in float32 and complex64, timeseries
+    layer_num = 4*ifgram_num + 2*date_num
+    if method in ['WLS','L1']:
+        # weight, residual and normal matrix / cholesky factor in float64 for each pixel
+        layer_num += 2*ifgram_num + 4*(date_num-1)**2
+    elif method == 'L2_sparse':
+        # right-hand side and solution of normal equations in float64
+        layer_num += 4*date_num
+    if timeseriesStd:
+        layer_num += date_num
+    box_list = split_row_box(length, width, layer_num, memory_limit/num_cores, num_cores)
+    phase2range = -1*float(atr['WAVELENGTH'])/(4.*np.pi)
+    box_num = len(box_list)
+    prog_bar = ptime.progress_bar(maxValue=box_num, prefix='calculating: ')
+    for i in range(0, box_num, num_cores):
+        box_sublist = box_list[i:i+num_cores]
+        if enable_parallel:
+            out_list = Parallel(n_jobs=num_cores)(delayed(ifgram_inversion_patch)(ifgramFile, ifgram_list, box, inv_dict)\
+                                                  for box in box_sublist)
+        else:
+            out_list = [ifgram_inversion_patch(ifgramFile, ifgram_list, box, inv_dict) for box in box_sublist]
+
+        for box, out in zip(box_sublist, out_list):
+            box_shape = (box[3]-box[1], box[2]-box[0])
+            ts = out['timeseries'] * phase2range
+            for j in range(date_num):
+                group[date8_list[j]][box[1]:box[3], box[0]:box[2]] = ts[j].reshape(box_shape)
+            if timeseriesStd:
+                ts_std = out['timeseriesStd'] * abs(phase2range)
+                for j in range(date_num):
+                    group_std[date8_list[j]][box[1]:box[3], box[0]:box[2]] = ts_std[j].reshape(box_shape)
+            for key, h5aux in h5aux_dict.items():
+                k = aux_file_dict[key][1]
+                h5aux[k].get(k)[box[1]:box[3], box[0]:box[2]] = out[key].reshape(box_shape)
+        prog_bar.update(i+len(box_sublist), suffix='rows %d-%d' % (box_sublist[0][1], box_sublist[-1][3]))
     prog_bar.close()
+    del out_list
 
     ## Attributes
     print('calculating perpendicular baseline timeseries')
-    pbase, pbase_top, pbase_bottom = perp_baseline_ifgram2timeseries(ifgramFile, ifgram_list)
-    # convert np.array into string with each item separated by white space
-    pbase = str(pbase.tolist()).translate(None,'[],')
-    pbase_top = str(pbase_top.tolist()).translate(None,'[],')
-    pbase_bottom = str(pbase_bottom.tolist()).translate(None,'[],')
-    atr['P_BASELINE_TIMESERIES'] = pbase
-    atr['P_BASELINE_TOP_TIMESERIES'] = pbase_top
-    atr['P_BASELINE_BOTTOM_TIMESERIES'] = pbase_bottom
+    atr.update(perp_baseline_attribute(ifgramFile, ifgram_list))
     atr['ref_date'] = date8_list[0]
+    # network of L2 inversion, for update with new acquisitions by timeseries_inversion_incremental()
+    if method == 'L2':
+        atr['NETWORK_MD5'] = network_md5(date12_list)
+    else:
+        atr.pop('NETWORK_MD5', None)
     for key,value in atr.items():
         group.attrs[key] = value
     h5timeseries.close()
+    if timeseriesStd:
+        for key,value in atr.items():
+            group_std.attrs[key] = value
+        group_std.attrs['FILE_TYPE'] = 'timeseries'
+        group_std.attrs['UNIT'] = 'm'
+        h5std.close()
+    # close auxiliary files after timeseries file, so that they are not older than it
+    for h5aux in h5aux_dict.values():
+        h5aux.close()
     print('Time series inversion took ' + str(time.time()-total) +' secs\nDone.')
     return timeseriesFile
 
     
+def timeseries_inversion_incremental(ifgramFile, timeseriesFile, memory_limit=4.0):
+    '''Update existing timeseries file with interferograms of new acquisitions, using L2 norm minimization,
+    with the same result as timeseries_inversion() with L2 method on the whole network,
+    but reading only the existing timeseries and the new interferograms.
+
+    Interferograms involving acquisitions not in the existing timeseriesFile are taken as new.
+    Any L2 solution ts_old of the previous network satisfies its normal equations: A_old^T*A_old * ts_old
+    = A_old^T*d_old, thus the right-hand side of the normal equations of the updated network is a rank-k
+    update with k new interferograms: A^T*d = A_old^T*A_old * ts_old + A_new^T*d_new. It is solved with
+    the cached (B^T*B)^-1 of the updated network, as in the velocity parameterization of the full inversion:
+        ts[1:] = T * (B^T*B)^-1 * T^T * A^T*d,  with T as the cumulative sum of dt, B = A*T
+    All acquisitions are updated, and new acquisitions are appended into timeseriesFile.
+    Temporal coherence is re-calculated into temporalCoherence.h5 in the same directory as timeseriesFile.
+
+    The whole network is re-inverted with timeseries_inversion() instead, if timeseriesFile is not
+    the L2 inversion of the previous network, i.e. the NETWORK_MD5 attribute written by timeseries_inversion()
+    does not match after network modification among existing acquisitions, or for timeseriesFile in cube layout.
+
+    Usage:
+    timeseries_inversion_incremental(ifgramFile, timeseriesFile, memory_limit=4.0)
+      ifgramFile     : hdf5 file with the interferograms 
+      timeseriesFile : hdf5 file with the output from previous inversion, to be updated
+      memory_limit   : float, max memory size in GB used for one box
+    '''
+    total = time.time()
+
+    # Basic Info
+    atr = readfile.read_attribute(ifgramFile)
+    atr_ts = readfile.read_attribute(timeseriesFile)
+    length = int(atr['FILE_LENGTH'])
+    width  = int(atr['WIDTH'])
+    ref_x = int(atr['ref_x'])
+    ref_y = int(atr['ref_y'])
+
+    h5ifgram = h5py.File(ifgramFile,'r')
+    ifgram_list = readfile.read_epoch_list(h5ifgram, 'interferograms')
+    ifgram_list = check_drop_ifgram(h5ifgram, atr, ifgram_list)
+    date12_list = ptime.list_ifgram2date12(ifgram_list)
+    m_dates = [i.split('-')[0] for i in date12_list]
+    s_dates = [i.split('-')[1] for i in date12_list]
+    date8_list = ptime.yyyymmdd(sorted(list(set(m_dates + s_dates))))
+    date_num = len(date8_list)
+
+    readfile.close_pooled_hdf5(timeseriesFile)
+    h5timeseries = h5py.File(timeseriesFile,'r')
+    is_cube = readfile.is_cube_file(h5timeseries, 'timeseries')
+    date8_list_old = readfile.read_epoch_list(h5timeseries, 'timeseries')
+    h5timeseries.close()
+
+    # New interferograms and acquisitions
+    date8_list_new = sorted(list(set(date8_list) - set(date8_list_old)))
+    if not date8_list_new:
+        print('No new acquisition found in '+ifgramFile+', '+timeseriesFile+' is up to date.')
+        h5ifgram.close()
+        return timeseriesFile
+    idx_new = [i for i in range(len(date12_list)) if any(d in date8_list_new for d in ptime.yyyymmdd(date12_list[i].split('-')))]
+    idx_old = sorted(list(set(range(len(date12_list))) - set(idx_new)))
+
+    # Check the existing timeseries is the L2 inversion of the previous network
+    msg = None
+    if is_cube:
+        msg = timeseriesFile+' is in cube layout'
+    elif any(atr.get(key) != atr_ts.get(key) for key in ['ref_x','ref_y']):
+        msg = 'different reference pixel between %s and %s' % (ifgramFile, timeseriesFile)
+    elif atr_ts.get('NETWORK_MD5') != network_md5([date12_list[i] for i in idx_old]):
+        msg = timeseriesFile+' is not the L2 inversion of the interferograms of existing acquisitions'
+    elif not set(date8_list_old) <= set(date8_list):
+        msg = 'acquisitions in '+timeseriesFile+' not found in '+ifgramFile
+    if msg:
+        print(msg+', re-inverse the whole network.')
+        h5ifgram.close()
+        return timeseries_inversion(ifgramFile, timeseriesFile, memory_limit)
+
+    ifgram_list_new = [ifgram_list[i] for i in idx_new]
+    print('number of new acquisitions      : '+str(len(date8_list_new)))
+    print('number of new interferograms    : '+str(len(ifgram_list_new)))
+    print('number of existing acquisitions : '+str(len(date8_list_old)))
+
+    # Rank-k update of normal equations, solved in the velocity parameterization with cached (B^T*B)^-1
+    inv_mat = design_matrix_factorization(date12_list)
+    A = inv_mat['A']
+    tbase_list = ptime.date_list2tbase(date8_list)[0]
+    dt = np.diff(tbase_list)
+    T = np.tril(np.ones((date_num-1, date_num-1))) * dt.reshape(1,-1)
+    M = np.dot(np.dot(T, inv_mat['BtB_inv']), T.T)
+    # columns of existing acquisitions in A, displacement of the 1st existing acquisition is zero
+    col_old = [date8_list.index(d)-1 for d in date8_list_old[1:]]
+    A_old = A[idx_old, :]
+    P_old = np.array(np.dot(M, np.dot(A_old.T, A_old[:, col_old])), np.float32)
+    P_new = np.array(np.dot(M, A[idx_new, :].T), np.float32)
+
+    ref_value = read_ifgram_box(h5ifgram, ifgram_list_new, (ref_x, ref_y, ref_x+1, ref_y+1)).flatten()
+
+    ##### Output: append new acquisitions
+    print('updating >>> '+timeseriesFile)
+    h5timeseries = h5py.File(timeseriesFile,'r+')
+    group = h5timeseries['timeseries']
+    for date in date8_list_new:
+        group.create_dataset(date, shape=(length, width), dtype=np.float32, chunks=True, **writefile.compression_kwargs())
+
+    ##### Inversion box by box
+    print('Inversing time series ...')
+    box_list = split_row_box(length, width, len(date8_list_old)+len(ifgram_list_new)+2*date_num, memory_limit)
+    phase2range = -1*float(atr['WAVELENGTH'])/(4.*np.pi)
+    box_num = len(box_list)
+    prog_bar = ptime.progress_bar(maxValue=box_num, prefix='calculating: ')
+    for i in range(box_num):
+        box = box_list[i]
+        box_shape = (box[3]-box[1], box[2]-box[0])
+        ts_old = np.array(readfile.read_epoch_box(h5timeseries, 'timeseries', date8_list_old[1:], box)\
+                          .reshape(len(date8_list_old)-1, -1), np.float32) / phase2range
+        data = read_ifgram_box(h5ifgram, ifgram_list_new, box, ref_value)
+        ts = np.zeros((date_num, data.shape[1]), np.float32)
+        ts[1:, :] = (np.dot(P_old, ts_old) + np.dot(P_new, data)) * phase2range
+        for j in range(date_num):
+            group[date8_list[j]][box[1]:box[3], box[0]:box[2]] = ts[j].reshape(box_shape)
+        prog_bar.update(i+1, suffix='rows %d-%d' % (box[1], box[3]))
+    prog_bar.close()
+    h5ifgram.close()
+
+    ## Attributes
+    print('calculating perpendicular baseline timeseries')
+    for key, value in perp_baseline_attribute(ifgramFile, ifgram_list).items():
+        group.attrs[key] = value
+    group.attrs['ref_date'] = date8_list[0]
+    group.attrs['NETWORK_MD5'] = network_md5(date12_list)
+    h5timeseries.close()
+    readfile.invalidate_attribute_cache(timeseriesFile)
+
+    # Temporal coherence of the updated timeseries with all interferograms
+    import temporal_coherence as tcoh
+    temp_coh = tcoh.temporal_coherence(timeseriesFile, ifgramFile, memory_limit)
+    tempCohFile = os.path.join(os.path.dirname(timeseriesFile), 'temporalCoherence.h5')
+    print('writing >>> '+tempCohFile)
+    atr_coh = readfile.read_attribute(timeseriesFile)
+    atr_coh['FILE_TYPE'] = 'temporal_coherence'
+    atr_coh['UNIT'] = '1'
+    writefile.write(temp_coh, atr_coh, tempCohFile)
+    print('Time series update took ' + str(time.time()-total) +' secs\nDone.')
+    return timeseriesFile
+
+
 ###################################################
 def timeseries_inversion_FGLS(h5flat,h5timeseries):
     '''Implementation of the SBAS algorithm.
@@ -1780,108 +2454,22 @@ def timeseries_inversion_FGLS(h5flat,h5timeseries):
     
     for date in dateList:
         if not date in h5timeseries['timeseries']:
-            dset = group.create_dataset(date, data=timeseries[dateIndex[date]], compression='gzip')
+            dset = group.create_dataset(date, data=timeseries[dateIndex[date]], **writefile.compression_kwargs())
     print('Time series inversion took ' + str(time.time()-total) +' secs')
 
 
 
-def timeseries_inversion_L1(h5flat,h5timeseries):
-    try:
-        from .l1 import l1
-        from cvxopt import normal,matrix
-    except:
-        print('-----------------------------------------------------------------------')
-        print('cvxopt should be installed to be able to use the L1 norm minimization.')
-        print('-----------------------------------------------------------------------')
-        sys.exit(1)
-        #modified from sbas.py written by scott baker, 2012 
-  
-    
-    total = time.time()
-    A,B = design_matrix(h5flat)
-    tbase,dateList,dateDict,dateDict2 = date_list(h5flat)
-    dt = np.diff(tbase)
-    BL1 = matrix(B)
-    B1 = np.linalg.pinv(B)
-    B1 = np.array(B1,np.float32)
-    ifgram_list = list(h5flat['interferograms'].keys())
-    ifgram_num = len(ifgram_list)
-    #dset = h5flat[ifgram_list[0]].get(h5flat[ifgram_list[0]].keys()[0])
-    #data = dset[0:dset.shape[0],0:dset.shape[1]]
-    dset=h5flat['interferograms'][ifgram_list[0]].get(ifgram_list[0]) 
-    data = dset[0:dset.shape[0],0:dset.shape[1]] 
-    pixel_num = np.shape(data)[0]*np.shape(data)[1]
-    print('Reading in the interferograms')
-    print(ifgram_num,pixel_num)
-  
-    #data = np.zeros((ifgram_num,pixel_num),np.float32)
-    data = np.zeros((ifgram_num,pixel_num))
-    for ni in range(ifgram_num):
-        dset=h5flat['interferograms'][ifgram_list[ni]].get(ifgram_list[ni])
-        #dset = h5flat[ifgram_list[ni]].get(h5flat[ifgram_list[ni]].keys()[0])
-        d = dset[0:dset.shape[0],0:dset.shape[1]]
-        #print np.shape(d)
-    
-        data[ni] = d.flatten(1)
-    del d
-    dataPoint = np.zeros((ifgram_num,1),np.float32)
-    modelDimension = np.shape(B)[1]
-    tempDeformation = np.zeros((date_num,pixel_num),np.float32)
-    print(data.shape)
-    DataL1=matrix(data)
-    L1ORL2=np.ones((pixel_num,1))
-    for ni in range(pixel_num):
-        print(ni)
-        dataPoint = data[:,ni]
-        nan_ndx = dataPoint == 0.
-        fin_ndx = dataPoint != 0.
-        nan_fin = dataPoint.copy()
-        nan_fin[nan_ndx] = 1
-        if not nan_fin.sum() == len(nan_fin):
-          
-            B1tmp = np.dot(B1,np.diag(fin_ndx))
-            #tmpe_ratea = np.dot(B1tmp,dataPoint)
-            try:
-                tmpe_ratea=np.array(l1(BL1,DataL1[:,ni]))
-                zero = np.array([0.],np.float32)
-                defo = np.concatenate((zero,np.cumsum([tmpe_ratea[:,0]*dt])))
-            except:
-                tmpe_ratea = np.dot(B1tmp,dataPoint)
-                L1ORL2[ni]=0      
-                zero = np.array([0.],np.float32)
-                defo = np.concatenate((zero,np.cumsum([tmpe_ratea*dt])))
-    
-            tempDeformation[:,ni] = defo
-        if not np.remainder(ni,10000): print('Processing point: %7d of %7d ' % (ni,pixel_num))
-    del data
-    timeseries = np.zeros((date_num,np.shape(dset)[0],np.shape(dset)[1]),np.float32)
-    factor = -1*float(h5flat['interferograms'][ifgram_list[0]].attrs['WAVELENGTH'])/(4.*np.pi)
-    for ni in range(date_num):
-        timeseries[ni] = tempDeformation[ni].reshape(np.shape(dset)[1],np.shape(dset)[0]).T
-        timeseries[ni] = timeseries[ni]*factor
-    del tempDeformation
-    L1ORL2=np.reshape(L1ORL2,(np.shape(dset)[1],np.shape(dset)[0])).T
-    
-    timeseriesDict = {}
-    for key, value in h5flat['interferograms'][ifgram_list[0]].attrs.items():
-            timeseriesDict[key] = value
-  
-    dateIndex={}
-    for ni in range(len(dateList)):
-        dateIndex[dateList[ni]]=ni
-    if not 'timeseries' in h5timeseries:
-        group = h5timeseries.create_group('timeseries')
-        for key,value in timeseriesDict.items():
-            group.attrs[key] = value
-  
-    for date in dateList:
-        if not date in h5timeseries['timeseries']:
-            dset = group.create_dataset(date, data=timeseries[dateIndex[date]], compression='gzip')
-    print('Time series inversion took ' + str(time.time()-total) +' secs')
-    L1orL2h5=h5py.File('L1orL2.h5','w')
-    gr=L1orL2h5.create_group('mask') 
-    dset=gr.create_dataset('mask',data=L1ORL2,compression='gzip')
-    L1orL2h5.close()
+def perp_baseline_attribute(ifgramFile, ifgram_list=[]):
+    '''Get P_BASELINE_TIMESERIES/TOP/BOTTOM attributes from input interferograms file
+    Output:
+        atr - dict, with np.array converted into string with each item separated by white space
+    '''
+    pbase, pbase_top, pbase_bottom = perp_baseline_ifgram2timeseries(ifgramFile, ifgram_list)
+    atr = dict()
+    atr['P_BASELINE_TIMESERIES'] = ' '.join(str(i) for i in pbase.tolist())
+    atr['P_BASELINE_TOP_TIMESERIES'] = ' '.join(str(i) for i in pbase_top.tolist())
+    atr['P_BASELINE_BOTTOM_TIMESERIES'] = ' '.join(str(i) for i in pbase_bottom.tolist())
+    return atr
 
 
 def perp_baseline_ifgram2timeseries(ifgramFile, ifgram_list=[]):
@@ -1899,15 +2487,15 @@ def perp_baseline_ifgram2timeseries(ifgramFile, ifgram_list=[]):
     h5file = h5py.File(ifgramFile,'r')
 
     if not ifgram_list:
-        ifgram_list = sorted(h5file[k].keys())
+        ifgram_list = readfile.read_epoch_list(h5file, k)
 
     # P_BASELINE of all interferograms
     pbase_ifgram = []
     pbase_top_ifgram = []
     pbase_bottom_ifgram = []
-    for ifgram in ifgram_list:
-        pbase_top    = float(h5file[k][ifgram].attrs['P_BASELINE_TOP_HDR'])
-        pbase_bottom = float(h5file[k][ifgram].attrs['P_BASELINE_BOTTOM_HDR'])
+    for atr_ifgram in readfile.read_epoch_attribute_list(h5file, k, ifgram_list):
+        pbase_top    = float(atr_ifgram['P_BASELINE_TOP_HDR'])
+        pbase_bottom = float(atr_ifgram['P_BASELINE_BOTTOM_HDR'])
         pbase_ifgram.append((pbase_bottom+pbase_top)/2.0)
         pbase_top_ifgram.append(pbase_top)
         pbase_bottom_ifgram.append(pbase_bottom)
@@ -1921,8 +2509,7 @@ def perp_baseline_ifgram2timeseries(ifgramFile, ifgram_list=[]):
     tbase_list = ptime.date_list2tbase(date8_list)[0]
     tbase_v = np.diff(tbase_list)
 
-    A,B = design_matrix(ifgramFile, date12_list)
-    B_inv = np.linalg.pinv(B)
+    B_inv = design_matrix_factorization(date12_list, print_msg=False)['B_inv']
 
     pbase_rate        = np.dot(B_inv, pbase_ifgram)
     pbase_top_rate    = np.dot(B_inv, pbase_top_ifgram)
@@ -2070,52 +2657,54 @@ def make_triangle(dates12,igram1,igram2,igram3):
     return Igramtriangle,IgramtriangleIndexes
 
 def get_triangles(h5file):
+    '''Get all triangles (closure loops of 3 interferograms) of the network in input file.
+    Triangles are enumerated on the network graph, with dates as nodes and interferograms as edges:
+    for each interferogram d1-d2, any date d3 connected with both d1 and d2 (d1-d3 and d2-d3) makes a triangle.
+    Input:
+        h5file - HDF5 file object of multi_group file, i.e. interferograms
+    Outputs:
+        curls     - 2D np.array of int in size of (triangle_num, 3), index of d1-d2, d1-d3, d2-d3 interferograms
+        Triangles - list of list of 3 string, date12 of d1-d2, d1-d3 and d2-d3 interferograms
+        C         - scipy.sparse.csr_matrix in size of (triangle_num, ifgram_num), closure matrix,
+                    with closure phase = d1-d2 + d2-d3 - d1-d3
+    '''
     k=list(h5file.keys())
     igramList=list(h5file[k[0]].keys())
    
     dates12=[]
     for igram in igramList:
         dates12.append(h5file[k[0]][igram].attrs['DATE12'])
+
+    # date12 to index, and adjacency of each master date: {slave date: index}, for the 1st occurrence
+    date12_idx = dict()
+    adjacency = collections.OrderedDict()
+    for i in range(len(dates12)):
+        m_date, s_date = dates12[i].split('-')
+        date12_idx.setdefault(dates12[i], i)
+        adjacency.setdefault(m_date, collections.OrderedDict()).setdefault(s_date, i)
+
     Triangles=[]
     Triangles_indexes=[]
+    triangle_set = set()
     for igram1 in dates12:
-        igram1_date1=igram1.split('-')[0]
-        igram1_date2=igram1.split('-')[1]
-  
-        igram2=[]
-        igram2_date2=[]
-        for d in dates12:
-            if igram1_date2==d.split('-')[0]:
-                igram2.append(d)
-                igram2_date2.append(d.split('-')[1])
-
-        igram3=[]
-        igram3_date2=[]
-        for d in dates12:
-            if igram1_date1==d.split('-')[0] and d != igram1:
-                igram3.append(d)
-                igram3_date2.append(d.split('-')[1])
-  
-        for date in  igram2_date2:
-            if date in igram3_date2:
-                Igramtriangle,IgramtriangleIndexes = make_triangle(dates12,igram1,igram2[igram2_date2.index(date)],\
-                                                                                  igram3[igram3_date2.index(date)])
-                if not Igramtriangle in Triangles:
+        igram1_date1, igram1_date2 = igram1.split('-')
+        adj1 = adjacency[igram1_date1]
+        for date in adjacency.get(igram1_date2, dict()).keys():
+            if date in adj1:
+                dates = sorted([yymmdd2YYYYMMDD(d)[2:] for d in [igram1_date1, igram1_date2, date]])
+                Igramtriangle = [dates[0]+'-'+dates[1], dates[0]+'-'+dates[2], dates[1]+'-'+dates[2]]
+                if tuple(Igramtriangle) not in triangle_set:
+                    triangle_set.add(tuple(Igramtriangle))
                     Triangles.append(Igramtriangle)
-                    Triangles_indexes.append(IgramtriangleIndexes)
-  
-    numTriangles = np.shape(Triangles_indexes)[0]
-    curls=np.zeros([numTriangles,3],dtype=np.int)
-    for i in range(numTriangles):
-        curls[i][:]=Triangles_indexes[i]
- 
+                    Triangles_indexes.append([date12_idx[i] for i in Igramtriangle])
+
+    numTriangles = len(Triangles_indexes)
+    curls = np.array(Triangles_indexes, dtype=int).reshape(numTriangles, 3)
+
     numIgrams=len(igramList)
-    C=np.zeros([numTriangles,numIgrams])
-    for ni in range(numTriangles):
-        C[ni][curls[ni][0]]=1
-        C[ni][curls[ni][1]]=-1
-        C[ni][curls[ni][2]]=1
- 
+    row = np.repeat(np.arange(numTriangles), 3)
+    value = np.tile(np.array([1., -1., 1.]), numTriangles)
+    C = sparse.csr_matrix((value, (row, curls.flatten())), shape=(numTriangles, numIgrams))
     return curls,Triangles,C
 
 
@@ -2136,7 +2725,7 @@ def generate_curls(curlfile, h5file, Triangles, curls):
 
         triangle_date = Triangles[i][0]+'_'+Triangles[i][1]+'_'+Triangles[i][2]
         group = gg.create_group(triangle_date)
-        dset = group.create_dataset(triangle_date, data=d1+d3-d2, compression='gzip')
+        dset = group.create_dataset(triangle_date, data=d1+d3-d2, **writefile.compression_kwargs())
         for key, value in h5file['interferograms'][ifgram1].attrs.items():
             group.attrs[key] = value
         prog_bar.update(i+1)
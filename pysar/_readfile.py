@@ -32,6 +32,9 @@
 import os
 import sys
 import re
+import collections
+import contextlib
+import atexit
 
 import h5py
 import numpy as np
@@ -53,6 +56,262 @@ multi_group_hdf5_file=['interferograms','coherence','wrapped','snaphu_connect_co
 multi_dataset_hdf5_file=['timeseries']
 single_dataset_hdf5_file=['dem','mask','rmse','temporal_coherence', 'velocity']
 
+'''Two layouts of multi_group / multi_dataset HDF5 files in PySAR
+stack: one 2D dataset per epoch (default), i.e. timeseries/20100102, interferograms/100102-100307/100102-100307
+cube : one 3D dataset in size of (epoch_num, length, width) with the same name as the file type,
+       chunked for both image and pixel time-series access, and epoch metadata in side arrays:
+       timeseries    : date       - string array of dates in YYYYMMDD
+       interferograms: epoch      - string array of group names of the stack layout
+                       date12     - string array of DATE12
+                       attributes - string array of attributes (in json) specific to each epoch,
+                                    with common attributes in the group attributes
+'''
+cube_epoch_dset = {'timeseries':'date'}
+
+
+#########################################################################
+def is_cube_file(h5file, k=None):
+    '''Check whether the data in the opened HDF5 file is in cube layout'''
+    if not k:
+        k = [i for i in h5file.keys() if i in multi_group_hdf5_file+multi_dataset_hdf5_file]
+        if not k:
+            return False
+        k = k[0]
+    return k in multi_group_hdf5_file+multi_dataset_hdf5_file and isinstance(h5file[k].get(k), h5py.Dataset)
+
+
+def read_string_array(dset):
+    '''Read HDF5 dataset of fixed-length string into list of string'''
+    return [str(i.decode('utf-8')) if isinstance(i, bytes) else str(i) for i in dset[:]]
+
+
+def read_cube_attribute(h5file, k, epoch=None):
+    '''Read attributes of one epoch from HDF5 file in cube layout,
+    as common attributes of the group + attributes specific to the epoch.
+    Inputs:
+        h5file - HDF5 file object in cube layout
+        k      - string, file type, i.e. timeseries, interferograms
+        epoch  - string, epoch to read, the 1st epoch if not found
+    Output:
+        atr    - dict, attributes of the epoch
+    '''
+    atr = dict()
+    for key, value in h5file[k].attrs.items():
+        atr[key] = str(value)
+    if 'attributes' in h5file[k]:
+        idx = 0
+        if epoch:
+            epoch_list = read_epoch_list(h5file, k)
+            try:    idx = [i for i in range(len(epoch_list)) if epoch in epoch_list[i]][0]
+            except: idx = 0
+        atr.update(json.loads(read_string_array(h5file[k].get('attributes'))[idx]))
+    return atr
+
+
+def read_cube_attribute_list(h5file, k):
+    '''Read attributes of all epochs from HDF5 file in cube layout at once, in the order of read_epoch_list()
+    Inputs:
+        h5file - HDF5 file object in cube layout
+        k      - string, file type, i.e. timeseries, interferograms
+    Output:
+        atr_list - list of dict, attributes of each epoch
+    '''
+    atr = dict()
+    for key, value in h5file[k].attrs.items():
+        atr[key] = str(value)
+    epoch_num = h5file[k].get(k).shape[0]
+    if 'attributes' not in h5file[k]:
+        return [dict(atr) for i in range(epoch_num)]
+
+    atr_list = []
+    for epoch_atr in read_string_array(h5file[k].get('attributes')):
+        atr_epoch = dict(atr)
+        atr_epoch.update(json.loads(epoch_atr))
+        atr_list.append(atr_epoch)
+    return atr_list
+
+
+def read_epoch_list(h5file, k):
+    '''Get list of epochs, i.e. dates or interferogram names, in either stack or cube layout.
+    Inputs:
+        h5file - HDF5 file object
+        k      - string, file type, i.e. timeseries, interferograms
+    Output:
+        epoch_list - list of string, sorted
+    '''
+    if is_cube_file(h5file, k):
+        return read_string_array(h5file[k].get(cube_epoch_dset.get(k, 'epoch')))
+    return sorted(h5file[k].keys())
+
+
+def read_epoch_attribute_list(h5file, k, epoch_list):
+    '''Read attributes of input epochs, in either stack or cube layout.
+    Inputs:
+        h5file     - HDF5 file object
+        k          - string, file type, i.e. timeseries, interferograms
+        epoch_list - list of string, epochs to read, as in read_epoch_list()
+    Output:
+        atr_list   - list of dict, attributes of each epoch
+    '''
+    if is_cube_file(h5file, k):
+        epoch_list_all = read_epoch_list(h5file, k)
+        atr_list_all = read_cube_attribute_list(h5file, k)
+        return [atr_list_all[epoch_list_all.index(i)] for i in epoch_list]
+
+    atr_list = []
+    for epoch in epoch_list:
+        if k in multi_dataset_hdf5_file:
+            attrs = h5file[k].attrs
+        else:
+            attrs = h5file[k][epoch].attrs
+        atr_list.append(dict((key, str(value)) for key, value in attrs.items()))
+    return atr_list
+
+
+def read_epoch_box(h5file, k, epoch_list, box=None):
+    '''Read data of input epochs within the box, in either stack or cube layout,
+    i.e. one box of interferograms for network inversion, or time-series of one pixel with box of 1x1.
+    Inputs:
+        h5file     - HDF5 file object
+        k          - string, file type, i.e. timeseries, interferograms
+        epoch_list - list of string, epochs to read, as in read_epoch_list()
+        box        - 4-tuple of int, area to read, defined in (x0, y0, x1, y1), None for the whole area
+    Output:
+        data       - 3D np.array in size of (epoch_num, box_length, box_width)
+    Example:
+        data = read_epoch_box(h5, 'interferograms', ifgram_list, (0, 100, width, 200))
+        dis_ts = read_epoch_box(h5, 'timeseries', date_list, (x, y, x+1, y+1)).flatten()
+    '''
+    if box:
+        row_slice, col_slice = slice(box[1], box[3]), slice(box[0], box[2])
+    else:
+        row_slice, col_slice = slice(None), slice(None)
+
+    if is_cube_file(h5file, k):
+        dset = h5file[k].get(k)
+        epoch_list_all = read_epoch_list(h5file, k)
+        idx = np.array([epoch_list_all.index(i) for i in epoch_list], dtype=int)
+        if idx.size == 0:
+            return dset[0:0, row_slice, col_slice]
+        # h5py requires increasing indices: read unique epochs in order, then map back to the input order
+        idx_uniq, idx_inv = np.unique(idx, return_inverse=True)
+        if idx_uniq[-1] - idx_uniq[0] + 1 == idx_uniq.size:
+            data = dset[idx_uniq[0]:idx_uniq[-1]+1, row_slice, col_slice]
+        else:
+            data = dset[idx_uniq.tolist(), row_slice, col_slice]
+        if not np.array_equal(idx_inv, np.arange(idx.size)):
+            data = data[idx_inv]
+        return data
+
+    data = None
+    for i in range(len(epoch_list)):
+        epoch = epoch_list[i]
+        if k in multi_dataset_hdf5_file:
+            dset = h5file[k].get(epoch)
+        else:
+            dset = h5file[k][epoch].get(epoch)
+        d = dset[row_slice, col_slice]
+        if data is None:
+            data = np.zeros((len(epoch_list),)+d.shape, d.dtype)
+        data[i] = d
+    if data is None:
+        data = np.zeros((0, 0, 0), np.float32)
+    return data
+
+
+#########################################################################
+'''Pool of read-only HDF5 file handles, for repeated access on the same file, i.e. plot/read epoch by epoch
+or pixel by pixel, to save the time of re-opening file and to re-use its chunk cache.
+Handles are kept open until evicted (least recently used, up to h5_handle_pool_size files),
+or closed by close_pooled_hdf5(); modified file is re-opened automatically.
+For read-only viewers (view.py, tsviewer.py) and scoped reading with pooled_hdf5() only: an open handle blocks
+h5py.File(File,'w') on the same file in the same process, so close it explicitly once done, instead of atexit.
+
+Recommend usage:
+h5 = readfile.open_pooled_hdf5('timeseries.h5')             # keep open for later use, i.e. in viewer
+readfile.close_pooled_hdf5('timeseries.h5')                 # close once done
+with readfile.pooled_hdf5('timeseries.h5') as h5:           # close at exit if not pooled before
+    data = readfile.read('timeseries.h5', epoch='20101120')  # re-use the pooled handle
+'''
+h5_handle_pool = collections.OrderedDict()
+h5_handle_pool_size = 16
+h5_chunk_cache_size = 64*1024**2
+
+
+def hdf5_file_stamp(File):
+    '''Modification time and size of file, to detect file changed after opened'''
+    stat = os.stat(File)
+    return (stat.st_mtime, stat.st_size)
+
+
+def find_pooled_hdf5(File):
+    '''Return the pooled handle of input HDF5 file if opened and not modified, None otherwise.'''
+    fpath = os.path.abspath(File)
+    if fpath not in h5_handle_pool:
+        return None
+    stamp, h5 = h5_handle_pool.pop(fpath)
+    try:
+        valid = h5.id.valid and stamp == hdf5_file_stamp(File)
+    except OSError:
+        valid = False
+    if valid:
+        h5_handle_pool[fpath] = (stamp, h5)
+        return h5
+    try:    h5.close()
+    except: pass
+    return None
+
+
+def open_pooled_hdf5(File):
+    '''Open HDF5 file in read-only mode through the handle pool.
+    Input  : string, HDF5 file name
+    Output : HDF5 file object, do NOT close it, use close_pooled_hdf5() instead
+    '''
+    h5 = find_pooled_hdf5(File)
+    if h5:
+        return h5
+
+    stamp = hdf5_file_stamp(File)
+    try:
+        h5 = h5py.File(File, 'r', rdcc_nbytes=h5_chunk_cache_size)
+    except TypeError:
+        # h5py < 2.9 does not support chunk cache setting
+        h5 = h5py.File(File, 'r')
+    h5_handle_pool[os.path.abspath(File)] = (stamp, h5)
+    while len(h5_handle_pool) > h5_handle_pool_size:
+        h5_handle_pool.popitem(last=False)[1][1].close()
+    return h5
+
+
+def close_pooled_hdf5(File=None):
+    '''Close the pooled handle of input file, close all pooled handles if no file is input.'''
+    if not File:
+        fpaths = list(h5_handle_pool.keys())
+    else:
+        fpaths = [os.path.abspath(File)]
+    for fpath in fpaths:
+        if fpath in h5_handle_pool:
+            try:    h5_handle_pool.pop(fpath)[1].close()
+            except: pass
+    return
+
+
+@contextlib.contextmanager
+def pooled_hdf5(File):
+    '''Context manager of pooled read-only HDF5 file handle, to re-use it by all reading within the context.
+    The handle is closed at exit, unless it's already pooled before entering.
+    '''
+    pooled = find_pooled_hdf5(File) is not None
+    h5 = open_pooled_hdf5(File)
+    try:
+        yield h5
+    finally:
+        if not pooled:
+            close_pooled_hdf5(File)
+
+
+atexit.register(close_pooled_hdf5)
+
 
 #########################################################################
 def read(File, box=(), epoch=None):
@@ -102,12 +361,16 @@ def read(File, box=(), epoch=None):
 
     ##### HDF5
     if ext in ['.h5','.he5']:
-        h5file = h5py.File(File,'r')
+        # re-use the pooled handle if opened already
+        h5file = find_pooled_hdf5(File)
+        pooled = h5file is not None
+        if not pooled:
+            h5file = h5py.File(File,'r')
 
         # Read Dataset
         if k in multi_group_hdf5_file+multi_dataset_hdf5_file:
             # Check input epoch exists or not
-            epoch_list = sorted(h5file[k].keys())
+            epoch_list = read_epoch_list(h5file, k)
             try:    epoch2read = [i for i in epoch_list if epoch in i][0]
             except: epoch2read = None
             if not epoch2read:
@@ -116,6 +379,18 @@ def read(File, box=(), epoch=None):
                 print('available epoches: '+str(epoch_list))
                 sys.exit(1)
 
+            elif is_cube_file(h5file, k):
+                # read one slice of the cube
+                dset = h5file[k].get(k)
+                idx = epoch_list.index(epoch2read)
+                if box:
+                    data = dset[idx, box[1]:box[3], box[0]:box[2]]
+                else:
+                    data = dset[idx, :, :]
+                if not pooled:
+                    h5file.close()
+                return data, atr
+
             elif k in multi_dataset_hdf5_file:
                 dset = h5file[k].get(epoch2read)
             else:
@@ -133,7 +408,8 @@ def read(File, box=(), epoch=None):
         else:
             data = dset[:,:]
 
-        h5file.close()
+        if not pooled:
+            h5file.close()
         return data, atr
 
     ##### Image
@@ -151,17 +427,14 @@ def read(File, box=(), epoch=None):
             return pha, atr
 
         elif k in ['.flat','cpx']:
-            amp, data, atr = read_complex_float32(File)
+            amp, data, atr = read_complex_float32(File, box=box)
         elif k in ['.cor','cor']:
-            data, atr = read_real_float32(File)
+            data, atr = read_real_float32(File, box=box)
         elif k in ['.slc']:
-            data, pha, atr = read_complex_float32(File)
+            data, pha, atr = read_complex_float32(File, box=box)
         else:
             print('Un-supported '+processor+' file format: '+ext)
             sys.exit(1)
-
-        if box:
-            data = data[box[1]:box[3],box[0]:box[2]]
         return data, atr
 
     ##### ROI_PAC
@@ -174,21 +447,15 @@ def read(File, box=(), epoch=None):
             return pha, atr
 
         elif ext in ['.dem']:
-            dem,atr = read_real_int16(File)
-            if box:  dem = dem[box[1]:box[3],box[0]:box[2]]
+            dem,atr = read_real_int16(File, box)
             return dem, atr
   
         elif ext in ['.int']:
-            amp, pha, atr = read_complex_float32(File)
-            if box:
-                pha = pha[box[1]:box[3],box[0]:box[2]]
+            amp, pha, atr = read_complex_float32(File, box=box)
             return pha, atr
         elif ext in ['.amp']:
-            masterAmplitude, slaveAmplitude, atr = read_complex_float32(File, real_imag=True)
-            if box:
-                masterAmplitude = masterAmplitude[box[1]:box[3],box[0]:box[2]]
-                slaveAmplitude = slaveAmplitude[box[1]:box[3],box[0]:box[2]]
-            return masterAmplitude, slaveAmplitude, atr
+            data, atr = read_complex_float32(File, real_imag=True, box=box)
+            return data.real, data.imag, atr
         elif ext in ['.flg', '.byt']:
             flag, atr = read_flag(File)
             return flag, atr
@@ -215,13 +482,11 @@ def read(File, box=(), epoch=None):
     ##### Gamma
     elif processor == 'gamma':
         if ext in ['.unw','.cor','.hgt_sim','.dem']:
-            data, atr = read_real_float32(File, byteorder='ieee-be')
-            if box: data = data[box[1]:box[3],box[0]:box[2]]
+            data, atr = read_real_float32(File, byteorder='ieee-be', box=box)
             return data, atr
 
         elif ext in ['.UTM_TO_RDC', '.utm_to_rdc']:
-            data, atr = read_complex_float32(File, byteorder='ieee-be', real_imag=True)
-            if box: data = data[box[1]:box[3],box[0]:box[2]]
+            data, atr = read_complex_float32(File, byteorder='ieee-be', real_imag=True, box=box)
 
             if not epoch:
                 #print 'read range and azimuth from '+File
@@ -237,8 +502,7 @@ def read(File, box=(), epoch=None):
                 sys.exit(1)
 
         elif ext == '.mli':
-            data,atr = read_real_float32(File)
-            if box: data = data[box[1]:box[3],box[0]:box[2]]
+            data,atr = read_real_float32(File, box=box)
             return data, atr
 
         elif ext == '.slc':
@@ -258,17 +522,85 @@ def read(File, box=(), epoch=None):
 
 
 #########################################################################
+attribute_cache = collections.OrderedDict()
+attribute_cache_size = 256
+
+def attribute_cache_key(File, epoch=None):
+    '''Key of attribute cache: absolute path, modification time and size of the file and of the metadata file
+    actually read by read_attribute_file() (.rsc/.par/.xml for binary files), and epoch'''
+    metaFile = read_metadata_file(File)
+    key = [os.path.abspath(File), epoch, metaFile]
+    for fname in [File, metaFile]:
+        try:
+            stat = os.stat(fname)
+            key += [stat.st_mtime, stat.st_size]
+        except (OSError, TypeError):
+            key += [None, None]
+    return tuple(key)
+
+
+def read_metadata_file(File):
+    '''Metadata file to read attributes of binary file from, in order of
+    .rsc for ROI_PAC, .par for GAMMA and .xml for ISCE.
+    Return None for HDF5 file or if no metadata file is found.
+    '''
+    if os.path.splitext(File)[1].lower() in ['.h5','.he5']:
+        return None
+    potentialMetaFileList = [File+'.rsc', File.split('_snap_connect.byt')[0]+'.unw.rsc', File+'.par', File+'.xml']
+    for metaFile in potentialMetaFileList:
+        if os.path.isfile(metaFile):
+            return metaFile
+    return None
+
+
+def invalidate_attribute_cache(File=None):
+    '''Remove attributes of input file (of all epochs) from the cache of read_attribute(),
+    clear the whole cache if no file is input.
+    Called by writers in _writefile and add_attribute automatically.
+    '''
+    if not File:
+        attribute_cache.clear()
+        return
+    fpath = os.path.abspath(File)
+    if fpath.endswith('.rsc'):
+        fpath = fpath[0:-4]
+    for key in list(attribute_cache.keys()):
+        if key[0] == fpath:
+            attribute_cache.pop(key)
+    return
+
+
 def read_attribute(File, epoch=None):
     '''Read attributes of input file into a dictionary
+    Attributes are cached (up to attribute_cache_size items) for repeated call on the same file,
+    with cache key of path, modification time and size of file, thus modified file is re-read automatically.
     Input  : string, file name and epoch (optional)
     Output : dictionary, attributes dictionary
     '''
-    ext = os.path.splitext(File)[1].lower()
     if not os.path.isfile(File):
         print('Input file not existed: '+File)
         print('Current directory: '+os.getcwd())
         sys.exit(1)
 
+    key = attribute_cache_key(File, epoch)
+    if key in attribute_cache:
+        atr = attribute_cache.pop(key)
+    else:
+        atr = read_attribute_file(File, epoch)
+    attribute_cache[key] = atr
+    while len(attribute_cache) > attribute_cache_size:
+        attribute_cache.popitem(last=False)
+    # return a copy, as attributes are usually modified by the caller
+    return dict(atr)
+
+
+def read_attribute_file(File, epoch=None):
+    '''Read attributes of input file into a dictionary, without cache
+    Input  : string, file name and epoch (optional)
+    Output : dictionary, attributes dictionary
+    '''
+    ext = os.path.splitext(File)[1].lower()
+
     ##### PySAR
     if ext in ['.h5','.he5']:
         h5 = h5py.File(File,'r')
@@ -277,7 +609,10 @@ def read_attribute(File, epoch=None):
         elif 'coherence'      in k: k[0] = 'coherence'
         elif 'timeseries'     in k: k[0] = 'timeseries'
 
-        if k[0] in multi_group_hdf5_file:
+        if is_cube_file(h5, k[0]):
+            attrs = read_cube_attribute(h5, k[0], epoch)
+
+        elif k[0] in multi_group_hdf5_file:
             if epoch:
                 # Check input epoch exists or not
                 epoch_list = sorted(h5[k[0]].keys())
@@ -303,21 +638,18 @@ def read_attribute(File, epoch=None):
 
         if k[0] == 'timeseries':
             try:    atr['ref_date']
-            except: atr['ref_date'] = sorted(h5[k[0]].keys())[0]
+            except: atr['ref_date'] = read_epoch_list(h5, k[0])[0]
 
         h5.close()
 
     else:
-        # attribute file list
-        try:
-            potentialRscFileList = [File+'.rsc', File.split('_snap_connect.byt')[0]+'.unw.rsc']
-            rscFile = [rscFile for rscFile in potentialRscFileList if os.path.isfile(rscFile)][0]
-        except:
-            rscFile = None
+        # attribute file, the same one tracked by attribute_cache_key()
+        metaFile = read_metadata_file(File)
+        metaExt = os.path.splitext(metaFile)[1] if metaFile else None
 
         ##### ROI_PAC
-        if rscFile:
-            atr = read_roipac_rsc(rscFile)
+        if metaExt == '.rsc':
+            atr = read_roipac_rsc(metaFile)
             atr['FILE_TYPE'] = ext
             #if 'FILE_TYPE' not in atr.keys():
             #    atr['FILE_TYPE'] = ext
@@ -327,8 +659,8 @@ def read_attribute(File, epoch=None):
                 atr['INSAR_PROCESSOR'] = 'roipac'
 
         ##### GAMMA
-        elif os.path.isfile(File+'.par'):
-            atr = read_gamma_par(File+'.par')
+        elif metaExt == '.par':
+            atr = read_gamma_par(metaFile)
             atr['FILE_TYPE'] = ext
             #if 'FILE_TYPE' not in atr.keys():
             #    atr['FILE_TYPE'] = ext
@@ -338,8 +670,8 @@ def read_attribute(File, epoch=None):
                 atr['INSAR_PROCESSOR'] = 'gamma'
 
         ##### ISCE
-        elif os.path.isfile(File+'.xml'):
-            atr = read_isce_xml(File+'.xml')
+        elif metaExt == '.xml':
+            atr = read_isce_xml(metaFile)
             if 'FILE_TYPE' not in list(atr.keys()):  ## ISCE file extension could be .geo or .rdr - note related with file type
                 atr['FILE_TYPE'] = ext
             atr['PROCESSOR'] = 'isce'
@@ -709,6 +1041,7 @@ def read_float32(File, box=None):
     ......
     
        box  : 4-tuple defining the left, upper, right, and lower pixel coordinate.
+              Only the rows/columns within box are read from disk, through memory map.
     Example:
        a,p,r = read_float32('100102-100403.unw')
        a,p,r = read_float32('100102-100403.unw',(100,1200,500,1500))
@@ -720,9 +1053,10 @@ def read_float32(File, box=None):
     if not box:
         box = [0,0,width,length]
 
-    data = np.fromfile(File,np.float32,box[3]*2*width).reshape(box[3],2*width)
-    amplitude = data[box[1]:box[3],box[0]:box[2]]
-    phase     = data[box[1]:box[3],width+box[0]:width+box[2]]
+    data = np.memmap(File, dtype=np.float32, mode='r', shape=(length, 2*width))
+    amplitude = np.array(data[box[1]:box[3],box[0]:box[2]])
+    phase     = np.array(data[box[1]:box[3],width+box[0]:width+box[2]])
+    del data
 
     #oddindices = np.where(np.arange(length*2)&1)[0]
     #data = np.fromfile(File,np.float32,length*2*width).reshape(length*2,width)
@@ -732,7 +1066,7 @@ def read_float32(File, box=None):
     return amplitude, phase, atr
 
 
-def read_complex_float32(fname, byteorder=None, real_imag=False):
+def read_complex_float32(fname, byteorder=None, real_imag=False, box=None):
     '''Read complex float 32 data matrix, i.e. roi_pac int or slc data.
     old name: read_complex64()
     
@@ -749,47 +1083,61 @@ def read_complex_float32(fname, byteorder=None, real_imag=False):
         real_imag : flag for output format, 
                     0 for amplitude and phase [by default], 
                     non-0 : for real and imagery
+        box       : 4-tuple defining the left, upper, right, and lower pixel coordinate, optional
+                    Only the rows/columns within box are read from disk, through memory map.
     Output:
         data : 2D np.array in complex float32 
     Example:
         amp, phase, atr = read_complex_float32('geo_070603-070721_0048_00018.int')
         data, atr       = read_complex_float32('150707.slc', 1)
+        data, atr       = read_complex_float32('150707.slc', real_imag=True, box=(100,1200,500,1500))
     '''
 
     atr = read_attribute(fname)
     width = int(float(atr['WIDTH']))
     length = int(float(atr['FILE_LENGTH']))
+    if not box:
+        box = [0,0,width,length]
 
     if byteorder in ['big-endian','b','ieee-be']:
-        data = np.fromfile(fname, dtype='>c8').reshape(length, width)
+        dtype = '>c8'
     else:
-        data = np.fromfile(fname, dtype=np.complex64).reshape(length,width)
+        dtype = np.complex64
+    data = np.memmap(fname, dtype=dtype, mode='r', shape=(length, width))
+    data = np.array(data[box[1]:box[3],box[0]:box[2]], dtype=np.complex64)
 
     if not real_imag:
-        amplitude = np.array([np.hypot(  data.real,data.imag)]).reshape(length,width)
-        phase     = np.array([np.arctan2(data.imag,data.real)]).reshape(length,width)
+        amplitude = np.hypot(  data.real,data.imag)
+        phase     = np.arctan2(data.imag,data.real)
         return amplitude, phase, atr
     else:
         return data, atr
 
 
-def read_real_float32(fname, byteorder=None):
+def read_real_float32(fname, byteorder=None, box=None):
     '''Read real float 32 data matrix, i.e. GAMMA .mli file
     Parameters: fname     : str, path, filename to be read
                 byteorder : str, optional, order of reading byte in the file
+                box       : 4-tuple defining the left, upper, right, and lower pixel coordinate, optional
+                            Only the rows/columns within box are read from disk, through memory map.
     Returns: data : 2D np.array, data matrix 
              atr  : dict, attribute dictionary
     Usage: data, atr = read_real_float32('20070603.mli')
            data, atr = read_real_float32('diff_filt_130118-130129_4rlks.unw')
+           data, atr = read_real_float32('diff_filt_130118-130129_4rlks.unw', 'ieee-be', (100,1200,500,1500))
     '''
     atr = read_attribute(fname)
     width = int(float(atr['WIDTH']))
     length = int(float(atr['FILE_LENGTH']))
+    if not box:
+        box = [0,0,width,length]
 
     if byteorder in ['big-endian','b','ieee-be']:
-        data = np.fromfile(fname, dtype='>f4').reshape(length, width)
+        dtype = '>f4'
     else:
-        data = np.fromfile(fname, dtype=np.float32).reshape(length, width)
+        dtype = np.float32
+    data = np.memmap(fname, dtype=dtype, mode='r', shape=(length, width))
+    data = np.array(data[box[1]:box[3],box[0]:box[2]], dtype=np.float32)
     return data, atr
 
 
@@ -801,6 +1149,7 @@ def read_complex_int16(File, box=None, real_imag=False):
     Inputs:
        file: complex data matrix (cpx_int16)
        box: 4-tuple defining the left, upper, right, and lower pixel coordinate.
+            Only the rows/columns within box are read from disk, through memory map.
     Example:
        data,rsc = read_complex_int16('100102.slc')
        data,rsc = read_complex_int16('100102.slc',(100,1200,500,1500))
@@ -812,17 +1161,16 @@ def read_complex_int16(File, box=None, real_imag=False):
     if not box:
         box = [0,0,width,length]
 
-    data = np.fromfile(File,np.int16,box[3]*2*width).reshape(box[3],2*width)
-    data = data[box[1]:box[3],2*box[0]:2*box[2]].flatten()
-    odd_idx = np.arange(1, len(data), 2)
-    real = data[odd_idx-1].reshape(box[3]-box[1],box[2]-box[0])
-    imag = data[odd_idx].reshape(box[3]-box[1],box[2]-box[0])
+    data = np.memmap(File, dtype=np.int16, mode='r', shape=(length, 2*width))
+    data = np.array(data[box[1]:box[3],2*box[0]:2*box[2]])
+    real = data[:,0::2]
+    imag = data[:,1::2]
 
     if real_imag:
         return real, imag, atr
     else:
-        amplitude = np.array([np.hypot(imag,real)]).reshape(length,width)
-        phase = np.array([np.arctan2(imag,real)]).reshape(length,width)
+        amplitude = np.hypot(imag,real)
+        phase = np.arctan2(imag,real)
         return amplitude, phase, atr
 
     #data = np.fromfile(File,np.int16,length*2*width).reshape(length*2,width)
@@ -835,25 +1183,26 @@ def read_complex_int16(File, box=None, real_imag=False):
     #return amplitude, phase, parContents
 
 
-def read_dem(File):
+def read_dem(File, box=None):
     '''Read real int 16 data matrix, i.e. ROI_PAC .dem file.
     Input:  roi_pac format dem file
+            box, optional, 4-tuple defining the left, upper, right, and lower pixel coordinate
     Usage:  dem, atr = read_real_int16('gsi10m_30m.dem')
     '''
     atr = read_attribute(File)
     width = int(float(atr['WIDTH']))
     length = int(float(atr['FILE_LENGTH'])) 
-    dem = np.fromfile(File, dtype=np.int16).reshape(length, width)
+    if not box:
+        box = [0,0,width,length]
+
+    dem = np.memmap(File, dtype=np.int16, mode='r', shape=(length, width))
+    dem = np.array(dem[box[1]:box[3],box[0]:box[2]])
     return dem, atr
 
 
-def read_real_int16(File):
+def read_real_int16(File, box=None):
     '''Same as read_dem() above'''
-    atr = read_attribute(File)
-    width = int(float(atr['WIDTH']))
-    length = int(float(atr['FILE_LENGTH'])) 
-    dem = np.fromfile(File, dtype=np.int16).reshape(length, width)
-    return dem, atr
+    return read_dem(File, box)
 
 
 def read_flag(File):
@@ -23,16 +23,16 @@ import _writefile as writefile
 
 
 ##################################################################
-def remove_data_surface(data, mask, surf_type='plane'):
-    '''Remove surface from input data matrix based on pixel marked by mask'''
-    mask[np.isnan(data)] = 0
-    mask = mask.flatten(1) 
-    z = data.flatten(1)
-    ndx= mask !=0
-    x = list(range(0,np.shape(data)[1]))
-    y = list(range(0,np.shape(data)[0]))
+def surface_design_matrix_pinv(mask, surf_type='plane'):
+    '''Pseudo-inverse of design matrix of surface for pixels marked by mask (non-zero), in column-major order.
+    For datasets sharing the same mask, i.e. interferograms, it can be calculated once and passed to
+    remove_data_surface() for each of them.
+    '''
+    ndx = mask.flatten('F') != 0
+    x = list(range(0,np.shape(mask)[1]))
+    y = list(range(0,np.shape(mask)[0]))
     x1,y1 = np.meshgrid(x,y)
-    points = np.vstack((y1.flatten(1),x1.flatten(1))).T
+    points = np.vstack((y1.flatten('F'),x1.flatten('F'))).T
     if surf_type=='quadratic':
         G = np.array([points[:,0]**2,points[:,1]**2,points[:,0],points[:,1],points[:,0]*points[:,1],\
                      np.ones(np.shape(points)[0])],np.float32).T
@@ -51,11 +51,28 @@ def remove_data_surface(data, mask, surf_type='plane'):
     elif surf_type=='plane_azimuth':
         G = np.array([points[:,0],\
                      np.ones(np.shape(points)[0])],np.float32).T
-  
-    z = z[ndx]
+
     G = G[ndx]
     G1=np.linalg.pinv(G)
+    return G1
+
+
+def remove_data_surface(data, mask, surf_type='plane', G1=None):
+    '''Remove surface from input data matrix based on pixel marked by mask
+    G1 - 2D np.array, optional, pseudo-inverse of design matrix from surface_design_matrix_pinv() with
+         the same mask and surf_type, re-calculated if there is NaN value in data within mask.
+    '''
+    if G1 is not None and np.any(np.isnan(data[mask != 0])):
+        G1 = None
+    mask[np.isnan(data)] = 0
+    if G1 is None:
+        G1 = surface_design_matrix_pinv(mask, surf_type)
+
+    z = data.flatten('F')[mask.flatten('F') != 0]
     plane = np.dot(G1,z)
+    x = list(range(0,np.shape(data)[1]))
+    y = list(range(0,np.shape(data)[0]))
+    x1,y1 = np.meshgrid(x,y)
   
     if   surf_type == 'quadratic':
         zplane = plane[0]*y1**2 + plane[1]*x1**2 + plane[2]*y1 + plane[3]*x1 + plane[4]*y1*x1 + plane[5]
@@ -177,7 +194,7 @@ def remove_surface(File, surf_type, maskFile=None, outFile=None, ysub=None):
             else:
                 data_n = remove_data_multiple_surface(data, Mask, surf_type, ysub)
   
-            dset = group.create_dataset(epoch, data=data_n, compression='gzip')
+            dset = group.create_dataset(epoch, data=data_n, **writefile.compression_kwargs())
             prog_bar.update(i+1, suffix=epoch)
         for key,value in h5file[k].attrs.items():
             group.attrs[key] = value
@@ -195,7 +212,7 @@ def remove_surface(File, surf_type, maskFile=None, outFile=None, ysub=None):
                 data_n = remove_data_multiple_surface(data, Mask, surf_type, ysub)
   
             gg   = group.create_group(epoch)
-            dset = gg.create_dataset(epoch, data=data_n, compression='gzip')
+            dset = gg.create_dataset(epoch, data=data_n, **writefile.compression_kwargs())
             for key,value in h5file[k][epoch].attrs.items():
                 gg.attrs[key] = value
             prog_bar.update(i+1, suffix=date12_list[i])
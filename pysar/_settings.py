@@ -0,0 +1,15 @@
+#! /usr/bin/env python2
+############################################################
+# Package-wide settings used by low-level modules, i.e. _writefile, _pysar_utilities.
+# No import of other modules here, so that they can be imported without the whole pysar package.
+# Recommended Usage:
+#   import _settings as settings
+#
+
+
+parallel_num = 8     # max core number used in parallel processing
+compression = 'gzip' # compression of HDF5 datasets written by PySAR: none, lzf, gzip, gzip1-9, shuffle+lzf or shuffle+gzip1-9
+                     # overwritten by environment variable PYSAR_COMPRESSION, i.e. set by pysarApp.py template
+design_matrix_cache_dir = None  # directory to cache design matrix of network inversion and its inverse on disk
+                                # (designMatrix.h5), for re-use by later runs; None to cache in memory only
+                                # overwritten by environment variable PYSAR_DESIGN_MATRIX_CACHE_DIR
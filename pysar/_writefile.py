@@ -11,22 +11,65 @@
 
 
 import os
+import sys
+import json
 
 import h5py
 import numpy as np
 from PIL import Image
 
+import _readfile as readfile
+import _settings as settings
 
-def write(*args):
+
+def compression_kwargs(compression=None):
+    '''Keyword arguments of h5py create_dataset() for compression of HDF5 datasets
+    Input:
+        compression - string, none, lzf, gzip, gzip1-9 (compression level), shuffle+lzf or shuffle+gzip1-9
+                      default: environment variable PYSAR_COMPRESSION if set, settings.compression otherwise
+    Output:
+        kwargs - dict, i.e. {'compression':'gzip', 'compression_opts':4}
+    Raise ValueError for un-recognized compression.
+    Example:
+        dset = group.create_dataset(k, data=data, **compression_kwargs())
+        dset = group.create_dataset(k, data=data, **compression_kwargs('shuffle+lzf'))
+    '''
+    if not compression:
+        compression = os.environ.get('PYSAR_COMPRESSION', settings.compression)
+    compression = str(compression).lower().replace(' ','')
+
+    kwargs = dict()
+    if compression.startswith('shuffle+'):
+        kwargs['shuffle'] = True
+        compression = compression.split('+',1)[1]
+
+    if compression in ['none','no','false']:
+        return dict()
+    elif compression == 'lzf':
+        kwargs['compression'] = 'lzf'
+    elif compression.startswith('gzip') and compression[4:] in ['']+[str(i) for i in range(10)]:
+        kwargs['compression'] = 'gzip'
+        if compression[4:]:
+            kwargs['compression_opts'] = int(compression[4:])
+    else:
+        raise ValueError('un-recognized compression: '+compression+\
+                         '\nsupported compression: none, lzf, gzip, gzip1-9, shuffle+lzf, shuffle+gzip1-9')
+    return kwargs
+
+
+def write(*args, **kwargs):
     '''Write one dataset, i.e. interferogram, coherence, velocity, dem ...
         Return 0 if failed.
   
     Usage:
         write(data,atr,outname)
         write(rg,az,atr,outname)
+        write(data,atr,outname,epoch_list=epoch_list,epoch_atr_list=None)
     
     Inputs:
-        data : 2D data matrix
+        data : 2D data matrix,
+               3D data matrix in size of (epoch_num, length, width) for timeseries/interferograms/coherence,
+               written in cube layout, with epoch_list (and epoch_atr_list), see create_cube_file()
         atr  : attribute object
         outname : output file name
     
@@ -35,6 +78,7 @@ def write(*args):
     
     Examples:
         write(data,atr,'velocity.h5')
+        write(data,atr,'timeseries.h5',epoch_list=date_list)
         write(data,atr,'temporal_coherence.h5')
         write(data,atr,'100120-110214.unw')
         write(data,atr,'strm1.dem')
@@ -60,15 +104,23 @@ def write(*args):
     if ext in ['.h5','.he5']:
         k = atr['FILE_TYPE']
         if k in ['interferograms','coherence','wrapped','timeseries']:
-            print('Un-supported file type: '+k)
-            print('Only support 1-dataset-1-attribute file, i.e. velocity, mask, ...')
-            return 0;
+            if data.ndim != 3 or not kwargs.get('epoch_list'):
+                print('Un-supported file type: '+k+' with '+str(data.ndim)+'D data')
+                print('Only support 3D data with epoch_list, written in cube layout.')
+                return 0;
+            h5file = create_cube_file(atr, outname, kwargs['epoch_list'], kwargs.get('epoch_atr_list'),\
+                                      dtype=data.dtype)
+            h5file[k].get(k)[:] = data
+            h5file.close()
+            return outname
+        readfile.close_pooled_hdf5(outname)
         h5file = h5py.File(outname,'w')
         group = h5file.create_group(k)
-        dset = group.create_dataset(k, data=data, compression='gzip')
+        dset = group.create_dataset(k, data=data, **compression_kwargs())
         for key , value in atr.items():
             group.attrs[key]=value
         h5file.close()
+        readfile.invalidate_attribute_cache(outname)
         return outname
 
     ##### ISCE / ROI_PAC GAMMA / Image product
@@ -95,6 +147,107 @@ def write(*args):
         return outname
 
 
+class hdf5_output_file(h5py.File):
+    '''HDF5 file object in 'w' mode, which removes the file from the cache of readfile.read_attribute() at close,
+    so that attributes read while the file is being written are not kept in the cache.
+    '''
+    def close(self):
+        fname = self.filename
+        h5py.File.close(self)
+        readfile.invalidate_attribute_cache(fname)
+
+
+def create_hdf5_file(atr, outname, dtype=np.float32):
+    '''Create 1-dataset-1-attribute HDF5 file with empty dataset, i.e. velocity, mask, ...
+    to be filled box by box afterwards.
+    Inputs:
+        atr     - dict, attributes with FILE_TYPE, FILE_LENGTH and WIDTH
+        outname - string, output file name
+        dtype   - data type of the dataset
+    Output:
+        h5file  - HDF5 file object opened in 'w' mode, to be closed by the caller
+    Example:
+        h5 = create_hdf5_file(atr, 'temporalCoherence.h5')
+        h5['temporal_coherence'].get('temporal_coherence')[y0:y1, :] = data
+        h5.close()
+    '''
+    k = atr['FILE_TYPE']
+    shape = (int(atr['FILE_LENGTH']), int(atr['WIDTH']))
+    readfile.close_pooled_hdf5(outname)
+    h5file = hdf5_output_file(outname,'w')
+    group = h5file.create_group(k)
+    dset = group.create_dataset(k, shape=shape, dtype=dtype, chunks=True, **compression_kwargs())
+    for key, value in atr.items():
+        group.attrs[key] = value
+    return h5file
+
+
+def cube_chunk_shape(shape, depth=32, size=64):
+    '''Chunk shape of 3D dataset in cube layout, balanced for both image and pixel time-series access,
+    i.e. (32, 64, 64) in float32 is 512 KB, reading one image decompresses 32 images at most,
+    reading time-series of one pixel decompresses epoch_num/32 chunks only.
+    Inputs:
+        shape - 3-tuple of int, (epoch_num, length, width)
+        depth - int, max number of epochs in one chunk
+        size  - int, max number of rows/columns in one chunk
+    Output:
+        chunk - 3-tuple of int
+    '''
+    return (min(shape[0], depth), min(shape[1], size), min(shape[2], size))
+
+
+def create_cube_file(atr, outname, epoch_list, epoch_atr_list=None, dtype=np.float32):
+    '''Create HDF5 file in cube layout, with empty 3D dataset in size of (epoch_num, length, width)
+    and side arrays of epoch info, to be filled epoch by epoch or box by box afterwards.
+    Inputs:
+        atr            - dict, attributes with FILE_TYPE, FILE_LENGTH and WIDTH
+        outname        - string, output file name
+        epoch_list     - list of string, dates for timeseries, group names for interferograms/coherence,
+                         in the same order as the 1st dimension of the 3D dataset
+        epoch_atr_list - list of dict, attributes of each epoch for interferograms/coherence.
+                         Attributes shared by all epochs are saved as the group attributes.
+        dtype          - data type of the dataset
+    Output:
+        h5file - HDF5 file object opened in 'w' mode, to be closed by the caller
+    Example:
+        h5 = create_cube_file(atr, 'timeseries_cube.h5', date_list)
+        h5['timeseries'].get('timeseries')[i, :, :] = data
+        h5.close()
+    '''
+    k = atr['FILE_TYPE']
+    shape = (len(epoch_list), int(atr['FILE_LENGTH']), int(atr['WIDTH']))
+    print('NOTE: file in cube layout is read by readfile, view.py, tsviewer.py, ifgram_inversion.py,\n'+\
+          '    temporal_coherence.py and dem_error.py; scripts modifying epochs in place require stack layout,\n'+\
+          '    convert it with: convert_layout.py '+outname+' --layout stack')
+    readfile.close_pooled_hdf5(outname)
+    h5file = hdf5_output_file(outname,'w')
+    group = h5file.create_group(k)
+    dset = group.create_dataset(k, shape=shape, dtype=dtype, chunks=cube_chunk_shape(shape), **compression_kwargs())
+
+    atr = dict(atr)
+    if k == 'timeseries':
+        group.create_dataset('date', data=np.array(epoch_list, dtype=np.bytes_))
+    else:
+        group.create_dataset('epoch', data=np.array(epoch_list, dtype=np.bytes_))
+        if epoch_atr_list:
+            epoch_atr_list = [dict((key, str(value)) for key, value in i.items()) for i in epoch_atr_list]
+            common_keys = [key for key in epoch_atr_list[0].keys()\
+                           if all(i.get(key) == epoch_atr_list[0][key] for i in epoch_atr_list)]
+            for key in common_keys:
+                atr[key] = epoch_atr_list[0][key]
+            epoch_atr_list = [dict((key, value) for key, value in i.items() if key not in common_keys)\
+                              for i in epoch_atr_list]
+            date12_list = [i.get('DATE12', '') for i in epoch_atr_list]
+            if not all(date12_list):
+                date12_list = [atr.get('DATE12', '')] * len(epoch_list)
+            group.create_dataset('date12', data=np.array(date12_list, dtype=np.bytes_))
+            group.create_dataset('attributes', data=np.array([json.dumps(i, sort_keys=True) for i in epoch_atr_list],\
+                                                             dtype=np.bytes_))
+    for key, value in atr.items():
+        group.attrs[key] = value
+    return h5file
+
+
 def write_roipac_rsc(atr, outname, sorting=True):
     '''Write attribute dict into ROI_PAC .rsc file
     Inputs:
@@ -126,6 +279,7 @@ def write_roipac_rsc(atr, outname, sorting=True):
     for key in keyList:
         frsc.write(f.format(str(key), str(atr[key]))+'\n')
     frsc.close()
+    readfile.invalidate_attribute_cache(outname)
     return outname
 
 
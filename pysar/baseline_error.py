@@ -14,6 +14,7 @@ import numpy as np
 import matplotlib
 
 import _readfile as readfile
+import _writefile as writefile
 
 
 ############################################################
@@ -191,7 +192,7 @@ def main(argv):
     for i in range(len(dateList)):
         dset1 = h5file['timeseries'].get(dateList[i])
         data = dset1[0:dset1.shape[0],0:dset1.shape[1]] - orbEffect[i,:,:]
-        dset = group.create_dataset(dateList[i], data=data, compression='gzip')      
+        dset = group.create_dataset(dateList[i], data=data, **writefile.compression_kwargs())      
   
     for key,value in h5file['timeseries'].attrs.items():
         group.attrs[key] = value
@@ -199,7 +200,7 @@ def main(argv):
     try:
         dset1 = h5file['mask'].get('mask')
         group=h5orbCor.create_group('mask')
-        dset = group.create_dataset('mask', data=dset1, compression='gzip')
+        dset = group.create_dataset('mask', data=dset1, **writefile.compression_kwargs())
     except: pass
   
     h5file.close()
@@ -0,0 +1,155 @@
+#! /usr/bin/env python2
+
+
+import os
+import sys
+import time
+import argparse
+
+import h5py
+import numpy as np
+
+import _readfile as readfile
+import _writefile as writefile
+
+
+######################################################################################################
+def read_epoch_list(File, max_epoch_num=None):
+    '''Get all / the first max_epoch_num epochs of input file, [None] for single-dataset file'''
+    atr = readfile.read_attribute(File)
+    k = atr['FILE_TYPE']
+    if k in readfile.multi_group_hdf5_file+readfile.multi_dataset_hdf5_file:
+        h5 = h5py.File(File,'r')
+        epoch_list = readfile.read_epoch_list(h5, k)
+        h5.close()
+        if max_epoch_num:
+            epoch_list = epoch_list[0:max_epoch_num]
+    else:
+        epoch_list = [None]
+    return epoch_list
+
+
+def drop_page_cache(File):
+    '''Flush File to disk and drop it from the page cache of operating system,
+    so that the following read is from disk, instead of memory.
+    Return False if not supported (posix_fadvise is only available in python 3.3+ on Unix).
+    '''
+    if not hasattr(os, 'posix_fadvise'):
+        return False
+    fd = os.open(File, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+    return True
+
+
+def benchmark_compression(File, epoch_list, compression, outfile):
+    '''Write / read epochs of input file into / from HDF5 file with given compression, one epoch at a time
+    Inputs:
+        File        - string, path of file to read the data stack from
+        epoch_list  - list of string, epochs to read, [None] for single-dataset file
+        compression - string, compression, i.e. none, lzf, gzip4, shuffle+lzf
+        outfile     - string, path of HDF5 file to write
+    Outputs:
+        write_speed - float, write throughput in MB/s of uncompressed data, including flush to disk
+        read_speed  - float, read  throughput in MB/s of uncompressed data, from disk if page cache is dropped
+        file_size   - float, file size in MB
+        data_size   - float, uncompressed data size in MB
+    '''
+    kwargs = writefile.compression_kwargs(compression)
+
+    # Write: read one epoch from input file, time writing of it only
+    data_size = 0.
+    write_time = 0.
+    h5 = h5py.File(outfile,'w')
+    group = h5.create_group('benchmark')
+    with readfile.pooled_hdf5(File):
+        for i in range(len(epoch_list)):
+            if epoch_list[i]:
+                data = readfile.read(File, epoch=epoch_list[i])[0]
+            else:
+                data = readfile.read(File)[0]
+            data_size += data.nbytes / 1024.**2
+            start_time = time.time()
+            group.create_dataset('%05d' % i, data=data, **kwargs)
+            write_time += time.time() - start_time
+    start_time = time.time()
+    h5.close()
+    fd = os.open(outfile, os.O_RDONLY)
+    os.fsync(fd)
+    os.close(fd)
+    write_time += time.time() - start_time
+
+    # Read: from disk instead of page cache
+    drop_page_cache(outfile)
+    start_time = time.time()
+    h5 = h5py.File(outfile,'r')
+    for i in range(len(epoch_list)):
+        data = h5['benchmark'].get('%05d' % i)[:]
+    h5.close()
+    read_time = time.time() - start_time
+
+    file_size = os.path.getsize(outfile) / 1024.**2
+    return data_size/max(write_time, 1e-6), data_size/max(read_time, 1e-6), file_size, data_size
+
+
+######################################################################################################
+EXAMPLE='''example:
+  benchmark_compression.py  timeseries.h5
+  benchmark_compression.py  unwrapIfgram.h5  --max-epoch 50
+  benchmark_compression.py  unwrapIfgram.h5  -c none lzf gzip1 shuffle+lzf  --dir /scratch/tmp
+'''
+
+def cmdLineParse():
+    parser = argparse.ArgumentParser(description='Benchmark write/read throughput and file size of HDF5 '+\
+                                                 'compression on a given stack.',\
+                                     formatter_class=argparse.RawTextHelpFormatter,\
+                                     epilog=EXAMPLE)
+
+    parser.add_argument('file', help='file to read the data stack from, i.e. timeseries.h5, unwrapIfgram.h5')
+    parser.add_argument('-c','--compression', nargs='*',\
+                        default=['none','lzf','shuffle+lzf','gzip1','gzip4','shuffle+gzip4','gzip9'],\
+                        help='compression to test, default: none lzf shuffle+lzf gzip1 gzip4 shuffle+gzip4 gzip9')
+    parser.add_argument('--max-epoch', dest='max_epoch_num', type=int,\
+                        help='max number of epochs to read from the file, default: all')
+    parser.add_argument('--dir', dest='out_dir', default='./',\
+                        help='directory to write test files into, i.e. the disk to test, default: ./')
+    parser.add_argument('--keep', dest='keep_file', action='store_true', help='keep test files')
+
+    inps = parser.parse_args()
+    return inps
+
+
+######################################################################################################
+def main(argv):
+    inps = cmdLineParse()
+    for compression in inps.compression:
+        try:
+            writefile.compression_kwargs(compression)
+        except ValueError as e:
+            print('ERROR: '+str(e))
+            sys.exit(1)
+
+    epoch_list = read_epoch_list(inps.file, inps.max_epoch_num)
+    print('read %d epochs from file: %s, one at a time' % (len(epoch_list), inps.file))
+    if not hasattr(os, 'posix_fadvise'):
+        print('WARNING: can not drop page cache in this python, read speed is likely from memory instead of disk.')
+
+    print('compression       write(MB/s)  read(MB/s)  size(MB)  ratio')
+    for compression in inps.compression:
+        outfile = os.path.join(inps.out_dir, 'benchmark_'+compression.replace('+','_')+'.h5')
+        write_speed, read_speed, file_size, data_size = benchmark_compression(inps.file, epoch_list,\
+                                                                              compression, outfile)
+        print('%-16s  %11.1f  %10.1f  %8.1f  %5.2f' % (compression, write_speed, read_speed, file_size,\
+                                                        data_size/max(file_size, 1e-6)))
+        if not inps.keep_file:
+            os.remove(outfile)
+    print('uncompressed data size: %.1f MB' % (data_size))
+    return
+
+
+######################################################################################################
+if __name__ == '__main__':
+    main(sys.argv[1:])
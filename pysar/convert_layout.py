@@ -0,0 +1,167 @@
+#! /usr/bin/env python2
+
+import os
+import sys
+import argparse
+
+import h5py
+import numpy as np
+
+import _datetime as ptime
+import _readfile as readfile
+import _writefile as writefile
+
+
+######################################################################################################
+def convert2cube(File, outfile):
+    '''Convert timeseries/interferograms/coherence file from stack layout into cube layout
+    Inputs:
+        File    - string, name/path of file in stack layout
+        outfile - string, name/path of output file in cube layout
+    Output:
+        outfile
+    '''
+    atr = readfile.read_attribute(File)
+    k = atr['FILE_TYPE']
+
+    h5 = h5py.File(File,'r')
+    epoch_list = sorted(h5[k].keys())
+    epoch_num = len(epoch_list)
+    print('number of epochs: '+str(epoch_num))
+
+    # attributes
+    atr_cube = dict(h5[k].attrs)
+    epoch_atr_list = None
+    if k in readfile.multi_group_hdf5_file:
+        epoch_atr_list = [dict(h5[k][epoch].attrs) for epoch in epoch_list]
+    for key in ['FILE_TYPE','FILE_LENGTH','WIDTH']:
+        atr_cube[key] = atr[key]
+
+    print('writing >>> '+outfile)
+    h5out = writefile.create_cube_file(atr_cube, outfile, epoch_list, epoch_atr_list)
+    dset = h5out[k].get(k)
+    print('chunk shape: '+str(dset.chunks))
+
+    # write epochs in blocks of chunk depth, so that each chunk is compressed once
+    step = dset.chunks[0]
+    prog_bar = ptime.progress_bar(maxValue=epoch_num)
+    for i in range(0, epoch_num, step):
+        epoch_sublist = epoch_list[i:i+step]
+        if k in readfile.multi_group_hdf5_file:
+            data = np.array([h5[k][epoch].get(epoch)[:] for epoch in epoch_sublist])
+        else:
+            data = np.array([h5[k].get(epoch)[:] for epoch in epoch_sublist])
+        dset[i:i+len(epoch_sublist), :, :] = data
+        prog_bar.update(i+len(epoch_sublist), suffix=epoch_sublist[-1])
+    prog_bar.close()
+    h5out.close()
+    h5.close()
+    return outfile
+
+
+def convert2stack(File, outfile):
+    '''Convert timeseries/interferograms/coherence file from cube layout into stack layout
+    Inputs:
+        File    - string, name/path of file in cube layout
+        outfile - string, name/path of output file in stack layout
+    Output:
+        outfile
+    '''
+    atr = readfile.read_attribute(File)
+    k = atr['FILE_TYPE']
+
+    h5 = h5py.File(File,'r')
+    epoch_list = readfile.read_epoch_list(h5, k)
+    epoch_num = len(epoch_list)
+    print('number of epochs: '+str(epoch_num))
+    dset = h5[k].get(k)
+    if k in readfile.multi_group_hdf5_file:
+        epoch_atr_list = readfile.read_cube_attribute_list(h5, k)
+
+    print('writing >>> '+outfile)
+    h5out = h5py.File(outfile,'w')
+    group = h5out.create_group(k)
+    if k in readfile.multi_dataset_hdf5_file:
+        for key, value in h5[k].attrs.items():
+            group.attrs[key] = value
+
+    # read epochs in blocks of chunk depth, so that each chunk is decompressed once
+    step = dset.chunks[0] if dset.chunks else 1
+    prog_bar = ptime.progress_bar(maxValue=epoch_num)
+    for i in range(0, epoch_num, step):
+        epoch_sublist = epoch_list[i:i+step]
+        data = dset[i:i+len(epoch_sublist), :, :]
+        for j in range(len(epoch_sublist)):
+            epoch = epoch_sublist[j]
+            if k in readfile.multi_group_hdf5_file:
+                gg = group.create_group(epoch)
+                gg.create_dataset(epoch, data=data[j], **writefile.compression_kwargs())
+                for key, value in epoch_atr_list[i+j].items():
+                    gg.attrs[key] = value
+            else:
+                group.create_dataset(epoch, data=data[j], **writefile.compression_kwargs())
+        prog_bar.update(i+len(epoch_sublist), suffix=epoch_sublist[-1])
+    prog_bar.close()
+    h5out.close()
+    h5.close()
+    return outfile
+
+
+######################################################################################################
+DESCRIPTION='''Convert timeseries / interferograms / coherence file between stack and cube layout.
+  stack: one 2D dataset per epoch (default layout of PySAR)
+  cube : one 3D dataset in size of (epoch_num, length, width), chunked for both image and
+         pixel time-series access, with dates / DATE12 / epoch attributes in side arrays.
+'''
+
+EXAMPLE='''example:
+  convert_layout.py  timeseries.h5
+  convert_layout.py  unwrapIfgram.h5  -o unwrapIfgram_cube.h5
+  convert_layout.py  timeseries_cube.h5  --layout stack
+'''
+
+def cmdLineParse():
+    parser = argparse.ArgumentParser(description=DESCRIPTION,\
+                                     formatter_class=argparse.RawTextHelpFormatter,\
+                                     epilog=EXAMPLE)
+
+    parser.add_argument('file', help='timeseries / interferograms / coherence file to be converted')
+    parser.add_argument('--layout', dest='layout', choices=['cube','stack'], default='cube',\
+                        help='layout of output file, default: cube')
+    parser.add_argument('-o','--outfile', help='output file name, default: add suffix _cube / _stack')
+
+    inps = parser.parse_args()
+    return inps
+
+
+######################################################################################################
+def main(argv):
+    inps = cmdLineParse()
+
+    atr = readfile.read_attribute(inps.file)
+    k = atr['FILE_TYPE']
+    if k not in readfile.multi_group_hdf5_file+readfile.multi_dataset_hdf5_file:
+        print('ERROR: input file is not multi-epoch file, i.e. timeseries, interferograms: '+k)
+        sys.exit(1)
+
+    h5 = h5py.File(inps.file,'r')
+    is_cube = readfile.is_cube_file(h5, k)
+    h5.close()
+    if is_cube == (inps.layout == 'cube'):
+        print('input file is already in '+inps.layout+' layout, skip conversion.')
+        return inps.file
+
+    if not inps.outfile:
+        inps.outfile = os.path.splitext(inps.file)[0]+'_'+inps.layout+'.h5'
+
+    if inps.layout == 'cube':
+        convert2cube(inps.file, inps.outfile)
+    else:
+        convert2stack(inps.file, inps.outfile)
+    print('Done.')
+    return inps.outfile
+
+
+######################################################################################################
+if __name__ == '__main__':
+    main(sys.argv[1:])
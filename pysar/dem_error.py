@@ -52,6 +52,14 @@ def read_template2inps(template_file, inps=None):
         else:
             inps.step_date = None
 
+    key = prefix+'parallel'
+    if key in key_list:
+        value = template[key]
+        if value in ['yes','True']:
+            inps.parallel = True
+        elif value in ['auto','no','False']:
+            inps.parallel = False
+
 
     return inps
 
@@ -74,6 +82,113 @@ def get_exclude_date(inps, date_list_all):
     return inps
 
 
+def get_box_inps_dict(inps_dict, box):
+    '''Get items used by correct_dem_error_patch() from inps_dict, with geometry and perpendicular baseline
+    cropped to the box, so that only data of the box is passed to each process in parallel processing.
+    Inputs:
+        inps_dict - dict, input arguments, with incidence_angle/range_dis/pbase for the whole area
+        box       - 4-tuple of int, area to process, defined in (x0, y0, x1, y1)
+    Output:
+        box_dict  - dict, items for correct_dem_error_patch()
+    '''
+    box_dict = dict((key, inps_dict[key]) for key in ['date_list','A_def','tbase','phase_velocity','ex_flag',\
+                                                      'update_timeseries'])
+    inc_angle = inps_dict['incidence_angle']
+    range_dis = inps_dict['range_dis']
+    if inc_angle.ndim == 2:
+        inc_angle = inc_angle[box[1]:box[3], box[0]:box[2]]
+        range_dis = range_dis[box[1]:box[3], box[0]:box[2]]
+    elif inc_angle.ndim == 1:
+        inc_angle = inc_angle[box[0]:box[2]]
+        range_dis = range_dis[box[0]:box[2]]
+    box_dict['incidence_angle'] = np.array(inc_angle)
+    box_dict['range_dis'] = np.array(range_dis)
+
+    pbase = inps_dict['pbase']
+    if pbase.shape[1] > 1:
+        pbase = pbase[:, box[1]:box[3]]
+    box_dict['pbase'] = np.array(pbase)
+    return box_dict
+
+
+def correct_dem_error_patch(timeseries_file, box, inps_dict):
+    '''Estimate DEM error and correct timeseries within the box, using L2-norm minimization
+    Inputs:
+        timeseries_file - string, path of timeseries file
+        box             - 4-tuple of int, area to process, defined in (x0, y0, x1, y1)
+        inps_dict       - dict, with the following items:
+                          date_list       - list of string, dates in YYYYMMDD format
+                          A_def           - 2D np.array, design matrix of temporal deformation model
+                          pbase           - 2D np.array in size of (date_num, 1) or (date_num, box_length)
+                          tbase           - 2D np.array in size of (date_num, 1)
+                          incidence_angle - 0/1/2D np.array, incidence angle in radian, within the box
+                          range_dis       - 0/1/2D np.array, range distance, within the box
+                          see get_box_inps_dict()
+                          phase_velocity  - bool, use phase velocity instead of phase
+                          ex_flag         - 1D np.array of bool, False for date excluded, or None
+                          update_timeseries - bool, correct timeseries or not
+    Output:
+        delta_z - 2D np.array in size of (box_length, box_width), DEM error in meter
+        ts_cor  - 3D np.array in size of (date_num, box_length, box_width), corrected timeseries,
+                  None if update_timeseries is False
+        resid   - 3D np.array in size of (A_def.shape[0], box_length, box_width), residual of inversion
+    '''
+    date_list = inps_dict['date_list']
+    date_num = len(date_list)
+    box_length = box[3] - box[1]
+    box_width = box[2] - box[0]
+    tbase = inps_dict['tbase']
+    A_def = inps_dict['A_def']
+    ex_flag = inps_dict['ex_flag']
+
+    # Read timeseries within the box
+    h5 = h5py.File(timeseries_file, 'r')
+    timeseries = np.array(readfile.read_epoch_box(h5, 'timeseries', date_list, box), np.float32)
+    h5.close()
+
+    # Geometry of pixels within the box: range_dis * sin(inc_angle)
+    scale = np.ones((box_length, box_width)) * inps_dict['range_dis'] * np.sin(inps_dict['incidence_angle'])
+
+    # DEM error column of design matrix varies pixel by pixel as pbase / (range_dis * sin(inc_angle)),
+    # scaling of one column does not change the fitting, thus solve with pbase only, which is the same
+    # for all pixels (or for all pixels in one row, considering P_BASELINE variation in azimuth direction),
+    # and scale the DEM error back afterwards.
+    pbase = inps_dict['pbase'].T.reshape(-1, date_num, 1)
+    if inps_dict['phase_velocity']:
+        pbase_v = np.diff(pbase, axis=1) / np.diff(tbase, axis=0)
+        A = np.concatenate((pbase_v, np.tile(A_def, (pbase.shape[0], 1, 1))), axis=2)
+    else:
+        A = np.concatenate((pbase, np.tile(A_def, (pbase.shape[0], 1, 1))), axis=2)
+
+    # L-2 norm inversion
+    if ex_flag is not None:
+        A_inv = np.linalg.pinv(A[:, ex_flag, :])
+    else:
+        A_inv = np.linalg.pinv(A)
+
+    # Get unknown parameters X = [delta_z * scale, vel, acc, delta_acc, ...]
+    ts_dis = timeseries
+    if inps_dict['phase_velocity']:
+        ts_dis = np.diff(ts_dis, axis=0) / np.diff(tbase, axis=0).reshape(-1,1,1)
+    ts_dis_ex = ts_dis
+    if ex_flag is not None:
+        ts_dis_ex = ts_dis[ex_flag]
+    if pbase.shape[0] == 1:
+        X = np.dot(A_inv[0], ts_dis_ex.reshape(ts_dis_ex.shape[0], -1)).reshape(-1, box_length, box_width)
+        resid = ts_dis - np.dot(A[0], X.reshape(X.shape[0], -1)).reshape(ts_dis.shape)
+    else:
+        X = np.einsum('rkn,nrc->krc', A_inv, ts_dis_ex)
+        resid = ts_dis - np.einsum('rnk,krc->nrc', A, X)
+    resid = np.array(resid, np.float32)
+
+    # Update DEM error / timeseries matrix
+    delta_z = np.array(X[0] * scale, np.float32)
+    ts_cor = None
+    if inps_dict['update_timeseries']:
+        ts_cor = timeseries - np.array(pbase[:,:,0].T.reshape(date_num, -1, 1) * X[0], np.float32)
+    return delta_z, ts_cor, resid
+
+
 ######################################
 TEMPLATE='''
 ## 8. Topographic (DEM) Residual Correction (Fattahi and Amelung, 2013, IEEE-TGRS)
@@ -81,11 +196,14 @@ pysar.topoError              = auto    #[yes / no], auto for yes
 pysar.topoError.polyOrder    = auto    #[1 / 2 / 3], auto for 2, polynomial order of temporal deformation model
 pysar.topoError.excludeDate  = auto    #[20101120 / txtFile / no], auto for no, date not used for error estimation
 pysar.topoError.stepFuncDate = auto    #[20080529 / no], auto for no, date of step jump, i.e. eruption/earthquade date
+pysar.topoError.parallel     = auto    #[yes / no], auto for no, process boxes in parallel with pysar.parallel_num cores
 '''
 
 EXAMPLE='''example:
   dem_error.py  timeseries_ECMWF.h5
   dem_error.py  timeseries_ECMWF.h5  --phase-velocity
+  dem_error.py  timeseries_ECMWF.h5  --memory-limit 1
+  dem_error.py  timeseries_ECMWF.h5  --parallel
   dem_error.py  timeseries_ECMWF.h5  -d dem_radar.h5
   dem_error.py  geo_timeseries.h5    -i geo_incidence_angle.h5  -r geo_range.h5
 
@@ -124,6 +242,12 @@ def cmdLineParse():
                         help='Do not update timeseries; if specified, only DEM error will be calculated.')
     parser.add_argument('--poly-order', dest='poly_order', type=int, default=2, choices=[1,2,3],\
                         help='polynomial order number of temporal deformation model, default = 2')
+    parser.add_argument('--memory-limit', dest='memory_limit', type=float, default=4.0,\
+                        help='max memory size in GB used for each box of rows, default: 4.\n'+\
+                             'Time series is read, corrected and written box by box to fit within this limit.')
+    parser.add_argument('--parallel', dest='parallel', action='store_true',\
+                        help='process boxes in parallel, with max core number set in pysar/_settings.py: parallel_num.\n'+\
+                             'memory-limit is shared by all processes.')
 
     inps = parser.parse_args()
     return inps  
@@ -141,43 +265,32 @@ def main(argv):
         print('read option from template file: '+inps.template_file)
         inps = read_template2inps(inps.template_file, inps)
 
-    # Read Time Series
-    print("loading time series: " + inps.timeseries_file)
+    # Time Series Info
+    print("time series file: " + inps.timeseries_file)
     atr = readfile.read_attribute(inps.timeseries_file)
     length = int(atr['FILE_LENGTH'])
     width = int(atr['WIDTH'])
 
-    h5 = h5py.File(inps.timeseries_file)
-    date_list = sorted(h5['timeseries'].keys())
+    h5 = h5py.File(inps.timeseries_file, 'r')
+    date_list = readfile.read_epoch_list(h5, 'timeseries')
+    h5.close()
     date_num = len(date_list)
     print('number of acquisitions: '+str(date_num))
 
     # Exclude date info
     #inps.ex_date = ['20070115','20100310']
+    inps.ex_flag = None
     if inps.ex_date:
         inps = get_exclude_date(inps, date_list)
         if inps.ex_date:
             inps.ex_flag = np.array([i not in inps.ex_date for i in date_list])
 
-    timeseries = np.zeros((len(date_list),length*width),np.float32)
-    prog_bar = ptime.progress_bar(maxValue=date_num, prefix='loading: ')
-    for i in range(date_num):
-        date = date_list[i]
-        d = h5['timeseries'].get(date)[:]
-        timeseries[i][:] = d.flatten('F')
-        prog_bar.update(i+1, suffix=date)
-    del d
-    h5.close()
-    prog_bar.close()
-
     # Perpendicular Baseline
     print('read perpendicular baseline')
     try:
         inps.pbase = ut.perp_baseline_timeseries(atr, dimension=0)
         if inps.pbase.shape[1] > 1:
             print('\tconsider P_BASELINE variation in azimuth direction')
-        else:
-            pbase = inps.pbase
     except:
         print('\tCannot find P_BASELINE_TIMESERIES from timeseries file.')
         print('\tTrying to calculate it from interferograms file')
@@ -266,151 +379,17 @@ def main(argv):
     print('-------------------------------------------------')
 
 
-    ##---------------------------------------- Loop for L2-norm inversion  -----------------------------------##
-    delta_z_mat = np.zeros([length, width], dtype=np.float32)
-    resid_n = np.zeros([A_def.shape[0], length*width], dtype=np.float32)
-    constC = np.zeros([length, width], dtype=np.float32)
-    #delta_a_mat = np.zeros([length, width])
-    if inps.incidence_angle.ndim == 2 and inps.range_dis.ndim == 2:
-        print('inversing using L2-norm minimization (unweighted least squares)'\
-              ' pixel by pixel: %d loops in total' % (length*width))
-        prog_bar = ptime.progress_bar(maxValue=length*width, prefix='calculating: ')
-        for i in range(length*width):
-            row = i%length
-            col = i/length
-            range_dis = inps.range_dis[row, col]
-            inc_angle = inps.incidence_angle[row, col]
-            # Consider P_BASELINE variation within one interferogram
-            if inps.pbase.shape[1] > 1:
-                pbase = inps.pbase[:,row].reshape(date_num, 1)
-
-            # Design matrix - DEM error using pbase, range distance and incidence angle
-            A_delta_z = pbase / (range_dis * np.sin(inc_angle))
-            if inps.phase_velocity:
-                pbase_v = np.diff(pbase, axis=0) / np.diff(inps.tbase, axis=0)
-                A_delta_z_v = pbase_v / (range_dis * np.sin(inc_angle))
-                A = np.hstack((A_delta_z_v, A_def))
-            else:
-                A = np.hstack((A_delta_z, A_def))
-
-            # L-2 norm inversion
-            if inps.ex_date:
-                A_inv = np.linalg.pinv(A[inps.ex_flag,:])
-            else:
-                A_inv = np.linalg.pinv(A)
-
-            # Get unknown parameters X = [delta_z, vel, acc, delta_acc, ...]
-            ts_dis = timeseries[:,i]
-            if inps.phase_velocity:
-                ts_dis = np.diff(ts_dis, axis=0) / np.diff(inps.tbase, axis=0)
-
-            if inps.ex_date:
-                X = np.dot(A_inv, ts_dis[inps.ex_flag])
-            else:
-                X = np.dot(A_inv, ts_dis)
-
-            # Residual vector n
-            resid_n[:, i] = ts_dis - np.dot(A, X)
-
-            # Update DEM error / timeseries matrix
-            delta_z = X[0]
-            delta_z_mat[row, col] = delta_z
-            if inps.update_timeseries:
-                timeseries[:,i] -= np.dot(A_delta_z, delta_z).flatten()
-            prog_bar.update(i+1, every=length*width/100)
-        prog_bar.close()
-
-
-    elif inps.incidence_angle.ndim == 1 and inps.range_dis.ndim == 1:
-        print('inversing using L2-norm minimization (unweighted least squares)'\
-              ' column by column: %d loops in total' % (width))
-        prog_bar = ptime.progress_bar(maxValue=width, prefix='calculating: ')
-        for i in range(width):
-            range_dis = inps.range_dis[i]
-            inc_angle = inps.incidence_angle[i]
-
-            # Design matrix - DEM error using pbase, range distance and incidence angle
-            A_delta_z = pbase / (range_dis * np.sin(inc_angle))
-            if inps.phase_velocity:
-                pbase_v = np.diff(pbase, axis=0) / np.diff(inps.tbase, axis=0)
-                A_delta_z_v = pbase_v / (range_dis * np.sin(inc_angle))
-                A = np.hstack((A_delta_z_v, A_def))
-            else:
-                A = np.hstack((A_delta_z, A_def))
-
-            # L-2 norm inversion
-            if inps.ex_date:
-                A_inv = np.linalg.pinv(A[inps.ex_flag,:])
-            else:
-                A_inv = np.linalg.pinv(A)
-
-            # Get unknown parameters X = [delta_z, vel, acc, delta_acc, ...]
-            ts_dis = timeseries[:,i*length:(i+1)*length]
-            if inps.phase_velocity:
-                ts_dis = np.diff(ts_dis, axis=0) / np.diff(inps.tbase, axis=0)
-
-            if inps.ex_date:
-                X = np.dot(A_inv, ts_dis[inps.ex_flag,:])
-            else:
-                X = np.dot(A_inv, ts_dis)
-
-            # Residual vector n
-            resid_n[:, i*length:(i+1)*length] = ts_dis - np.dot(A, X)
-            constC[:, i] = X[1].reshape((1, length))
-
-            # Update DEM error / timeseries matrix
-            delta_z = X[0].reshape((1,length))
-            delta_z_mat[:, i] = delta_z
-            if inps.update_timeseries:
-                timeseries[:, i*length:(i+1)*length] -= np.dot(A_delta_z, delta_z)
-            prog_bar.update(i+1, every=width/100)
-        prog_bar.close()
-
-
-    elif inps.incidence_angle.ndim == 0 and inps.range_dis.ndim == 0:
-        print('inversing using L2-norm minimization (unweighted least squares) for the whole area')
-        
-        # Design matrix - DEM error using pbase, range distance and incidence angle
-        A_delta_z = pbase / (inps.range_dis * np.sin(inps.incidence_angle))
-        if inps.phase_velocity:
-            pbase_v = np.diff(pbase, axis=0) / np.diff(inps.tbase, axis=0)
-            A_delta_z_v = pbase_v / (inps.range_dis * np.sin(inps.incidence_angle))
-            A = np.hstack((A_delta_z_v, A_def))
-        else:
-            A = np.hstack((A_delta_z, A_def))
-
-        # L-2 norm inversion
-            if inps.ex_date:
-                A_inv = np.linalg.pinv(A[inps.ex_flag,:])
-            else:
-                A_inv = np.linalg.pinv(A)
-
-        # Get unknown parameters X = [delta_z, vel, acc, delta_acc, ...]
-        if inps.phase_velocity:
-            timeseries = np.diff(timeseries, axis=0) / np.diff(inps.tbase, axis=0)
-
-        if inps.ex_date:
-            X = np.dot(A_inv, timeseries[inps.ex_flag,:])
-        else:
-            X = np.dot(A_inv, timeseries)
-
-        # Residual vector n
-        resid_n = ts_dis - np.dot(A, X)
-
-        # Update DEM error / timeseries matrix
-        delta_z_mat = X[0].reshape((1, length*width))
-        if inps.update_timeseries:
-            timeseries -= np.dot(A_delta_z, delta_z_mat)
-        delta_z_mat = np.reshape(delta_z_mat, [length, width], order='F')
-
-    else:
+    if inps.incidence_angle.ndim != inps.range_dis.ndim:
         print('ERROR: Script only support same dimension for both incidence angle and range distance matrix.')
         print('dimension of incidence angle: '+str(inps.incidence_angle.ndim))
         print('dimension of range distance: '+str(inps.range_dis.ndim))
         sys.exit(1)
+    inps.A_def = A_def
+    inps.date_list = date_list
 
 
     ##------------------------------------------------ Output  --------------------------------------------##
+    # Preallocate output files, to be filled box by box
     # DEM error file
     if 'Y_FIRST' in list(atr.keys()):
         dem_error_file = 'demGeo_error.h5'
@@ -423,7 +402,7 @@ def main(argv):
     atr_dem_error = atr.copy()
     atr_dem_error['FILE_TYPE'] = 'dem'
     atr_dem_error['UNIT'] = 'm'
-    writefile.write(delta_z_mat, atr_dem_error, dem_error_file)
+    h5dem = writefile.create_hdf5_file(atr_dem_error, dem_error_file)
 
     ## Phase Constant C = resid_n[0,:]
     #atrC = atr.copy()
@@ -438,53 +417,71 @@ def main(argv):
     #    print 'writing >>> '+inps.dem_outfile
     #    dem, atr_dem = readfile.read(inps.dem_file)
     #    writefile.write(dem+delta_z_mat, atr_dem, inps.dem_outfile)
-    
-    #outfile = 'delta_acc.h5'
-    #print 'writing >>> '+outfile
-    #atr_dem_error = atr.copy()
-    #atr_dem_error['FILE_TYPE'] = 'velocity'
-    #atr_dem_error['UNIT'] = 'm/s'
-    #writefile.write(delta_a_mat, atr_dem_error, outfile)
-    #print '**************************************'
 
     # Corrected Time Series
     if inps.update_timeseries:
         print('writing >>> '+inps.outfile)
-        print('number of dates: '+str(len(date_list)))
+        print('number of dates: '+str(date_num))
         h5out = h5py.File(inps.outfile,'w')
         group = h5out.create_group('timeseries')
-        prog_bar = ptime.progress_bar(maxValue=date_num, prefix='writing: ')
-        for i in range(date_num):
-            date = date_list[i]
-            d = np.reshape(timeseries[i][:], [length,width], order='F')
-            dset = group.create_dataset(date, data=d, compression='gzip')
-            prog_bar.update(i+1, suffix=date)
-        prog_bar.close()
+        for date in date_list:
+            group.create_dataset(date, shape=(length, width), dtype=np.float32, chunks=True, **writefile.compression_kwargs())
         for key,value in atr.items():
             group.attrs[key] = value
-        h5out.close()
 
+    # Residual Time Series
+    resid_num = A_def.shape[0]
     outFile = os.path.splitext(inps.outfile)[0]+'InvResid.h5'
     print('writing >>> '+outFile)
-    print('number of dates: '+str(A_def.shape[0]))
-    h5out = h5py.File(outFile,'w')
-    group = h5out.create_group('timeseries')
-    prog_bar = ptime.progress_bar(maxValue=A_def.shape[0], prefix='writing: ')
-    for i in range(A_def.shape[0]):
-        date = date_list[i]
-        d = np.reshape(resid_n[i][:], [length,width], order='F')
-        dset = group.create_dataset(date, data=d, compression='gzip')
-        prog_bar.update(i+1, suffix=date)
-    prog_bar.close()
-    # Attribute
+    print('number of dates: '+str(resid_num))
+    h5resid = h5py.File(outFile,'w')
+    group_resid = h5resid.create_group('timeseries')
+    for date in date_list[0:resid_num]:
+        group_resid.create_dataset(date, shape=(length, width), dtype=np.float32, chunks=True, **writefile.compression_kwargs())
     for key,value in atr.items():
-        group.attrs[key] = value
-    if A_def.shape[0] == date_num:
-        group.attrs['UNIT'] = 'm'
+        group_resid.attrs[key] = value
+    if resid_num == date_num:
+        group_resid.attrs['UNIT'] = 'm'
     else:
-        group.attrs['UNIT'] = 'm/yr'
-    h5out.close()
+        group_resid.attrs['UNIT'] = 'm/yr'
+
+
+    ##---------------------------------------- Loop for L2-norm inversion  -----------------------------------##
+    print('inversing using L2-norm minimization (unweighted least squares) box by box')
+    num_cores, enable_parallel = 1, False
+    if inps.parallel:
+        num_cores, enable_parallel, Parallel, delayed = ut.check_parallel(length)
+    # timeseries, corrected timeseries, residual and their float64 copies in memory
+    box_list = ut.split_row_box(length, width, 6*date_num, inps.memory_limit/num_cores, num_cores)
+    box_num = len(box_list)
+    inps_dict = vars(inps)
+    prog_bar = ptime.progress_bar(maxValue=box_num, prefix='calculating: ')
+    for i in range(0, box_num, num_cores):
+        box_sublist = box_list[i:i+num_cores]
+        if enable_parallel:
+            out_list = Parallel(n_jobs=num_cores)(delayed(correct_dem_error_patch)(inps.timeseries_file, box,\
+                                                                                   get_box_inps_dict(inps_dict, box))\
+                                                  for box in box_sublist)
+        else:
+            out_list = [correct_dem_error_patch(inps.timeseries_file, box, get_box_inps_dict(inps_dict, box))\
+                        for box in box_sublist]
 
+        # write results of all boxes by the main process only
+        for box, (delta_z, ts_cor, resid) in zip(box_sublist, out_list):
+            h5dem['dem'].get('dem')[box[1]:box[3], box[0]:box[2]] = delta_z
+            if inps.update_timeseries:
+                for j in range(date_num):
+                    group[date_list[j]][box[1]:box[3], box[0]:box[2]] = ts_cor[j]
+            for j in range(resid_num):
+                group_resid[date_list[j]][box[1]:box[3], box[0]:box[2]] = resid[j]
+        prog_bar.update(i+len(box_sublist), suffix='rows %d-%d' % (box_sublist[0][1], box_sublist[-1][3]))
+    prog_bar.close()
+    del out_list
+
+    h5dem.close()
+    if inps.update_timeseries:
+        h5out.close()
+    h5resid.close()
     return
 
 ################################################################################
@@ -211,7 +211,7 @@ def geocode_file_with_geo_lut(fname, lut_file=None, method='nearest', fill_value
                 data_geo.fill(fill_value)
                 data_geo[idx] = RGI_func(pts_geo)
 
-                dset = group.create_dataset(date, data=data_geo, compression='gzip')
+                dset = group.create_dataset(date, data=data_geo, **writefile.compression_kwargs())
                 prog_bar.update(i+1, suffix=date)
             prog_bar.close()
 
@@ -232,7 +232,7 @@ def geocode_file_with_geo_lut(fname, lut_file=None, method='nearest', fill_value
                 data_geo[idx] = RGI_func(pts_geo)
 
                 gg = group.create_group(ifgram)
-                dset = gg.create_dataset(ifgram, data=data_geo, compression='gzip')
+                dset = gg.create_dataset(ifgram, data=data_geo, **writefile.compression_kwargs())
 
                 atr = geocode_attribute_with_geo_lut(h5[k][ifgram].attrs, atr_lut, print_msg=False)
                 for key, value in atr.items():
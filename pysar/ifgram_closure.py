@@ -2,42 +2,228 @@
 
 import os
 import sys
+import argparse
+
 import h5py
+import numpy as np
+
+import _datetime as ptime
+import _readfile as readfile
+import _writefile as writefile
 import _pysar_utilities as ut
 
 
-def usage():
-    print('''usage: ifgram_closure.py  ifgram_file  [output_file]
+######################################################################################################
+def ifgram_closure(ifgram_file, outfile='closure.h5', mask_file=None, thr=0.5, memory_limit=4.0, curl_file=None):
+    '''Check phase closure of all triangles of interferograms network in one pass, box by box.
+    Closure phase of each box is calculated on the fly as C * ifgram, with C from get_triangles(),
+    without writing the intermediate closure phase out, unless curl_file is given.
+    Inputs:
+        ifgram_file  - string, name/path of interferograms file
+        outfile      - string, name/path of output HDF5 file
+        mask_file    - string, optional, name/path of mask file, pixels with 0 are excluded from statistics
+        thr          - float, threshold in radian, closure phase with absolute value >= thr is non-zero
+        memory_limit - float, max memory size in GB used for one box of rows
+        curl_file    - string, optional, name/path of closure phase file to write in the same pass,
+                       if it does not exist, same as generate_curls(), default: None, not to write
+    Output:
+        outfile      - string, HDF5 file (rmse type) of mean absolute closure phase of all triangles for each pixel
+        numfile      - string, HDF5 file (mask type) of number of triangles with non-zero closure phase
+                       for each pixel, with NumNonzero suffix to outfile, i.e. closureNumNonzero.h5
+        txtfile      - string, text summary file, with the same basename as outfile, with:
+                       for each interferogram: ratio of non-zero closure phase (unwrapping error likelihood) and
+                                               mean absolute closure phase of triangles/pixels with it
+                       for each triangle     : ratio of pixels with non-zero closure phase and
+                                               mean absolute closure phase
+    Example:
+        ifgram_closure('unwrapIfgram.h5', 'closure.h5')
+    '''
+    atr = readfile.read_attribute(ifgram_file)
+    length = int(atr['FILE_LENGTH'])
+    width = int(atr['WIDTH'])
+    k = atr['FILE_TYPE']
+
+    h5 = h5py.File(ifgram_file,'r')
+    ifgram_list = list(h5[k].keys())
+    ifgram_num = len(ifgram_list)
+    date12_list = ptime.list_ifgram2date12(ifgram_list)
+    print('number of interferograms: '+str(ifgram_num))
+
+    curls, Triangles, C = ut.get_triangles(h5)
+    curl_num = len(Triangles)
+    print('number of triangles: '+str(curl_num))
+    if curl_num == 0:
+        print('ERROR: no triangle found in the network of interferograms!')
+        sys.exit(1)
+
+    if mask_file:
+        print('read mask from file: '+mask_file)
+        mask = readfile.read(mask_file)[0] != 0
+    else:
+        mask = np.ones((length, width), np.bool_)
+
+    ##### Output files, in single dataset types readable by readfile / view.py / info.py
+    numfile = os.path.splitext(outfile)[0]+'NumNonzero'+os.path.splitext(outfile)[1]
+    atr_out = dict(atr)
+    atr_out['FILE_TYPE'] = 'rmse'
+    atr_out['UNIT'] = 'radian'
+    atr_out['CLOSURE_THRESHOLD'] = str(thr)
+    print('writing >>> '+outfile)
+    h5out = writefile.create_hdf5_file(atr_out, outfile)
+    dset_mean = h5out['rmse'].get('rmse')
+    atr_out['FILE_TYPE'] = 'mask'
+    atr_out['UNIT'] = '1'
+    print('writing >>> '+numfile)
+    h5num = writefile.create_hdf5_file(atr_out, numfile, dtype=np.int32)
+    dset_num = h5num['mask'].get('mask')
+
+    # closure phase file, in the same layout as generate_curls()
+    if curl_file and os.path.isfile(curl_file):
+        print(curl_file+' already exists, skip writing closure phase.')
+        curl_file = None
+    if curl_file:
+        print('writing >>> '+curl_file)
+        h5curl = h5py.File(curl_file,'w')
+        gg_curl = h5curl.create_group(k)
+        curl_name_list = ['_'.join(i) for i in Triangles]
+        for i in range(curl_num):
+            group = gg_curl.create_group(curl_name_list[i])
+            group.create_dataset(curl_name_list[i], shape=(length, width), dtype=np.float32, chunks=True,\
+                                 **writefile.compression_kwargs())
+            for key, value in h5[k][ifgram_list[curls[i,0]]].attrs.items():
+                group.attrs[key] = value
+
+    ##### Loop box by box
+    print('calculating closure phase of %d triangles with threshold of %.2f rad' % (curl_num, thr))
+    # interferograms in float32, closure phase and its absolute value in float64
+    box_list = ut.split_row_box(length, width, ifgram_num+5*curl_num, memory_limit)
+    curl_nonzero_num = np.zeros(curl_num, np.int64)
+    curl_abs_sum = np.zeros(curl_num, np.float64)
+    pixel_num = 0
+    prog_bar = ptime.progress_bar(maxValue=len(box_list))
+    for i in range(len(box_list)):
+        box = box_list[i]
+        box_length = box[3]-box[1]
+        box_width  = box[2]-box[0]
+        data = ut.read_ifgram_box(h5, ifgram_list, box)
+        curl_abs = C.dot(data)
+        del data
+        if curl_file:
+            for j in range(curl_num):
+                gg_curl[curl_name_list[j]][curl_name_list[j]][box[1]:box[3], box[0]:box[2]] = \
+                    curl_abs[j].reshape(box_length, box_width)
+        curl_abs = np.abs(curl_abs)
+        curl_nonzero = curl_abs >= thr
+
+        num_nonzero = np.sum(curl_nonzero, axis=0)
+        mean_abs = np.mean(curl_abs, axis=0)
+        box_mask = mask[box[1]:box[3], box[0]:box[2]].flatten()
+        num_nonzero[~box_mask] = 0
+        mean_abs[~box_mask] = np.nan
+        dset_num[box[1]:box[3], box[0]:box[2]] = num_nonzero.reshape(box_length, box_width)
+        dset_mean[box[1]:box[3], box[0]:box[2]] = mean_abs.reshape(box_length, box_width)
+
+        curl_nonzero_num += np.sum(curl_nonzero[:, box_mask], axis=1)
+        curl_abs_sum += np.sum(curl_abs[:, box_mask], axis=1)
+        pixel_num += np.sum(box_mask)
+        prog_bar.update(i+1, suffix='rows %d-%d' % (box[1], box[3]))
+    prog_bar.close()
+    h5.close()
+    h5out.close()
+    h5num.close()
+    if curl_file:
+        h5curl.close()
 
-Generate closure file for interferograms.
+    ##### Statistics of triangles and interferograms
+    pixel_num = max(pixel_num, 1)
+    curl_nonzero_ratio = curl_nonzero_num / float(pixel_num)
+    curl_abs_mean = curl_abs_sum / float(pixel_num)
 
-example:
+    # interferogram - triangle incidence, sum over triangles with each interferogram
+    C_abs = abs(C)
+    ifgram_curl_num = np.asarray(C_abs.sum(axis=0)).flatten()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ifgram_error_likelihood = C_abs.T.dot(curl_nonzero_ratio) / ifgram_curl_num
+        ifgram_abs_mean = C_abs.T.dot(curl_abs_mean) / ifgram_curl_num
+
+    ##### Text summary
+    txtfile = os.path.splitext(outfile)[0]+'.txt'
+    print('writing >>> '+txtfile)
+    f = open(txtfile, 'w')
+    f.write('# Phase closure of interferograms network in file: '+ifgram_file+'\n')
+    f.write('# number of interferograms: %d\n' % (ifgram_num))
+    f.write('# number of triangles: %d\n' % (curl_num))
+    f.write('# number of triangles with non-zero closure phase: %d\n' % (np.sum(curl_nonzero_num > 0)))
+    f.write('# number of pixels: %d\n' % (pixel_num))
+    f.write('# threshold of non-zero closure phase: %.2f radian\n' % (thr))
+    f.write('# ratio of non-zero closure phase of all triangles/pixels: %.4f\n' % (np.mean(curl_nonzero_ratio)))
+    f.write('# interferograms sorted by unwrapping error likelihood (ratio of non-zero closure phase):\n')
+    f.write('# DATE12\tTriangleNum\tErrorLikelihood\tMeanAbsClosure\n')
+    for i in np.argsort(-np.nan_to_num(ifgram_error_likelihood), kind='mergesort'):
+        f.write('%s\t%d\t%.4f\t%.4f\n' % (date12_list[i], ifgram_curl_num[i], ifgram_error_likelihood[i],\
+                                          ifgram_abs_mean[i]))
+    f.write('# triangles sorted by ratio of pixels with non-zero closure phase:\n')
+    f.write('# Triangle\tNonzeroRatio\tMeanAbsClosure\n')
+    for i in np.argsort(-curl_nonzero_ratio, kind='mergesort'):
+        f.write('%s\t%.4f\t%.4f\n' % ('_'.join(Triangles[i]), curl_nonzero_ratio[i], curl_abs_mean[i]))
+    f.close()
+
+    print('top interferograms with the highest unwrapping error likelihood:')
+    for i in np.argsort(-np.nan_to_num(ifgram_error_likelihood), kind='mergesort')[0:min(10, ifgram_num)]:
+        print('    %s  %.4f' % (date12_list[i], ifgram_error_likelihood[i]))
+    return outfile, numfile, txtfile
+
+
+######################################################################################################
+DESCRIPTION='''Check phase closure of triangles in the network of interferograms.
+  Closure phase of triangle (d1-d2, d1-d3, d2-d3) is: d1-d2 + d2-d3 - d1-d3, calculated box by box on the fly,
+  without the intermediate curls.h5 (unless curl file is given), and summarized into statistics:
+    closure.h5           - mean absolute closure phase of all triangles
+    closureNumNonzero.h5 - number of triangles with non-zero closure phase
+    closure.txt          - per-interferogram and per-triangle statistics
+  For each interferogram, the unwrapping error likelihood is the ratio of non-zero closure phase (>= threshold)
+  of all triangles and pixels including it.
+'''
+
+EXAMPLE='''example:
   ifgram_closure.py  unwrapIfgram.h5
   ifgram_closure.py  unwrapIfgram.h5  curls.h5
-    ''')
-    return
+  ifgram_closure.py  unwrapIfgram.h5  -m mask.h5  -o closure.h5  --thr 1.0  --memory-limit 1
+'''
 
+def cmdLineParse():
+    parser = argparse.ArgumentParser(description=DESCRIPTION,\
+                                     formatter_class=argparse.RawTextHelpFormatter,\
+                                     epilog=EXAMPLE)
 
+    parser.add_argument('ifgram_file', help='interferograms file')
+    parser.add_argument('curl_file', nargs='?',\
+                        help='file to write closure phase of all triangles into, if not existed, i.e. curls.h5\n'+\
+                             'default: no, closure phases are not written out.')
+    parser.add_argument('-o','--outfile', default='closure.h5',\
+                        help='output file name of closure statistics, default: closure.h5\n'+\
+                             'with number of non-zero closure phase in closureNumNonzero.h5 and\n'+\
+                             'text summary in the same basename, i.e. closure.txt')
+    parser.add_argument('-m','--mask', dest='mask_file', help='mask file, pixels with 0 are excluded from statistics')
+    parser.add_argument('--thr', dest='thr', type=float, default=0.5,\
+                        help='threshold in radian for non-zero closure phase, default: 0.5')
+    parser.add_argument('--memory-limit', dest='memory_limit', type=float, default=4.0,\
+                        help='max memory size in GB used for each box of rows, default: 4.')
+
+    inps = parser.parse_args()
+    return inps
+
+
+######################################################################################################
 def main(argv):
-    try:
-        file=argv[0]
-    except:
-        usage(); sys.exit(1)
- 
-    h5file = h5py.File(file)
-    curls,Triangles,C = ut.get_triangles(h5file)
-
-    try:     curlfile = argv[1]
-    except:  curlfile = 'curls.h5'
-
-    if not os.path.isfile(curlfile):
-        ut.generate_curls(curlfile,h5file,Triangles,curls)
-    else:
-        print(curlfile + " already exists!")
+    inps = cmdLineParse()
 
-    return curlfile
+    inps.outfile = ifgram_closure(inps.ifgram_file, inps.outfile, inps.mask_file, inps.thr, inps.memory_limit,\
+                                  inps.curl_file)[0]
+    print('Done.')
+    return inps.outfile
 
 
+######################################################################################################
 if __name__ == '__main__':
     main(sys.argv[1:])
-
@@ -17,18 +17,62 @@ import _pysar_utilities as ut
 ################################################################################################
 EXAMPLE='''example:
   ifgram_inversion.py  unwrapIfgram.h5
+  ifgram_inversion.py  unwrapIfgram.h5  --memory-limit 2
+  ifgram_inversion.py  unwrapIfgram.h5  --method L2_masked
+  ifgram_inversion.py  unwrapIfgram.h5  --method L1
+  ifgram_inversion.py  unwrapIfgram.h5  --method L2_sparse
+  ifgram_inversion.py  unwrapIfgram.h5  --parallel 8
+  ifgram_inversion.py  unwrapIfgram.h5  --update
+  ifgram_inversion.py  unwrapIfgram.h5  --residual-rms
+  ifgram_inversion.py  unwrapIfgram.h5  --std
+  ifgram_inversion.py  unwrapIfgram.h5  --method WLS  --coherence coherence.h5
 '''
 
 def cmdLineParse():
-    parser = argparse.ArgumentParser(description='Inverse network of interferograms into timeseries.',\
+    parser = argparse.ArgumentParser(description='Inverse network of interferograms into timeseries.\n'+\
+                                     'Temporal coherence is calculated in the same pass into temporalCoherence.h5',\
                                      formatter_class=argparse.RawTextHelpFormatter,\
                                      epilog=EXAMPLE)
 
     parser.add_argument('ifgram_file', help='interferograms file to be inversed')
-    parser.add_argument('--method', dest='inverse_method', default='L2', choices=['L1','L2'],\
-                        help='Inverse method, L1 or L2 norm minimization. Default: L2')
+    parser.add_argument('--method', dest='inverse_method', default='L2', choices=['L1','L2','L2_masked','L2_sparse','WLS'],\
+                        help='Inverse method, default: L2\n'+\
+                             'L1        - L1 norm minimization with iteratively reweighted least squares,\n'+\
+                             '            pixels converged (1) or not (0, use L2 instead) saved in L1orL2.h5\n'+\
+                             'L2        - L2 norm minimization\n'+\
+                             'L2_masked - L2 norm minimization excluding zero value (un-unwrapped) pixels\n'+\
+                             '            of each interferogram, pixels are grouped by pattern of valid\n'+\
+                             '            interferograms and inversed group by group.\n'+\
+                             'L2_sparse - L2 norm minimization with sparse design matrix and factorization,\n'+\
+                             '            for long stacks with 1000+ acquisitions / 10k+ interferograms\n'+\
+                             'WLS       - weighted least squares with spatial coherence as weight')
+    parser.add_argument('--coherence', dest='coherence_file',\
+                        help='spatial coherence file used as weight for WLS inversion\n'+\
+                             'default: coherence.h5 in the same directory as the interferograms file')
     parser.add_argument('-o','--output', dest='timeseries_file', default='timeseries.h5',\
                         help='output file name. Default: timeseries.h5')
+    parser.add_argument('--memory-limit', dest='memory_limit', type=float, default=4.0,\
+                        help='max memory size in GB used for each box of rows while inversing, default: 4.\n'+\
+                             'Interferograms are read and inversed box by box to fit within this limit.')
+    parser.add_argument('--parallel', dest='parallel', type=int, default=1, metavar='NUM_WORKER',\
+                        help='number of processes to inverse boxes in parallel, default: 1 (disabled).\n'+\
+                             'Limited by max core number set in pysar/_settings.py: parallel_num.')
+    parser.add_argument('--design-matrix-cache', dest='design_matrix_cache_dir', metavar='DIR',\
+                        help='directory to cache design matrix and its inverse on disk (designMatrix.h5),\n'+\
+                             'for re-use by later runs with the same network. default: no, in memory only.')
+    parser.add_argument('--update', dest='update_mode', action='store_true',\
+                        help='Update existing timeseries file with interferograms of new acquisitions,\n'+\
+                             'reading only the existing timeseries and new interferograms, with the same result\n'+\
+                             'as the whole L2 inversion. L2 method only.\n'+\
+                             'Run the whole inversion if output file does not exist or is not from L2 inversion\n'+\
+                             'of the network of existing acquisitions.')
+    parser.add_argument('--residual-rms', dest='residual_rms', action='store_true',\
+                        help='write RMS of phase residual between interferograms and time series into\n'+\
+                             'residualRMS.h5 file, in the same directory as the output file.')
+    parser.add_argument('--std', dest='timeseries_std', action='store_true',\
+                        help='write posterior standard deviation of each acquisition into timeseriesStd.h5 file,\n'+\
+                             'in the same directory as the output file. L2 method only.\n'+\
+                             'Derived from residual variance of each pixel and (B^T*B)^-1 of the network.')
 
     inps = parser.parse_args()
     return inps
@@ -44,13 +88,24 @@ def main(argv):
     if not k == 'interferograms':
         sys.exit('ERROR: only interferograms file supported, input is '+k+' file!')
 
+    if inps.inverse_method == 'WLS' and not inps.coherence_file:
+        inps.coherence_file = os.path.join(os.path.dirname(os.path.abspath(inps.ifgram_file)), 'coherence.h5')
+
+    if inps.design_matrix_cache_dir:
+        os.environ['PYSAR_DESIGN_MATRIX_CACHE_DIR'] = inps.design_matrix_cache_dir
+
     # Network Inversion
-    if not inps.inverse_method == 'L1':
-        print('Inverse time-series using L2 norm minimization')
-        ut.timeseries_inversion(inps.ifgram_file, inps.timeseries_file)
-    else:
-        print('Inverse time-series using L1 norm minimization')
-        ut.timeseries_inversion_L1(inps.ifgram_file, inps.timeseries_file)
+    if inps.update_mode and os.path.isfile(inps.timeseries_file):
+        if not inps.inverse_method == 'L2':
+            sys.exit('ERROR: --update is supported for L2 method only, input is '+inps.inverse_method)
+        print('Update time-series with interferograms of new acquisitions')
+        ut.timeseries_inversion_incremental(inps.ifgram_file, inps.timeseries_file, inps.memory_limit)
+        return inps.timeseries_file
+
+    print('Inverse time-series using '+inps.inverse_method+' method')
+    ut.timeseries_inversion(inps.ifgram_file, inps.timeseries_file, inps.memory_limit, inps.inverse_method,\
+                            inps.parallel, inps.coherence_file, inps.residual_rms,\
+                            inps.timeseries_std)
 
     return inps.timeseries_file
 
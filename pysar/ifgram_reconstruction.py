@@ -5,6 +5,7 @@
 # Author:  Heresh Fattahi                                  #
 ############################################################
 
+import os
 import sys
 import getopt
 import time
@@ -15,6 +16,7 @@ import numpy as np
 
 import _datetime as ptime
 import _readfile as readfile
+import _writefile as writefile
 import _pysar_utilities as ut
 
 
@@ -77,7 +79,11 @@ def main(argv):
 
     #####  Estimate interferograms from timeseries
     print('estimating interferograms from timeseries using design matrix from input interferograms')
-    A,B = ut.design_matrix(ifgram_file)
+    h5 = h5py.File(ifgram_file,'r')
+    ifgram_list = sorted(h5['interferograms'].keys())
+    ifgram_num = len(ifgram_list)
+    date12_list = ptime.list_ifgram2date12(ifgram_list)
+    A = ut.design_matrix_factorization(date12_list)['A']
     p = -1*np.ones([A.shape[0],1])
     Ap = np.hstack((p,A))
     estData = np.dot(Ap, timeseries)
@@ -85,10 +91,6 @@ def main(argv):
 
     ##### Write interferograms file
     print('writing >>> '+outfile)
-    h5 = h5py.File(ifgram_file,'r')
-    ifgram_list = sorted(h5['interferograms'].keys())
-    ifgram_num = len(ifgram_list)
-    date12_list = ptime.list_ifgram2date12(ifgram_list)
     
     h5out = h5py.File(outfile,'w')
     group = h5out.create_group('interferograms')
@@ -100,7 +102,7 @@ def main(argv):
         data = np.reshape(estData[i,:],(length, width))
 
         gg = group.create_group(ifgram)
-        dset = gg.create_dataset(ifgram, data=data, compression='gzip')
+        dset = gg.create_dataset(ifgram, data=data, **writefile.compression_kwargs())
         for key, value in h5['interferograms'][ifgram].attrs.items():
             gg.attrs[key] = value
         prog_bar.update(i+1, suffix=date12_list[i])
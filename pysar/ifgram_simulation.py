@@ -16,6 +16,7 @@ import random
 
 import _datetime as ptime
 import _readfile as readfile
+import _writefile as writefile
 
 
 ##############################################################################################
@@ -127,7 +128,7 @@ def main(argv):
             print(ifgram)
 
         gg = group.create_group(ifgram)
-        dset = gg.create_dataset(ifgram, data=unw[y0:y1,x0:x1], compression='gzip')
+        dset = gg.create_dataset(ifgram, data=unw[y0:y1,x0:x1], **writefile.compression_kwargs())
 
         for key, value in h5[k][ifgram].attrs.items():
             gg.attrs[key] = value
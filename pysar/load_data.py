@@ -17,6 +17,7 @@ import numpy as np
 import shutil
 
 import _readfile as readfile
+import _writefile as writefile
 import _pysar_utilities as ut
 from _readfile import multi_group_hdf5_file, multi_dataset_hdf5_file, single_dataset_hdf5_file
 
@@ -260,7 +261,7 @@ def load_multi_group_hdf5(fileType, fileList, hdf5File='unwrapIfgram.h5', extra_
 
             # Write dataset
             group = gg.create_group(os.path.basename(file))
-            dset = group.create_dataset(os.path.basename(file), data=data, compression='gzip')
+            dset = group.create_dataset(os.path.basename(file), data=data, **writefile.compression_kwargs())
 
             # Write attributes
             for key, value in atr.items():
@@ -301,7 +302,7 @@ def load_single_dataset_hdf5(file_type, infile, outfile, extra_meta_dict=dict())
             print('writing >>> '+outfile)
             h5 = h5py.File(outfile, 'w')
             group = h5.create_group(file_type)
-            dset = group.create_dataset(file_type, data=data, compression='gzip')
+            dset = group.create_dataset(file_type, data=data, **writefile.compression_kwargs())
 
             # Write output file - attributes
             for key, value in atr.items():
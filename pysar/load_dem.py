@@ -3,6 +3,7 @@ import os
 import sys
 import h5py
 import _readfile as readfile
+import _writefile as writefile
 
 try:
     demFile = sys.argv[1]
@@ -37,7 +38,7 @@ print('writing >>> '+outName)
 h5=h5py.File(outName,'w')
 group=h5.create_group('dem')
 
-dset = group.create_dataset('dem', data=dem, compression='gzip')
+dset = group.create_dataset('dem', data=dem, **writefile.compression_kwargs())
 
 for key , value in demRsc.items():
      group.attrs[key]=value
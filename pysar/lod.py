@@ -78,7 +78,7 @@ def correct_lod_file(File, outFile=None):
                 data -= Ramp*dt
                  
                 gg = group.create_group(epoch)
-                dset = gg.create_dataset(epoch, data=data, compression='gzip')
+                dset = gg.create_dataset(epoch, data=data, **writefile.compression_kwargs())
                 for key, value in atr.items():
                     gg.attrs[key] = value
 
@@ -92,7 +92,7 @@ def correct_lod_file(File, outFile=None):
                 
                 data -= Ramp*tbase[i]
                 
-                dset = group.create_dataset(epoch, data=data, compression='gzip')
+                dset = group.create_dataset(epoch, data=data, **writefile.compression_kwargs())
             for key, value in atr.items():
                 group.attrs[key] = value
         else:
@@ -10,6 +10,8 @@ import numpy as np
 import getopt
 import h5py
 
+import _writefile as writefile
+
 
 ############################################################
 def usage():
@@ -55,7 +57,7 @@ def main(argv):
     
         h5file2 = h5py.File('look_angle.h5','w')
         group=h5file2.create_group('mask')
-        dset = group.create_dataset('mask', data=look_angle, compression='gzip')
+        dset = group.create_dataset('mask', data=look_angle, **writefile.compression_kwargs())
     
         for key, value in h5file['velocity'].attrs.items():
               group.attrs[key] = value
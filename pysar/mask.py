@@ -97,7 +97,7 @@ def mask_file(File, maskFile, outFile=None, inps_dict=None):
 
             unw = mask_matrix(unw,mask)
 
-            dset = group.create_dataset(d, data=unw, compression='gzip')
+            dset = group.create_dataset(d, data=unw, **writefile.compression_kwargs())
         for key,value in atr.items():   group.attrs[key] = value
 
     elif k in ['interferograms','wrapped','coherence']:
@@ -127,7 +127,7 @@ def mask_file(File, maskFile, outFile=None, inps_dict=None):
             unw = mask_matrix(unw,mask)
 
             group = gg.create_group(igram)
-            dset = group.create_dataset(igram, data=unw, compression='gzip')
+            dset = group.create_dataset(igram, data=unw, **writefile.compression_kwargs())
             for key, value in h5file[k][igram].attrs.items():
                 group.attrs[key] = value
 
@@ -19,6 +19,7 @@ import _datetime as ptime
 import _network as pnet
 import _pysar_utilities as ut
 import _readfile as readfile
+import _writefile as writefile
 import subset as subset
 
 
@@ -151,7 +152,7 @@ def modify_file_date12_list(File, date12_to_rmv, mark_attribute=False, outFile=N
     
             data = h5[k][igram].get(igram)[:]
             group = gg.create_group(igram)
-            dset = group.create_dataset(igram, data=data, compression='gzip')
+            dset = group.create_dataset(igram, data=data, **writefile.compression_kwargs())
             for key, value in h5[k][igram].attrs.items():
                 group.attrs[key] = value
             group.attrs['drop_ifgram'] = 'no'
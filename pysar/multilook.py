@@ -146,7 +146,7 @@ def multilook_file(infile,lks_y,lks_x,outfile=None):
                 atr_mli = multilook_attribute(atr,lks_y,lks_x,print_msg=False)
 
                 gg = group.create_group(epoch)
-                dset = gg.create_dataset(epoch, data=data_mli, compression='gzip')
+                dset = gg.create_dataset(epoch, data=data_mli, **writefile.compression_kwargs())
                 for key, value in atr_mli.items():
                     gg.attrs[key] = value
                 prog_bar.update(i+1, suffix=date12_list[i])
@@ -159,7 +159,7 @@ def multilook_file(infile,lks_y,lks_x,outfile=None):
 
                 data_mli = multilook_matrix(data,lks_y,lks_x)
                 
-                dset = group.create_dataset(epoch, data=data_mli, compression='gzip')
+                dset = group.create_dataset(epoch, data=data_mli, **writefile.compression_kwargs())
                 prog_bar.update(i+1, suffix=epoch)
             atr = h5[k].attrs
             atr_mli = multilook_attribute(atr,lks_y,lks_x)
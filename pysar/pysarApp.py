@@ -231,6 +231,7 @@ pysar.corFiles           = auto  #[filt*.cor, filt_*.cor], path of all coherence
 pysar.transFile          = auto  #[geomap*.trans, sim*.UTM_TO_RDC], path of mapping transformation file
 pysar.demFile.radarCoord = auto  #[radar*.hgt, sim*.hgt_sim], path of DEM in radar coordinate
 pysar.demFile.geoCoord   = auto  #[*.dem, sim*.utm.dem],      path of DEM in geo   coordinate
+pysar.compression        = auto  #[none / lzf / gzip / gzip1-9 / shuffle+lzf], auto for gzip, compression of HDF5 files
 
 
 ## 1.1 Subset (optional, --subset to exit after this step)
@@ -312,6 +313,7 @@ pysar.topoError              = auto    #[yes / no], auto for yes
 pysar.topoError.polyOrder    = auto    #[1 / 2 / 3], auto for 2, polynomial order of temporal deformation model
 pysar.topoError.excludeDate  = auto    #[20101120 / txtFile / no], auto for no, date not used for error estimation
 pysar.topoError.stepFuncDate = auto    #[20080529 / no], auto for no, date of step jump, i.e. eruption/earthquake date
+pysar.topoError.parallel     = auto    #[yes / no], auto for no, process boxes in parallel with pysar.parallel_num cores
 
 
 ## 8.1 Phase Residual Root Mean Square
@@ -523,6 +525,16 @@ def main(argv):
     inps.template_file = os.path.abspath(inps.template_file)
     template = readfile.read_template(inps.template_file)
 
+    # Compression of HDF5 files, passed to all the following scripts by environment variable
+    key = 'pysar.compression'
+    if key in list(template.keys()) and template[key] != 'auto':
+        os.environ['PYSAR_COMPRESSION'] = template[key]
+        try:
+            print('compression of HDF5 files: '+str(writefile.compression_kwargs()))
+        except ValueError as e:
+            print('ERROR: '+str(e))
+            sys.exit(1)
+
     # Get existing tropo delay file
     inps.trop_model = 'ECMWF'
     key = 'pysar.troposphericDelay.weatherModel'
@@ -751,13 +763,17 @@ def main(argv):
     # Temporal Coherence: 
     #   A parameter to evaluate the consistency 
     #   of timeseries with the interferograms
+    #   Calculated by ifgram_inversion.py in the same pass,
+    #   re-calculate only if missing or older than timeseries
     ##############################################
     print('\n********** Temporal Coherence file  *********')
     inps.temp_coh_file = 'temporalCoherence.h5'
     tempCohCmd = 'temporal_coherence.py '+inps.ifgram_file+' '+inps.timeseries_file+' '+inps.temp_coh_file
-    print(tempCohCmd)
     if ut.update_file(inps.temp_coh_file, inps.timeseries_file):
+        print(tempCohCmd)
         os.system(tempCohCmd)
+    else:
+        print(inps.temp_coh_file+' is up to date with '+inps.timeseries_file+', skip temporal_coherence.py')
 
     print('\n--------------------------------------------')
     print('Update Mask based on Temporal Coherence ...')
@@ -9,6 +9,8 @@ import sys
 import h5py
 from scipy.ndimage.filters import laplace
 
+import _writefile as writefile
+
 
 ##############################################################################
 def usage():
@@ -49,18 +51,18 @@ def main(argv):
         unw=dset[0:dset.shape[0],0:dset.shape[1]]
         Lunw=laplace(unw)
         g=group.create_group(ifgram)
-        g.create_dataset(ifgram,data=Lunw,compression='gzip')
+        g.create_dataset(ifgram,data=Lunw,**writefile.compression_kwargs())
         for key, value in h5file['interferograms'][ifgram].attrs.items():
             g.attrs[key] = value
   
     gm = h5laplace.create_group('mask')
     mask = h5file['mask'].get('mask')
-    dset = gm.create_dataset('mask', data=mask, compression='gzip')
+    dset = gm.create_dataset('mask', data=mask, **writefile.compression_kwargs())
   
     try:
         meanCoherence = h5file['meanCoherence'].get('meanCoherence')
         gc = h5laplace.create_group('meanCoherence')
-        dset = gc.create_dataset('meanCoherence', data=meanCoherence, compression='gzip')
+        dset = gc.create_dataset('meanCoherence', data=meanCoherence, **writefile.compression_kwargs())
     except:
         print('')   
   
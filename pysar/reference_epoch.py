@@ -15,6 +15,7 @@ import matplotlib as mpl
 mpl.use('Agg')
 
 import _readfile as readfile
+import _writefile as writefile
 import _datetime as ptime
 import _pysar_utilities as ut
 
@@ -99,7 +100,7 @@ def ref_date_file(inFile, ref_date, outFile=None):
     for i in range(date_num):
         date = date_list[i]
         data = h5[k].get(date)[:]
-        dset = group.create_dataset(date, data=data-ref_data, compression='gzip')
+        dset = group.create_dataset(date, data=data-ref_data, **writefile.compression_kwargs())
         prog_bar.update(i+1, suffix=date)
     prog_bar.close()
     h5.close()
@@ -11,6 +11,8 @@ import sys
 import h5py
 import numpy as np
 
+import _writefile as writefile
+
 
 def usage():
     print('''usage: rewrap.py  ifgram_file   [output_name]
@@ -48,7 +50,7 @@ def main(argv):
         unw = h5['interferograms'][ifgram].get(ifgram)[:]
         rewrapped = rewrap(unw)
         group = gg.create_group(ifgram)
-        dset = group.create_dataset(ifgram, data=rewrapped, compression='gzip')
+        dset = group.create_dataset(ifgram, data=rewrapped, **writefile.compression_kwargs())
         for key, value in h5['interferograms'][ifgram].attrs.items():
             group.attrs[key] = value
 
@@ -508,7 +508,7 @@ def subset_file(File, subset_dict_input, outFile=None):
             data = np.ones((pix_box[3]-pix_box[1], pix_box[2]-pix_box[0]))*subset_dict['fill_value']
             data[pix_box4subset[1]:pix_box4subset[3], pix_box4subset[0]:pix_box4subset[2]] = data_overlap
 
-            dset = group.create_dataset(epoch, data=data, compression='gzip')
+            dset = group.create_dataset(epoch, data=data, **writefile.compression_kwargs())
             prog_bar.update(i+1, suffix=epoch)
 
         atr_dict = subset_attribute(atr_dict, pix_box)
@@ -528,7 +528,7 @@ def subset_file(File, subset_dict_input, outFile=None):
 
             atr_dict  = subset_attribute(atr_dict, pix_box, print_msg=False)
             gg = group.create_group(epoch)
-            dset = gg.create_dataset(epoch, data=data, compression='gzip')
+            dset = gg.create_dataset(epoch, data=data, **writefile.compression_kwargs())
             for key, value in atr_dict.items():
                 gg.attrs[key] = value
             prog_bar.update(i+1, suffix=date12_list[i])
@@ -13,6 +13,7 @@ import numpy as np
 
 import _datetime as ptime
 import _readfile as readfile
+import _writefile as writefile
 
 
 #####################################################################
@@ -91,7 +92,7 @@ def main(argv):
     for i in range(date_num):
         date = dateList[i]
         d = np.reshape(sumD[i][:],[length,width])
-        dset = group.create_dataset(date, data=d, compression='gzip')
+        dset = group.create_dataset(date, data=d, **writefile.compression_kwargs())
         prog_bar.update(i+1, suffix=date)
     prog_bar.close()
 
@@ -7,7 +7,9 @@
 #
 
 
+import os
 import sys
+import argparse
 
 import h5py
 import numpy as np
@@ -19,11 +21,51 @@ import _pysar_utilities as ut
 
 
 ######################################################################################################
-def temporal_coherence(timeseriesFile, ifgramFile):
+def temporal_coherence_patch(timeseriesFile, ifgramFile, box, inps_dict):
+    '''Calculate temporal coherence within the box
+    Inputs:
+        timeseriesFile - string, path of time series file
+        ifgramFile     - string, path of interferograms file
+        box            - 4-tuple of int, area to calculate, defined in (x0, y0, x1, y1)
+        inps_dict      - dict, with the following items:
+                         ifgram_list - list of string, interferograms used
+                         date_list   - list of string, dates of time series in YYYYMMDD format
+                         A           - 2D np.array in size of (ifgram_num, date_num), design matrix
+                         ref_value   - 1D np.array in size of (ifgram_num,), phase of reference pixel
+                         range2phase - float, factor to convert displacement from meter to radian
+    Output:
+        temp_coh - 1D np.array in size of (pixel_num_of_box,), temporal coherence in float32
+    '''
+    date_list = inps_dict['date_list']
+    pixel_num = (box[2]-box[0]) * (box[3]-box[1])
+
+    # read time series and interferograms of the box
+    h5timeseries = h5py.File(timeseriesFile, 'r')
+    timeseries = np.array(readfile.read_epoch_box(h5timeseries, 'timeseries', date_list, box)\
+                          .reshape(len(date_list), pixel_num), np.float32)
+    h5timeseries.close()
+    timeseries *= inps_dict['range2phase']
+
+    h5ifgram = h5py.File(ifgramFile, 'r')
+    data = ut.read_ifgram_box(h5ifgram, inps_dict['ifgram_list'], box, inps_dict['ref_value'])
+    h5ifgram.close()
+
+    # difference between observed and estimated phase of all interferograms at once
+    data -= np.dot(inps_dict['A'], timeseries)
+    del timeseries
+    temp_coh = np.abs(np.sum(np.exp(1j*data, dtype=np.complex64), axis=0)) / data.shape[0]
+    return np.array(temp_coh, np.float32)
+
+
+def temporal_coherence(timeseriesFile, ifgramFile, memory_limit=4.0, parallel=1):
     '''Calculate temporal coherence based on input timeseries file and interferograms file
+    Interferograms and time series are read and calculated box by box (consecutive rows),
+    so that the max memory usage depends on memory_limit, not on the size of dataset.
     Inputs:
         timeseriesFile - string, path of time series file
         ifgramFile     - string, path of interferograms file
+        memory_limit   - float, max memory size in GB used for one box
+        parallel       - int, number of processes to calculate boxes in parallel, 1 to disable
     Output:
         temp_coh - 2D np.array, temporal coherence in float32
     '''
@@ -32,42 +74,25 @@ def temporal_coherence(timeseriesFile, ifgramFile):
     atr_ts = readfile.read_attribute(timeseriesFile)
     length = int(atr_ts['FILE_LENGTH'])
     width = int(atr_ts['WIDTH'])
-    pixel_num = length * width
-
-    # Read time series data
-    h5timeseries = h5py.File(timeseriesFile, 'r')
-    date_list = sorted(h5timeseries['timeseries'].keys())
-    date_num = len(date_list)
-
-    print("load time series: "+timeseriesFile)
-    print('number of acquisitions: '+str(date_num))
-    timeseries = np.zeros((date_num, pixel_num), np.float32)
-    prog_bar = ptime.progress_bar(maxValue=date_num, prefix='loading: ')
-    for i in range(date_num):
-        date = date_list[i]
-        d = h5timeseries['timeseries'].get(date)[:]
-        timeseries[i][:] = d.flatten(0)
-        prog_bar.update(i+1, suffix=date)
-    prog_bar.close()
-    h5timeseries.close()
-
-    # Convert displacement from meter to radian
-    range2phase = -4*np.pi/float(atr_ts['WAVELENGTH'])
-    timeseries *= range2phase
 
     # interferograms data
     print("interferograms file: " + ifgramFile)
     atr_ifgram = readfile.read_attribute(ifgramFile)
     h5ifgram   = h5py.File(ifgramFile, 'r')
-    ifgram_list = sorted(h5ifgram['interferograms'].keys())
+    ifgram_list = readfile.read_epoch_list(h5ifgram, 'interferograms')
     ifgram_list = ut.check_drop_ifgram(h5ifgram, atr_ifgram, ifgram_list)
     ifgram_num = len(ifgram_list)
 
     # Design matrix
     date12_list = ptime.list_ifgram2date12(ifgram_list)
-    A1,B = ut.design_matrix(ifgramFile, date12_list)
+    A1 = ut.design_matrix_factorization(date12_list)['A']
     A0 = -1*np.ones([ifgram_num,1])
-    A = np.hstack((A0, A1))
+    A = np.array(np.hstack((A0, A1)), np.float32)
+
+    # Dates of time series in the same order as design matrix
+    date_list = ptime.yyyymmdd(sorted(list(set(sum([i.split('-') for i in date12_list], [])))))
+    print("time series file: "+timeseriesFile)
+    print('number of acquisitions: '+str(len(date_list)))
 
     # Get reference pixel
     try:
@@ -76,34 +101,38 @@ def temporal_coherence(timeseriesFile, ifgramFile):
         print('find reference pixel in y/x: [%d, %d]'%(ref_y, ref_x))
     except ValueError:
         print('No ref_x/y found! Can not calculate temporal coherence without it.')
-    
-    print('calculating temporal coherence interferogram by interferogram ...')
-    print('number of interferograms: '+str(ifgram_num))
-    temp_coh = np.zeros(pixel_num, dtype=np.float32)+0j
-    prog_bar = ptime.progress_bar(maxValue=ifgram_num, prefix='calculating: ')
-    for i in range(ifgram_num):
-        ifgram = ifgram_list[i]
-        # read interferogram
-        data = h5ifgram['interferograms'][ifgram].get(ifgram)[:]
-        data -= data[ref_y, ref_x]
-        data = data.flatten(0)
-
-        # calculate difference between observed and estimated data
-        dataEst  = np.dot(A[i,:], timeseries)
-        dataDiff = data - dataEst
-        temp_coh += np.exp(1j*dataDiff)
-        prog_bar.update(i+1, suffix=date12_list[i])
-    prog_bar.close()
-    del timeseries, data, dataEst, dataDiff
+    ref_value = ut.read_ifgram_box(h5ifgram, ifgram_list, (ref_x, ref_y, ref_x+1, ref_y+1)).flatten()
     h5ifgram.close()
 
-    temp_coh = np.array((np.absolute(temp_coh)/ifgram_num).reshape((length,width)), dtype=np.float32)
+    inps_dict = dict(ifgram_list=ifgram_list, date_list=date_list, A=A, ref_value=ref_value,\
+                     range2phase=-4*np.pi/float(atr_ts['WAVELENGTH']))
+
+    print('calculating temporal coherence box by box ...')
+    print('number of interferograms: '+str(ifgram_num))
+    num_cores, enable_parallel = 1, False
+    if parallel > 1:
+        num_cores, enable_parallel, Parallel, delayed = ut.check_parallel(min(parallel, length))
+    # time series, interferograms / residual in float32 and complex64
+    box_list = ut.split_row_box(length, width, len(date_list)+3*ifgram_num, memory_limit/num_cores, num_cores)
+    box_num = len(box_list)
+    temp_coh = np.zeros((length, width), np.float32)
+    prog_bar = ptime.progress_bar(maxValue=box_num, prefix='calculating: ')
+    for i in range(0, box_num, num_cores):
+        box_sublist = box_list[i:i+num_cores]
+        if enable_parallel:
+            out_list = Parallel(n_jobs=num_cores)(delayed(temporal_coherence_patch)(timeseriesFile, ifgramFile,\
+                                                                                    box, inps_dict)\
+                                                  for box in box_sublist)
+        else:
+            out_list = [temporal_coherence_patch(timeseriesFile, ifgramFile, box, inps_dict) for box in box_sublist]
+        for box, out in zip(box_sublist, out_list):
+            temp_coh[box[1]:box[3], box[0]:box[2]] = out.reshape(box[3]-box[1], box[2]-box[0])
+        prog_bar.update(i+len(box_sublist), suffix='rows %d-%d' % (box_sublist[0][1], box_sublist[-1][3]))
+    prog_bar.close()
     return temp_coh
 
 
 ######################################################################################################
-USAGE='''usage: temporal_coherence.py [-h] interferograms_file timeseries_file [ output_file ]'''
-
 DESCRIPTION='''Generates temporal coherence map.'''
 
 REFERENCE='''reference:
@@ -116,28 +145,38 @@ REFERENCE='''reference:
 EXAMPLE='''example:
   temporal_coherence.py  unwrapIfgram.h5  timeseries.h5
   temporal_coherence.py  unwrapIfgram.h5  timeseries.h5  temporalCoherence.h5
+  temporal_coherence.py  unwrapIfgram.h5  timeseries.h5  --memory-limit 1  --parallel 4
 '''
 
-def usage():
-    print(USAGE+'\n\n'+DESCRIPTION+'\n\n'+REFERENCE+'\n'+EXAMPLE)
-    return
+def cmdLineParse():
+    parser = argparse.ArgumentParser(description=DESCRIPTION,\
+                                     formatter_class=argparse.RawTextHelpFormatter,\
+                                     epilog=REFERENCE+'\n'+EXAMPLE)
+
+    parser.add_argument('ifgram_file', help='interferograms file')
+    parser.add_argument('timeseries_file', help='timeseries file inversed from interferograms file')
+    parser.add_argument('outfile', nargs='?', default='temporalCoherence.h5',\
+                        help='output file name, default: temporalCoherence.h5')
+    parser.add_argument('--memory-limit', dest='memory_limit', type=float, default=4.0,\
+                        help='max memory size in GB used for each box of rows, default: 4.')
+    parser.add_argument('--parallel', dest='parallel', type=int, default=1, metavar='NUM_WORKER',\
+                        help='number of processes to calculate boxes in parallel, default: 1 (disabled).\n'+\
+                             'Limited by max core number set in pysar/_settings.py: parallel_num.')
+
+    inps = parser.parse_args()
+    return inps
 
 
 ######################################################################################################
 def main(argv):
-    try:
-        ifgramFile     = argv[0]
-        timeseriesFile = argv[1]
-    except:
-        usage(); sys.exit()
+    inps = cmdLineParse()
 
-    temp_coherence = temporal_coherence(timeseriesFile, ifgramFile)
+    temp_coherence = temporal_coherence(inps.timeseries_file, inps.ifgram_file, inps.memory_limit, inps.parallel)
 
-    try:    tempCohFile = argv[2]
-    except: tempCohFile = 'temporalCoherence.h5'
+    tempCohFile = inps.outfile
     print('writing >>> '+tempCohFile)
     
-    atr = readfile.read_attribute(timeseriesFile)
+    atr = readfile.read_attribute(inps.timeseries_file)
     atr['FILE_TYPE'] = 'temporal_coherence'
     atr['UNIT'] = '1'
     writefile.write(temp_coherence, atr, tempCohFile)
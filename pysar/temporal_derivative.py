@@ -15,6 +15,7 @@ import numpy as np
 
 import _datetime as ptime
 import _readfile as readfile
+import _writefile as writefile
 
 
 ############################################################################
@@ -83,7 +84,7 @@ def main(argv):
     prog_bar = ptime.progress_bar(maxValue=date_num-1)
     for i in range(date_num-1):
         date = date_list[i+1]
-        dset = group.create_dataset(date, data=np.reshape(timeseries_1st[i][:],[length,width]), compression='gzip')
+        dset = group.create_dataset(date, data=np.reshape(timeseries_1st[i][:],[length,width]), **writefile.compression_kwargs())
         prog_bar.update(i+1, suffix=date)
     for key,value in atr.items():
         group.attrs[key] = value
@@ -98,7 +99,7 @@ def main(argv):
     prog_bar = ptime.progress_bar(maxValue=date_num-2)
     for i in range(date_num-2):
         date = date_list[i+2]
-        dset = group.create_dataset(date, data=np.reshape(timeseries_2nd[i][:],[length,width]), compression='gzip')
+        dset = group.create_dataset(date, data=np.reshape(timeseries_2nd[i][:],[length,width]), **writefile.compression_kwargs())
         prog_bar.update(i+1, suffix=date)
     for key,value in atr.items():
         group.attrs[key] = value
@@ -15,6 +15,7 @@ import numpy as np
 
 import _datetime as ptime
 import _readfile as readfile
+import _writefile as writefile
 
 
 ############################################################
@@ -108,7 +109,7 @@ def main(argv):
     for i in range(date_num):
         date = date_list[i]
         data = np.reshape(timeseries_filt[i,:], [length, width])
-        dset = group.create_dataset(date, data=data-ref_data, compression='gzip')
+        dset = group.create_dataset(date, data=data-ref_data, **writefile.compression_kwargs())
         prog_bar.update(i+1, suffix=date)
     for key,value in atr.items():
         group.attrs[key] = value
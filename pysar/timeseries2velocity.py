@@ -19,6 +19,7 @@ import h5py
 import _datetime as ptime
 import _readfile as readfile
 import _writefile as writefile
+import _pysar_utilities as ut
 
 
 ############################################################################
@@ -126,6 +127,82 @@ def read_template2inps(template_file, inps=None):
     return inps
 
 
+def design_matrix(date_list, poly_order=1, periods=[], step_dates=[]):
+    '''Design matrix of temporal deformation model
+    Inputs:
+        date_list  - list of string, date in YYYYMMDD format
+        poly_order - int, polynomial order, 1 for linear velocity, 2 for acceleration, 3 for acceleration rate
+        periods    - list of float, period in years of sinusoidal terms, i.e. [1.0, 0.5] for annual and semi-annual
+        step_dates - list of string, date of step jump in YYYYMMDD format
+    Outputs:
+        B          - 2D np.array in size of (date_num, param_num), with velocity in the 1st column
+                     and constant offset in the 2nd column
+        param_list - list of string, name / suffix of output file for each parameter
+        unit_list  - list of string, unit of each parameter
+    Time is relative to the 1st date, thus velocity is at the 1st date and offset is the displacement at the 1st date.
+    Absolute decimal years are not used, as they make B^T*B badly conditioned.
+    '''
+    dates, datevector = ptime.date_list2vector(date_list)
+    datevector = np.array(datevector)
+    tbase = datevector - datevector[0]
+
+    B = [tbase, np.ones(len(datevector))]
+    param_list = ['', 'Offset']
+    unit_list = ['m/yr', 'm']
+    if poly_order >= 2:
+        B.append(tbase**2 / 2.0)
+        param_list.append('Acc')
+        unit_list.append('m/yr^2')
+    if poly_order >= 3:
+        B.append(tbase**3 / 6.0)
+        param_list.append('AccRate')
+        unit_list.append('m/yr^3')
+    for period in periods:
+        B.append(np.sin(2*np.pi*tbase/period))
+        B.append(np.cos(2*np.pi*tbase/period))
+        param_list += ['Sin%gyr' % period, 'Cos%gyr' % period]
+        unit_list += ['m', 'm']
+    yy_list = np.array(ptime.yyyymmdd2years(list(date_list)))
+    for step_date in step_dates:
+        B.append(np.array(yy_list >= ptime.yyyymmdd2years(step_date), np.float64))
+        param_list.append('Step'+step_date)
+        unit_list.append('m')
+    B = np.array(B).T
+    return B, param_list, unit_list
+
+
+def estimate_velocity_patch(h5file, date_list, box, B, BtB_inv):
+    '''Estimate temporal deformation model of timeseries within the box,
+    by streaming one date at a time and accumulating B^T*d and d^T*d, without residual cube in memory.
+    Inputs:
+        h5file   - HDF5 file object of timeseries file
+        date_list - list of string, dates used in estimation
+        box      - 4-tuple of int, area to process, defined in (x0, y0, x1, y1)
+        B        - 2D np.array in size of (date_num, param_num), design matrix
+        BtB_inv  - 2D np.array in size of (param_num, param_num), inverse of B^T*B
+    Outputs:
+        X    - 2D np.array in size of (param_num, pixel_num_of_box), estimated parameters
+        rmse - 1D np.array in size of (pixel_num_of_box,), root mean square error of residual
+        std  - 1D np.array in size of (pixel_num_of_box,), standard deviation of estimated velocity
+    '''
+    date_num, param_num = B.shape
+    pixel_num = (box[3]-box[1]) * (box[2]-box[0])
+    Btd = np.zeros((param_num, pixel_num))
+    dtd = np.zeros(pixel_num)
+    for i in range(date_num):
+        d = np.array(h5file['timeseries'].get(date_list[i])[box[1]:box[3], box[0]:box[2]], np.float64).flatten()
+        Btd += B[i,:].reshape(-1,1) * d
+        dtd += d**2
+
+    # Least squares solution and sum of square of residual: d^T*d - X^T*B^T*d
+    X = np.dot(BtB_inv, Btd)
+    ssr = dtd - np.sum(X * Btd, axis=0)
+    ssr[ssr < 0.] = 0.
+    rmse = np.sqrt(ssr / date_num)
+    std = np.sqrt(ssr / (date_num - param_num) * BtB_inv[0,0])
+    return X, rmse, std
+
+
 ############################################################################
 EXAMPLE='''example:
   timeseries2velocity.py  timeSeries_ECMWF_demCor.h5
@@ -134,6 +211,8 @@ EXAMPLE='''example:
   timeseries2velocity.py  timeseries.h5  --start-date 20080201  --end-date 20100508
   timeseries2velocity.py  timeseries.h5  --exclude-date 20040502 20060708 20090103
   timeseries2velocity.py  timeseries.h5  --exclude-date exclude_date.txt
+  timeseries2velocity.py  timeseries.h5  --poly-order 2  --periodic 1.0 0.5  --step 20110311
+  timeseries2velocity.py  timeseries.h5  --memory-limit 1
 '''
 
 TEMPLATE='''
@@ -165,6 +244,19 @@ def cmdLineParse():
                         help='template file with the following items:'+TEMPLATE)
     parser.add_argument('-o','--output', dest='outfile', help='output file name')
 
+    model = parser.add_argument_group('Temporal deformation model', 'extra terms solved together with velocity')
+    model.add_argument('--poly-order', dest='poly_order', type=int, default=1, choices=[1,2,3],\
+                       help='polynomial order of temporal deformation model, default = 1\n'+\
+                            '2 for acceleration, 3 for acceleration and its rate, written into *Acc/AccRate.h5')
+    model.add_argument('--periodic', dest='periods', type=float, nargs='+', default=[], metavar='PERIOD',\
+                       help='period(s) in years of sinusoidal terms, i.e. 1.0 0.5 for annual and semi-annual\n'+\
+                            'amplitude of each period is written into *Amp<PERIOD>yr.h5')
+    model.add_argument('--step', dest='step_dates', nargs='+', default=[], metavar='DATE',\
+                       help='date(s) of step jump, i.e. earthquake / volcanic eruption, written into *Step<DATE>.h5')
+    parser.add_argument('--memory-limit', dest='memory_limit', type=float, default=4.0,\
+                        help='max memory size in GB used for each box of rows, default: 4.\n'+\
+                             'Time series is read and estimated box by box to fit within this limit.')
+
     inps = parser.parse_args()
     if not inps.ex_date:
         inps.ex_date = []
@@ -181,7 +273,7 @@ def main(argv):
     print('input '+k+' file: '+inps.timeseries_file)
     if not k == 'timeseries':
         sys.exit('ERROR: input file is not timeseries!') 
-    h5file = h5py.File(inps.timeseries_file)
+    h5file = h5py.File(inps.timeseries_file, 'r')
 
     #####################################
     ## Date Info
@@ -207,47 +299,12 @@ def main(argv):
     #####################################
     ## Inversion
     # Design matrix
-    B = np.ones([len(datevector),2])
-    B[:,0] = datevector
-    #B_inv = np.linalg.pinv(B)
-    B_inv = np.dot(np.linalg.inv(np.dot(B.T,B)), B.T)
-    B_inv = np.array(B_inv, np.float32)
-
-    # Loading timeseries
-    print("Loading time series file: "+inps.timeseries_file+' ...')
-    width = int(atr['WIDTH'])
-    length = int(atr['FILE_LENGTH'])
-    dateNum = len(dateList)
-    timeseries = np.zeros([dateNum,length*width],np.float32)
-    prog_bar = ptime.progress_bar(maxValue=dateNum, prefix='loading: ')
-    for i in range(dateNum):
-        date = dateList[i]
-        timeseries[i,:] = h5file[k].get(date)[:].flatten()
-        prog_bar.update(i+1, suffix=date)
-    prog_bar.close()
-    h5file.close()
-
-    # Velocity Inversion
-    print('Calculating velocity ...')
-    X = np.dot(B_inv, timeseries)
-    velocity = np.reshape(X[0,:], [length,width])
-
-    print('Calculating rmse ...')
-    timeseries_linear = np.dot(B, X)
-    timeseries_residual = timeseries - timeseries_linear
-    rmse = np.reshape(np.sqrt((np.sum((timeseries_residual)**2,0))/dateNum), [length,width])
-    
-    print('Calculating the standard deviation of the estimated velocity ...')
-    s1 = np.sqrt(np.sum(timeseries_residual**2,0) / (dateNum-2))
-    s2 = np.sqrt(np.sum((datevector-np.mean(datevector))**2))
-    std = np.reshape(s1/s2, [length,width])
-
-    # SSt=np.sum((timeseries-np.mean(timeseries,0))**2,0)
-    # SSres=np.sum(residual**2,0)
-    # SS_REG=SSt-SSres
-    # Rsquared=np.reshape(SS_REG/SSt,[length,width])
-    ######################################################  
-    # covariance of the velocities
+    inps.step_dates = ptime.yyyymmdd(inps.step_dates)
+    B, param_list, unit_list = design_matrix(dateList, inps.poly_order, inps.periods, inps.step_dates)
+    BtB_inv = np.linalg.inv(np.dot(B.T, B))
+    dateNum, paramNum = B.shape
+    if paramNum > 2:
+        print('temporal deformation model with %d parameters: %s' % (paramNum, str(['Velocity']+param_list[1:])))
 
     #####################################
     # Output file name
@@ -262,19 +319,60 @@ def main(argv):
     atr['date1'] = datevector[0]
     atr['date2'] = datevector[dateNum-1]
 
-    # File Writing
+    # Output files, preallocated and filled box by box
     print('--------------------------------------')
     atr['FILE_TYPE'] = 'velocity'
-    print('writing >>> '+inps.outfile)
-    writefile.write(velocity, atr, inps.outfile)
-    
-    #atr['FILE_TYPE'] = 'rmse'
-    print('writing >>> '+inps.outfile_rmse)
-    writefile.write(rmse, atr, inps.outfile_rmse)
-    
-    #atr['FILE_TYPE'] = 'rmse'
-    print('writing >>> '+inps.outfile_std)
-    writefile.write(std, atr, inps.outfile_std)
+    out_file_dict = dict()
+    out_file_dict['velocity'] = inps.outfile
+    out_file_dict['rmse'] = inps.outfile_rmse
+    out_file_dict['std'] = inps.outfile_std
+    h5out_dict = dict()
+    for key in ['velocity','rmse','std']:
+        print('writing >>> '+out_file_dict[key])
+        h5out_dict[key] = writefile.create_hdf5_file(atr, out_file_dict[key])
+    # extra terms of temporal deformation model, amplitude only for sinusoidal terms
+    for i in range(2, paramNum):
+        if param_list[i].startswith('Cos'):
+            continue
+        key = param_list[i]
+        out_file_dict[key] = os.path.splitext(inps.outfile)[0]+key.replace('Sin','Amp')+os.path.splitext(inps.outfile)[1]
+        print('writing >>> '+out_file_dict[key])
+        atr_out = atr.copy()
+        atr_out['UNIT'] = unit_list[i]
+        h5out_dict[key] = writefile.create_hdf5_file(atr_out, out_file_dict[key])
+
+    #####################################
+    ## Estimation box by box
+    width = int(atr['WIDTH'])
+    length = int(atr['FILE_LENGTH'])
+    print('Calculating velocity, rmse and standard deviation ...')
+    # B^T*d, d^T*d, X in float64, data in float64 and output in float32
+    box_list = ut.split_row_box(length, width, 4*paramNum+8, inps.memory_limit)
+    prog_bar = ptime.progress_bar(maxValue=len(box_list), prefix='calculating: ')
+    for j in range(len(box_list)):
+        box = box_list[j]
+        box_shape = (box[3]-box[1], box[2]-box[0])
+        X, rmse, std = estimate_velocity_patch(h5file, dateList, box, B, BtB_inv)
+        out = {'velocity':X[0,:], 'rmse':rmse, 'std':std}
+        for i in range(2, paramNum):
+            if param_list[i].startswith('Sin'):
+                out[param_list[i]] = np.hypot(X[i,:], X[i+1,:])
+            elif not param_list[i].startswith('Cos'):
+                out[param_list[i]] = X[i,:]
+        for key, h5out in h5out_dict.items():
+            h5out['velocity'].get('velocity')[box[1]:box[3], box[0]:box[2]] = out[key].reshape(box_shape)
+        prog_bar.update(j+1, suffix='rows %d-%d' % (box[1], box[3]))
+    prog_bar.close()
+    h5file.close()
+    for h5out in h5out_dict.values():
+        h5out.close()
+
+    # SSt=np.sum((timeseries-np.mean(timeseries,0))**2,0)
+    # SSres=np.sum(residual**2,0)
+    # SS_REG=SSt-SSres
+    # Rsquared=np.reshape(SS_REG/SSt,[length,width])
+    ######################################################  
+    # covariance of the velocities
 
     print('Done.\n')
     return inps.outfile
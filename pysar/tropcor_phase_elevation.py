@@ -15,6 +15,7 @@ import numpy as np
 
 import _datetime as ptime
 import _readfile as readfile
+import _writefile as writefile
 import _pysar_utilities as ut
 
 
@@ -204,7 +205,7 @@ def main(argv):
             trop_delay -= trop_delay[ref_y, ref_x]
             data -= trop_delay
 
-        dset = group.create_dataset(date, data=data, compression='gzip')
+        dset = group.create_dataset(date, data=data, **writefile.compression_kwargs())
         prog_bar.update(i+1, suffix=date)
 
     for key,value in atr.items():
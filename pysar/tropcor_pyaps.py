@@ -320,8 +320,8 @@ def main(argv):
         # Write dataset
         print('writing to HDF5 files ...')
         data = h5timeseries['timeseries'].get(date)[:]
-        dset  = group_tropCor.create_dataset(date, data=data-phs, compression='gzip')
-        dset  = group_trop.create_dataset(date, data=phs, compression='gzip')
+        dset  = group_tropCor.create_dataset(date, data=data-phs, **writefile.compression_kwargs())
+        dset  = group_trop.create_dataset(date, data=phs, **writefile.compression_kwargs())
 
     ## Write Attributes
     for key,value in atr.items():
@@ -43,11 +43,8 @@ def read_timeseries_yx(timeseries_file, y, x):
     atr = readfile.read_attribute(timeseries_file)
     k = atr['FILE_TYPE']
     h5 = h5py.File(timeseries_file, 'r')
-    date_list = list(h5[k].keys())
-
-    dis_ts = []
-    for date in date_list:
-        dis_ts.append(h5[k].get(date)[y,x])
+    date_list = readfile.read_epoch_list(h5, k)
+    dis_ts = readfile.read_epoch_box(h5, k, date_list, (x, y, x+1, y+1)).flatten().tolist()
     h5.close()
     return dis_ts
 
@@ -242,8 +239,8 @@ def read_timeseries_info():
     if not k == 'timeseries':
         raise ValueError('Only timeseries file is supported!')
 
-    h5 = h5py.File(inps.timeseries_file, 'r')
-    dateList = sorted(h5[k].keys())
+    h5 = readfile.open_pooled_hdf5(inps.timeseries_file)
+    dateList = readfile.read_epoch_list(h5, k)
     date_num = len(dateList)
     inps.dates, tims = ptime.date_list2vector(dateList)
 
@@ -380,10 +377,10 @@ def set_mask():
 def set_initial_map():
     global d_v, h5, k, dateList, inps, data_lim
 
-    d_v = h5[k].get(dateList[inps.epoch_num])[:] * inps.unit_fac
+    d_v = readfile.read_epoch_box(h5, k, [dateList[inps.epoch_num]])[0] * inps.unit_fac
 
     if inps.ref_date:
-        inps.ref_d_v = h5[k].get(inps.ref_date)[:] * inps.unit_fac
+        inps.ref_d_v = readfile.read_epoch_box(h5, k, [inps.ref_date])[0] * inps.unit_fac
         d_v -= inps.ref_d_v
 
     if mask is not None:
@@ -518,7 +515,7 @@ def time_slider_update(val):
     timein = tslider.val
     idx_nearest = np.argmin(np.abs(np.array(tims) - timein))
     ax_v.set_title('N = %d, Time = %s' % (idx_nearest, inps.dates[idx_nearest].strftime('%Y-%m-%d')))
-    d_v = h5[k].get(dateList[idx_nearest])[:] * inps.unit_fac
+    d_v = readfile.read_epoch_box(h5, k, [dateList[idx_nearest]])[0] * inps.unit_fac
     if inps.ref_date:
         d_v -= inps.ref_d_v
     if mask is not None:
@@ -596,12 +593,12 @@ def update_timeseries(y, x, plot_number, data_only=False):
     else:
         axis = second_plot_axis
 
-    d_ts = []
-    for date in dateList:
-        d = h5[k].get(date)[y, x]
-        if inps.ref_yx:
-            d -= h5[k].get(date)[inps.ref_yx[0], inps.ref_yx[1]]
-        d_ts.append(d * inps.unit_fac)
+    # read time-series of the pixel (and the reference pixel) at once, in either stack or cube layout
+    d_ts = readfile.read_epoch_box(h5, k, dateList, (x, y, x+1, y+1)).flatten()
+    if inps.ref_yx:
+        d_ts -= readfile.read_epoch_box(h5, k, dateList, (inps.ref_yx[1], inps.ref_yx[0],\
+                                                          inps.ref_yx[1]+1, inps.ref_yx[0]+1)).flatten()
+    d_ts = d_ts * inps.unit_fac
 
     if inps.zero_first:
         d_ts -= d_ts[inps.zero_idx]
@@ -960,6 +957,7 @@ def main(argv):
     ########## MPL Disconnect Actions
     fig_v.canvas.mpl_disconnect(first_data_point)
     fig_v.canvas.mpl_disconnect(show_data_figure)
+    readfile.close_pooled_hdf5(inps.timeseries_file)
 
 ###########################################################################################
 if __name__ == '__main__':
@@ -9,6 +9,7 @@
 import os
 import sys
 import argparse
+import collections
 
 import h5py
 import numpy as np
@@ -46,25 +47,73 @@ def bridging_data(data,mask,x,y):
     return data
 
 
-def unwrap_error_correction_phase_closure(ifgram_file, mask_file, ifgram_cor_file=None):
+######################################
+def closure_pinv(C, curls, flag_nonclose, flag_close, cache=None, cache_size=1):
+    '''Pseudo-inverse of phase closure design matrix with Tikhonov regularization, for one pattern of
+    non-closing triangles, with LRU cache keyed by the pattern.
+    Inputs:
+        C             - scipy.sparse matrix in size of (curl_num, ifgram_num), triangle-interferogram matrix
+        curls         - 2D np.array of int in size of (curl_num, 3), index of interferograms of each triangle
+        flag_nonclose - 1D np.array of bool in size of (curl_num,), triangles with |closure| >= thr
+        flag_close    - 1D np.array of bool in size of (curl_num,), triangles with |closure| < thr
+        cache         - collections.OrderedDict, cache of pseudo-inverse of patterns, for the network of C only,
+                        i.e. created by each call of unwrap_error_correction_phase_closure(); None to disable
+        cache_size    - int, max number of pseudo-inverse in cache
+    Output:
+        M1 - 2D np.array in size of (ifgram_num, curl_num), rows of pinv(AAAA) for interferograms,
+             columns for closure phase C*dU, the only non-zero part of the observation LLL
+    '''
+    key = np.packbits(np.hstack((flag_nonclose, flag_close))).tobytes()
+    if cache is not None and key in cache:
+        M1 = cache.pop(key)
+        cache[key] = M1
+        return M1
+
+    curl_num, ifgram_num = C.shape
+    # interferograms in closing triangles only
+    UniN  = np.unique(curls[flag_nonclose, :])
+    UniNc = np.unique(curls[flag_close, :])
+    UniNc = [x for x in UniNc if x not in set(UniN)]
+
+    D = np.zeros([len(UniNc),ifgram_num])
+    for i in range(len(UniNc)):
+        D[i,UniNc[i]]=1
+
+    AAA  = np.vstack([-2*np.pi*C.toarray(),D])
+    AAAA = np.vstack([AAA,0.25*np.eye(ifgram_num)])
+    M1 = pinv(AAAA)[0:ifgram_num, 0:curl_num]
+
+    if cache is not None:
+        cache[key] = M1
+        while len(cache) > cache_size:
+            cache.popitem(last=False)
+    return M1
+
+
+def unwrap_error_correction_phase_closure(ifgram_file, mask_file, ifgram_cor_file=None, memory_limit=4.0,\
+                                          curl_file=None):
     '''Correct unwrapping errors in network of interferograms using phase closure.
+    Data is processed box by box, with closure phase of all triangles calculated on the fly
+    as C * ifgram of each box, without writing them out, unless curl_file is given.
     Inputs:
         ifgram_file     - string, name/path of interferograms file
         mask_file       - string, name/path of mask file to mask the pixels to be corrected
         ifgram_cor_file - string, optional, name/path of corrected interferograms file
+        memory_limit    - float, max memory size in GB used for one box of rows
+        curl_file       - string, optional, name/path of closure phase file to write, if it does not exist,
+                          same as generate_curls(), default: None, not to write
     Output:
         ifgram_cor_file
     Example:
         'unwrapIfgram_unwCor.h5' = unwrap_error_correction_phase_closure('Seeded_unwrapIfgram.h5','mask.h5')
     '''
     print('read mask from file: '+mask_file)
-    mask = readfile.read(mask_file)[0].flatten(1)
+    mask = readfile.read(mask_file)[0]
 
     atr = readfile.read_attribute(ifgram_file)
     length = int(atr['FILE_LENGTH'])
     width = int(atr['WIDTH'])
     k = atr['FILE_TYPE']
-    pixel_num = length*width
 
     # Check reference pixel
     try:
@@ -76,81 +125,13 @@ def unwrap_error_correction_phase_closure(ifgram_file, mask_file, ifgram_cor_fil
     h5 = h5py.File(ifgram_file,'r')
     ifgram_list = sorted(h5[k].keys())
     ifgram_num = len(ifgram_list)
+    print('Number of interferograms: '+ str(ifgram_num))
 
     ##### Prepare curls
     curls, Triangles, C = ut.get_triangles(h5)
     curl_num = np.shape(curls)[0]
     print('Number of      triangles: '+  str(curl_num))
-
-    curl_file='curls.h5'
-    if not os.path.isfile(curl_file):
-        print('writing >>> '+curl_file)
-        ut.generate_curls(curl_file, h5, Triangles, curls)
-
     thr=0.50
-    curls = np.array(curls);   n1=curls[:,0];   n2=curls[:,1];   n3=curls[:,2]
-
-    print('reading interferograms...')
-    print('Number of interferograms: '+ str(ifgram_num))
-    data = np.zeros((ifgram_num,pixel_num),np.float32)
-    prog_bar = ptime.progress_bar(maxValue=ifgram_num)
-    for ni in range(ifgram_num):
-        ifgram = ifgram_list[ni]
-        d = h5[k][ifgram].get(ifgram)[:].flatten(1)
-        data[ni,:] = d
-        prog_bar.update(ni+1)
-    prog_bar.close()
-
-    print('reading curls ...') 
-    print('number of culrs: '+str(curl_num))
-    h5curl = h5py.File(curl_file,'r')
-    curl_list = sorted(h5curl[k].keys())
-    curl_data = np.zeros((curl_num, pixel_num),np.float32)
-    prog_bar = ptime.progress_bar(maxValue=curl_num)
-    for ni in range(curl_num):
-        d = h5curl[k][curl_list[ni]].get(curl_list[ni])[:].flatten(1)
-        curl_data[ni,:] = d.flatten(1)
-        prog_bar.update(ni+1)
-    prog_bar.close()
-    h5curl.close() 
-
-    print('estimating unwrapping error pixel by pixel ...')
-    EstUnwrap = np.zeros((ifgram_num,pixel_num),np.float32)
-    prog_bar = ptime.progress_bar(maxValue=pixel_num)
-    for ni in range(pixel_num):
-        if mask[ni]==1:
-            dU = data[:,ni]
-            unwCurl = np.array(curl_data[:,ni])
-
-            ind  = np.abs(unwCurl)>=thr;      N1 =n1[ind];      N2 =n2[ind];      N3 =n3[ind]
-            indC = np.abs(unwCurl)< thr;      Nc1=n1[indC];     Nc2=n2[indC];     Nc3=n3[indC]
-  
-            N =np.hstack([N1, N2, N3]);       UniN =np.unique(N)
-            Nc=np.hstack([Nc1,Nc2,Nc3]);      UniNc=np.unique(Nc)
-
-            inter = list(set(UniNc) & set(UniN)) # intersetion
-            UniNc = list(UniNc)
-            for x in inter:
-                UniNc.remove(x)
-
-            D = np.zeros([len(UniNc),ifgram_num])
-            for i in range(len(UniNc)):
-                D[i,UniNc[i]]=1
-
-            AAA  = np.vstack([-2*np.pi*C,D])
-            AAAA = np.vstack([AAA,0.25*np.eye(ifgram_num)])
-
-            ##########
-            # with Tikhonov regularization:
-            LLL = list(np.dot(C,dU)) + list(np.zeros(np.shape(UniNc)[0])) + list(np.zeros(ifgram_num))
-            ind = np.isnan(AAAA)
-            M1 = pinv(AAAA)
-            M = np.dot(M1,LLL)
-            EstUnwrap[:,ni] = np.round(M[0:ifgram_num])*2.0*np.pi
-        prog_bar.update(ni+1, suffix='%s/%d' % (ni,pixel_num))
-    prog_bar.close()
-
-    dataCor = data + EstUnwrap
 
     ##### Output
     if not ifgram_cor_file:
@@ -158,23 +139,123 @@ def unwrap_error_correction_phase_closure(ifgram_file, mask_file, ifgram_cor_fil
     print('writing >>> '+ifgram_cor_file)
     h5unwCor = h5py.File(ifgram_cor_file,'w') 
     gg = h5unwCor.create_group(k) 
-
-    prog_bar = ptime.progress_bar(maxValue=ifgram_num)
-    for i in range(ifgram_num):
-        ifgram = ifgram_list[i]
+    for ifgram in ifgram_list:
         group = gg.create_group(ifgram)
-        dset = group.create_dataset(ifgram, data=np.reshape(dataCor[i,:],[width,length]).T, compression='gzip')
+        group.create_dataset(ifgram, shape=(length, width), dtype=np.float32, chunks=True, **writefile.compression_kwargs())
         for key, value in h5[k][ifgram].attrs.items():
             group.attrs[key] = value
-        prog_bar.update(i+1)
+
+    # closure phase file, in the same layout as generate_curls()
+    if curl_file and os.path.isfile(curl_file):
+        print(curl_file+' already exists, skip writing closure phase.')
+        curl_file = None
+    if curl_file:
+        print('writing >>> '+curl_file)
+        h5curl = h5py.File(curl_file,'w')
+        gg_curl = h5curl.create_group(k)
+        curl_name_list = ['_'.join(i) for i in Triangles]
+        for i in range(curl_num):
+            group = gg_curl.create_group(curl_name_list[i])
+            group.create_dataset(curl_name_list[i], shape=(length, width), dtype=np.float32, chunks=True,\
+                                 **writefile.compression_kwargs())
+            for key, value in h5[k][ifgram_list[curls[i,0]]].attrs.items():
+                group.attrs[key] = value
+
+    ##### Loop box by box
+    # Pixels with the same pattern of closing / non-closing triangles share the same design matrix,
+    # thus are solved together with one (cached) pseudo-inverse.
+    # Half of memory_limit is used for data of one box, the other half for cache of pseudo-inverse.
+    print('estimating unwrapping error for pixels grouped by pattern of non-closing triangles ...')
+    pinv_cache = collections.OrderedDict()
+    pinv_cache_size = max(1, int(memory_limit/2. * 1024**3 / (8.*max(ifgram_num*curl_num, 1))))
+    # interferograms and the subset of pixels in float32, correction in float64: 4 layers per interferogram
+    # closure phase, its absolute value and closure phase of the subset in float64: 6 layers per triangle
+    box_list = ut.split_row_box(length, width, 4*ifgram_num+6*curl_num, memory_limit/2.)
+    curl_nonclose_num = np.zeros(curl_num, np.int64)
+    curl_abs_sum = np.zeros(curl_num, np.float64)
+    pixel_num_mask = 0
+    prog_bar = ptime.progress_bar(maxValue=len(box_list))
+    for i in range(len(box_list)):
+        box = box_list[i]
+        box_length = box[3]-box[1]
+        box_width  = box[2]-box[0]
+        data = ut.read_ifgram_box(h5, ifgram_list, box)
+        curl_data = C.dot(data)
+        if curl_file:
+            for j in range(curl_num):
+                gg_curl[curl_name_list[j]][curl_name_list[j]][box[1]:box[3], box[0]:box[2]] = \
+                    curl_data[j].reshape(box_length, box_width)
+
+        pixel_idx_mask = np.where(mask[box[1]:box[3], box[0]:box[2]].flatten() == 1)[0]
+        curl_abs = np.abs(curl_data[:, pixel_idx_mask])
+        del curl_data
+        curl_nonclose_num += np.sum(curl_abs >= thr, axis=1)
+        curl_abs_sum += np.sum(curl_abs, axis=1)
+        pixel_num_mask += len(pixel_idx_mask)
+
+        pattern_list = []
+        if len(pixel_idx_mask) > 0:
+            pattern = np.vstack((curl_abs >= thr, curl_abs < thr))
+            pattern_list = ut.group_pixel_by_pattern(pattern)
+            del pattern
+        del curl_abs
+        for flag, idx in pattern_list:
+            idx = pixel_idx_mask[idx]
+            M1 = closure_pinv(C, curls, flag[0:curl_num], flag[curl_num:], pinv_cache, pinv_cache_size)
+            ##########
+            # with Tikhonov regularization: observation LLL = [C*dU, 0, 0]
+            M = np.dot(M1, C.dot(data[:, idx]))
+            data[:, idx] += (np.round(M)*2.0*np.pi).astype(np.float32)
+
+        for j in range(ifgram_num):
+            ifgram = ifgram_list[j]
+            gg[ifgram][ifgram][box[1]:box[3], box[0]:box[2]] = data[j].reshape(box_length, box_width)
+        prog_bar.update(i+1, suffix='%d patterns' % len(pattern_list))
     prog_bar.close()
     h5unwCor.close()
+    if curl_file:
+        h5curl.close()
     h5.close()
+
+    ##### Triangle closure statistics
+    if pixel_num_mask > 0:
+        curl_nonclose_ratio = curl_nonclose_num / float(pixel_num_mask)
+        curl_abs_mean = curl_abs_sum / float(pixel_num_mask)
+        print('number of triangles with non-zero closure phase: %d out of %d'\
+              % (np.sum(curl_nonclose_num > 0), curl_num))
+        print('triangles with the most non-closing pixels (ratio of non-closing pixels, mean absolute closure in rad):')
+        for i in np.argsort(-curl_nonclose_ratio, kind='mergesort')[0:min(10, curl_num)]:
+            if curl_nonclose_num[i] == 0:
+                break
+            print('    %s  %.3f  %.3f' % ('_'.join(Triangles[i]), curl_nonclose_ratio[i], curl_abs_mean[i]))
     return ifgram_cor_file
 
 
+def bridging_ifgram(ifgram_file, ifgram, bridge_dict):
+    '''Unwrapping error correction with bridging for one interferogram in HDF5 file.
+    Inputs:
+        ifgram_file - string, name/path of interferograms file
+        ifgram      - string, group name of interferogram to be corrected
+        bridge_dict - dict, including the following items:
+                      mask, ramp_mask, ramp_pinv, ramp_type, x_list, y_list, ref_y, ref_x
+    Outputs:
+        data_cor        - 2D np.array, corrected interferogram
+        data_cor_deramp - 2D np.array, corrected interferogram with phase ramp removed
+    '''
+    h5 = h5py.File(ifgram_file,'r')
+    k = [i for i in h5.keys() if i in readfile.multi_group_hdf5_file][0]
+    data = h5[k][ifgram].get(ifgram)[:]
+    h5.close()
+    data -= data[bridge_dict['ref_y'], bridge_dict['ref_x']]
+
+    data_deramp, ramp = rm.remove_data_surface(data, bridge_dict['ramp_mask'].copy(), bridge_dict['ramp_type'],\
+                                               bridge_dict['ramp_pinv'])
+    data_derampCor = bridging_data(data_deramp, bridge_dict['mask'], bridge_dict['x_list'], bridge_dict['y_list'])
+    return data_derampCor-ramp, data_derampCor
+
+
 def unwrap_error_correction_bridging(ifgram_file, mask_file, y_list, x_list, ramp_type='plane',\
-                                     ifgram_cor_file=None, save_cor_deramp_file=False):
+                                     ifgram_cor_file=None, save_cor_deramp_file=False, parallel=False):
     '''Unwrapping error correction with bridging.
     Inputs:
         ifgram_file : string, name/path of interferogram(s) to be corrected
@@ -182,6 +263,8 @@ def unwrap_error_correction_bridging(ifgram_file, mask_file, y_list, x_list, ram
         y/x_list    : list of int, bonding points in y/x 
         ifgram_cor_file : string, optional, output file name
         save_cor_deramp_file : bool, optional
+        parallel    : bool, optional, correct interferograms in parallel,
+                      with max core number set in pysar/_settings.py: parallel_num
     Output:
         ifgram_cor_file
     Example:
@@ -260,27 +343,37 @@ def unwrap_error_correction_bridging(ifgram_file, mask_file, y_list, x_list, ram
 
         ##### Loop
         print('Number of interferograms: '+str(ifgram_num))
+        # design matrix of phase ramp is the same for all interferograms with the shared mask
+        bridge_dict = {'mask':mask, 'ramp_mask':ramp_mask, 'ramp_type':ramp_type,\
+                       'ramp_pinv':rm.surface_design_matrix_pinv(ramp_mask, ramp_type),\
+                       'x_list':x_list, 'y_list':y_list, 'ref_y':ref_y, 'ref_x':ref_x}
+        num_cores, enable_parallel = 1, False
+        if parallel:
+            num_cores, enable_parallel, Parallel, delayed = ut.check_parallel(ifgram_num)
+
         prog_bar = ptime.progress_bar(maxValue=ifgram_num)
         date12_list = ptime.list_ifgram2date12(ifgram_list)
-        for i in range(ifgram_num):
-            ifgram = ifgram_list[i]
-            data = h5[k][ifgram].get(ifgram)[:]
-            data -= data[ref_y, ref_x]
-
-            data_deramp, ramp = rm.remove_data_surface(data, ramp_mask, ramp_type)
-            data_derampCor = bridging_data(data_deramp, mask, x_list, y_list)
-
-            gg = group.create_group(ifgram)
-            dset = gg.create_dataset(ifgram, data=data_derampCor-ramp, compression='gzip')
-            for key, value in h5[k][ifgram].attrs.items():
-                gg.attrs[key]=value
-
-            if save_cor_deramp_file:
-                gg_deramp = group_deramp.create_group(ifgram)
-                dset = gg_deramp.create_dataset(ifgram, data=data_derampCor, compression='gzip')
+        for i in range(0, ifgram_num, num_cores):
+            ifgram_sublist = ifgram_list[i:i+num_cores]
+            if enable_parallel:
+                out_list = Parallel(n_jobs=num_cores)(delayed(bridging_ifgram)(ifgram_file, ifgram, bridge_dict)\
+                                                      for ifgram in ifgram_sublist)
+            else:
+                out_list = [bridging_ifgram(ifgram_file, ifgram, bridge_dict) for ifgram in ifgram_sublist]
+
+            # write results of all interferograms by the main process only
+            for ifgram, (data_cor, data_derampCor) in zip(ifgram_sublist, out_list):
+                gg = group.create_group(ifgram)
+                dset = gg.create_dataset(ifgram, data=data_cor, **writefile.compression_kwargs())
                 for key, value in h5[k][ifgram].attrs.items():
-                    gg_deramp.attrs[key]=value
-            prog_bar.update(i+1, suffix=date12_list[i])
+                    gg.attrs[key]=value
+
+                if save_cor_deramp_file:
+                    gg_deramp = group_deramp.create_group(ifgram)
+                    dset = gg_deramp.create_dataset(ifgram, data=data_derampCor, **writefile.compression_kwargs())
+                    for key, value in h5[k][ifgram].attrs.items():
+                        gg_deramp.attrs[key]=value
+            prog_bar.update(i+len(ifgram_sublist), suffix=date12_list[i+len(ifgram_sublist)-1])
 
         prog_bar.close()
         h5.close()
@@ -314,9 +407,12 @@ def unwrap_error_correction_bridging(ifgram_file, mask_file, y_list, x_list, ram
 EXAMPLE='''example:
 Phase Closure:
   unwrap_error.py  Seeded_unwrapIfgram.h5  mask.h5
+  unwrap_error.py  Seeded_unwrapIfgram.h5  mask.h5  --memory-limit 1
+  unwrap_error.py  Seeded_unwrapIfgram.h5  mask.h5  --curl-file curls.h5
 Bridging:
   unwrap_error.py  Seeded_unwrapIfgram.h5    mask.h5     -t ShikokuT417F650_690AlosA.template
   unwrap_error.py  Seeded_unwrapIfgram.h5    mask.h5     -x 283 305 -y 1177 1247
+  unwrap_error.py  Seeded_unwrapIfgram.h5    mask.h5     -x 283 305 -y 1177 1247 --parallel
   unwrap_error.py  Seeded_081018_090118.unw  mask_all.h5 -x 283 305 -y 1177 1247 --ramp quadratic
 '''
 
@@ -370,6 +466,14 @@ def cmdLineParse():
                              '    positive integers, i.e. 1, 2, 3, ...')
     parser.add_argument('-o','--outfile', help="output file name. Default is to add suffix '_unwCor.h5'")
 
+    closure = parser.add_argument_group('Phase Closure')
+    closure.add_argument('--memory-limit', dest='memory_limit', type=float, default=4.0,\
+                         help='max memory size in GB used for each box of rows, default: 4.\n'+\
+                              'Closure phases are calculated on the fly box by box to fit within this limit.')
+    closure.add_argument('--curl-file', dest='curl_file',\
+                         help='file to write closure phase of all triangles into, if not existed, i.e. curls.h5\n'+\
+                              'default: no, closure phases are not written out.')
+
     bridging = parser.add_argument_group('Bridging')
     bridging.add_argument('-y', type=int, nargs='*',\
                           help='Y coordinates of bridge bonding points from reference patch to to-be-corrected patch.\n'+\
@@ -384,6 +488,9 @@ def cmdLineParse():
                                'pysar.unwrapError.yx = 283,1177,305,1247;350,2100,390,2200')
     bridging.add_argument('--ramp', dest='ramp_type', choices=['plane','quadratic'], default='plane',\
                           help='type of phase ramp to be removed before correction.')
+    bridging.add_argument('--parallel', dest='parallel', action='store_true',\
+                          help='correct interferograms in parallel,\n'+\
+                               'with max core number set in pysar/_settings.py: parallel_num.')
 
     inps = parser.parse_args()
     if inps.y and np.mod(len(inps.y),2) != 0:
@@ -421,11 +528,12 @@ def main(argv):
 
     #####
     if inps.method == 'phase_closure':
-        inps.outfile = unwrap_error_correction_phase_closure(inps.ifgram_file, inps.mask_file, inps.outfile)
+        inps.outfile = unwrap_error_correction_phase_closure(inps.ifgram_file, inps.mask_file, inps.outfile,\
+                                                              inps.memory_limit, inps.curl_file)
 
     elif inps.method == 'bridging':
         inps.outfile = unwrap_error_correction_bridging(inps.ifgram_file, inps.mask_file, inps.y, inps.x,\
-                                                        inps.ramp_type, inps.outfile)[0]
+                                                        inps.ramp_type, inps.outfile, parallel=inps.parallel)[0]
 
     print('Done.')
     return inps.outfile
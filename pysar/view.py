@@ -228,7 +228,7 @@ def auto_figure_title(fname, epoch=[], inps_dict=None):
                 ref_date = atr['ref_date']
             except:
                 h5 = h5py.File(fname, 'r')
-                epoch_list = sorted(h5[k].keys())
+                epoch_list = readfile.read_epoch_list(h5, k)
                 h5.close()
                 ref_date = epoch_list[0]
         fig_title = ptime.yymmdd(ref_date)+'-'+ptime.yymmdd(epoch[0])
@@ -1249,7 +1249,7 @@ def main(argv):
         if k in ['HDFEOS']:
             epochList = list(h5file[k]['GRIDS']['timeseries'].keys())
         else:
-            epochList = sorted(h5file[k].keys())
+            epochList = readfile.read_epoch_list(h5file, k)
         h5file.close()
 
         # Epochs to display
@@ -1450,13 +1450,16 @@ def main(argv):
         all_data_min=0
         all_data_max=0
 
-        h5file = h5py.File(inps.file, 'r')
+        h5file = readfile.open_pooled_hdf5(inps.file)
         # Check dropped interferograms
         drop_epoch_list = []
         if k in multi_group_hdf5_file and inps.disp_title:
             drop_epoch_list = sorted(list(set(inps.epoch) - \
                                           set(ut.check_drop_ifgram(h5file, atr, inps.epoch, print_msg=False))))
             print("mark interferograms with 'drop_ifgram'='yes' in red colored title")
+        if k in multi_group_hdf5_file:
+            date12_dict = dict((epoch, epoch_atr.get('DATE12', '')) for epoch, epoch_atr in\
+                               zip(inps.epoch, readfile.read_epoch_attribute_list(h5file, k, inps.epoch)))
 
         ##### Loop 1 - Figures
         for j in range(1, inps.fig_num+1):
@@ -1485,8 +1488,7 @@ def main(argv):
 
                 # Read Data
                 if k in multi_dataset_hdf5_file:
-                    dset = h5file[k].get(epoch)
-                    data = dset[inps.pix_box[1]:inps.pix_box[3], inps.pix_box[0]:inps.pix_box[2]]
+                    data = readfile.read_epoch_box(h5file, k, [epoch], inps.pix_box)[0]
                     if inps.ref_date:
                         data -= ref_data
                     subplot_title = dt.strptime(epoch, '%Y%m%d').isoformat()[0:10]
@@ -1494,9 +1496,8 @@ def main(argv):
                     if inps.fig_row_num*inps.fig_col_num > 100:
                         subplot_title = str(epochList.index(epoch)+1)
                     else:
-                        subplot_title = str(epochList.index(epoch)+1)+'\n'+h5file[k][epoch].attrs['DATE12']
-                    dset = h5file[k][epoch].get(epoch)
-                    data = dset[inps.pix_box[1]:inps.pix_box[3], inps.pix_box[0]:inps.pix_box[2]]
+                        subplot_title = str(epochList.index(epoch)+1)+'\n'+date12_dict[epoch]
+                    data = readfile.read_epoch_box(h5file, k, [epoch], inps.pix_box)[0]
                     if ref_yx:
                         data -= data[ref_yx[0], ref_yx[1]]
                 elif k in ['HDFEOS']:
@@ -1583,7 +1584,7 @@ def main(argv):
                     fig.clf()
 
         ##### End of Loop 1
-        h5file.close()
+        readfile.close_pooled_hdf5(inps.file)
         print('----------------------------------------')
         print('all data range: [%.2f, %.2f] %s' % (all_data_min, all_data_max, inps.disp_unit))
         if inps.disp_min and inps.disp_max:
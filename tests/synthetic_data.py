@@ -0,0 +1,196 @@
+#! /usr/bin/env python2
+############################################################
+# Program is part of PySAR v1.2                            #
+# Copyright(c) 2017, Zhang Yunjun                          #
+# Author:  Zhang Yunjun                                    #
+############################################################
+# Small synthetic datasets for regression tests, with known displacement time-series.
+# Recommended usage:
+#   import synthetic_data as sd
+#   ifgram_file = sd.write_ifgram_file(os.path.join(work_dir, 'unwrapIfgram.h5'))
+
+
+import os
+import sys
+import datetime
+
+import numpy as np
+import h5py
+
+# add pysar directory into path, for the implicit relative import of pysar modules
+pysar_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'pysar')
+if pysar_dir not in sys.path:
+    sys.path.insert(0, pysar_dir)
+
+
+WAVELENGTH = 0.056
+phase2range = -1*WAVELENGTH/(4.*np.pi)
+ref_y = 4
+ref_x = 3
+
+
+def date6_list(date_num, seed=0):
+    '''Dates in YYMMDD format, with about 24 days interval'''
+    rng = np.random.RandomState(seed)
+    d0 = datetime.date(2010,1,1)
+    return [(d0+datetime.timedelta(days=int(i*24+rng.randint(0,5)))).strftime('%y%m%d') for i in range(date_num)]
+
+
+def write_ifgram_file(fname, length=20, width=15, date_num=10, seed=0, noise=0.05, gaps=False,\
+                      coherence_file=None, pair_step=3):
+    '''Write interferograms file from random displacement time-series,
+    with network of each date paired with the next pair_step dates.
+    Inputs:
+        fname     - string, name/path of output interferograms file
+        noise     - float, std of noise in radian added to each interferogram
+        gaps      - bool, set 15% random pixels to 0 (no data) in each interferogram
+        coherence_file - string, optional, name/path of coherence file to write with random values
+    Output:
+        fname     - string, name/path of output interferograms file
+        ts        - 3D np.array in size of (date_num, length, width), phase time-series in radian
+    '''
+    rng = np.random.RandomState(seed)
+    d6 = date6_list(date_num, seed)
+    tbase = np.array([(datetime.datetime.strptime(d,'%y%m%d')-datetime.datetime(2010,1,1)).days for d in d6], np.float64)
+    ts = tbase.reshape(-1,1,1) * rng.randn(1,length,width) * 0.01 + rng.randn(date_num,length,width) * 0.1
+    ts -= ts[0]
+
+    h5 = h5py.File(fname, 'w')
+    group = h5.create_group('interferograms')
+    if coherence_file:
+        h5coh = h5py.File(coherence_file, 'w')
+        group_coh = h5coh.create_group('coherence')
+    for i in range(date_num):
+        for j in range(i+1, min(i+pair_step+1, date_num)):
+            ifgram = 'filt_%s-%s_4rlks.unw' % (d6[i], d6[j])
+            data = np.array(ts[j] - ts[i] + rng.randn(length, width)*noise, np.float32)
+            if gaps:
+                data[rng.rand(length, width) < 0.15] = 0.
+            atr = {'FILE_TYPE':'interferograms', 'DATE12':d6[i]+'-'+d6[j], 'DATE':d6[i],\
+                   'FILE_LENGTH':str(length), 'WIDTH':str(width), 'WAVELENGTH':str(WAVELENGTH),\
+                   'ref_y':str(ref_y), 'ref_x':str(ref_x), 'drop_ifgram':'no', 'UNIT':'radian',\
+                   'P_BASELINE_TOP_HDR':str(rng.randn()*100), 'P_BASELINE_BOTTOM_HDR':str(rng.randn()*100),\
+                   'INSAR_PROCESSOR':'roipac', 'PLATFORM':'Sen'}
+            gg = group.create_group(ifgram)
+            gg.create_dataset(ifgram, data=data)
+            for key, value in atr.items():
+                gg.attrs[key] = value
+            if coherence_file:
+                coh = ifgram.replace('.unw','.cor')
+                gg = group_coh.create_group(coh)
+                gg.create_dataset(coh, data=np.array(rng.rand(length, width)*0.8+0.1, np.float32))
+                for key, value in atr.items():
+                    gg.attrs[key] = value
+                gg.attrs['FILE_TYPE'] = 'coherence'
+    h5.close()
+    if coherence_file:
+        h5coh.close()
+    return fname, ts
+
+
+def write_timeseries_file(fname, length=20, width=15, date_num=12, seed=0, noise=0.002):
+    '''Write timeseries file with linear velocity and DEM error, and incidence_angle.h5 / range.h5
+    in the same directory, with incidence angle and range distance varying in range direction.
+    Inputs:
+        fname - string, name/path of output timeseries file
+        noise - float, std of noise in meter added to each acquisition
+    Outputs:
+        fname - string, name/path of output timeseries file
+        vel   - 2D np.array in size of (length, width), velocity in m/yr
+        dz    - 2D np.array in size of (length, width), DEM error in m
+    '''
+    rng = np.random.RandomState(seed)
+    date8_list = ['20'+i for i in date6_list(date_num, seed)]
+    years = np.array([(datetime.datetime.strptime(d,'%Y%m%d')-datetime.datetime(2010,1,1)).days for d in date8_list])/365.25
+    pbase = rng.randn(date_num)*100.
+    pbase -= pbase[0]
+    vel = rng.randn(length, width)*0.01
+    dz = rng.randn(length, width)*10.
+    inc_angle = np.tile(np.linspace(30., 45., width), (length,1))
+    range_dis = np.tile(np.linspace(8.0e5, 8.5e5, width), (length,1))
+
+    atr = {'FILE_TYPE':'timeseries', 'FILE_LENGTH':str(length), 'WIDTH':str(width),\
+           'WAVELENGTH':str(WAVELENGTH), 'UNIT':'m', 'ref_y':str(ref_y), 'ref_x':str(ref_x), 'ref_date':date8_list[0],\
+           'P_BASELINE_TIMESERIES':' '.join(str(i) for i in pbase),\
+           'P_BASELINE_TOP_TIMESERIES':' '.join(str(i) for i in pbase),\
+           'P_BASELINE_BOTTOM_TIMESERIES':' '.join(str(i) for i in pbase),\
+           'INSAR_PROCESSOR':'roipac', 'PLATFORM':'Sen'}
+    h5 = h5py.File(fname, 'w')
+    group = h5.create_group('timeseries')
+    for i in range(date_num):
+        data = vel*years[i] + dz*pbase[i]/(range_dis*np.sin(inc_angle*np.pi/180.)) + rng.randn(length, width)*noise
+        group.create_dataset(date8_list[i], data=np.array(data, np.float32))
+    for key, value in atr.items():
+        group.attrs[key] = value
+    h5.close()
+
+    out_dir = os.path.dirname(fname)
+    for name, data in [('incidence_angle.h5', inc_angle), ('range.h5', range_dis)]:
+        write_mask_file(os.path.join(out_dir, name), data, atr)
+    return fname, vel, dz
+
+
+def write_mask_file(fname, data, atr=dict()):
+    '''Write single dataset file of mask type'''
+    atr_out = dict(atr)
+    atr_out.update({'FILE_TYPE':'mask', 'FILE_LENGTH':str(data.shape[0]), 'WIDTH':str(data.shape[1])})
+    h5 = h5py.File(fname, 'w')
+    group = h5.create_group('mask')
+    group.create_dataset('mask', data=np.array(data, np.float32))
+    for key, value in atr_out.items():
+        group.attrs[key] = value
+    h5.close()
+    return fname
+
+
+def read_stack(fname):
+    '''Read all epochs of timeseries / interferograms / coherence file in stack layout
+    Output: epoch_list - list of string, sorted epoch names
+            data       - 3D np.array in size of (epoch_num, length, width)
+    '''
+    h5 = h5py.File(fname, 'r')
+    k = list(h5.keys())[0]
+    epoch_list = sorted(h5[k].keys())
+    if isinstance(h5[k][epoch_list[0]], h5py.Group):
+        data = np.array([h5[k][i][i][:] for i in epoch_list])
+    else:
+        data = np.array([h5[k][i][:] for i in epoch_list])
+    h5.close()
+    return epoch_list, data
+
+
+def sbas_reference(ifgram_file, weight_file=None, masked=False):
+    '''Reference SBAS inversion pixel by pixel with numpy least squares, in meter
+    Inputs:
+        ifgram_file - string, interferograms file
+        weight_file - string, optional, coherence file, to weight with sqrt of coherence
+        masked      - bool, exclude interferograms with zero value at each pixel
+    Output:
+        ts - 3D np.array in size of (date_num, length, width)
+    '''
+    ifgram_list, data = read_stack(ifgram_file)
+    shape = data.shape[1:]
+    data = data.reshape(len(ifgram_list), -1)
+    mask = data != 0.
+    data = data - data[:, ref_y*shape[1]+ref_x].reshape(-1,1)
+    if weight_file:
+        weight = np.sqrt(read_stack(weight_file)[1].reshape(len(ifgram_list), -1))
+    else:
+        weight = np.ones(data.shape)
+
+    date12_list = ['-'.join(i.split('_')[1].split('-')) for i in ifgram_list]
+    date6s = sorted(list(set(sum([i.split('-') for i in date12_list], []))))
+    tbase = np.array([(datetime.datetime.strptime(d,'%y%m%d')-datetime.datetime.strptime(date6s[0],'%y%m%d')).days\
+                      for d in date6s], np.float64)
+    B = np.zeros((len(date12_list), len(date6s)-1))
+    for i in range(len(date12_list)):
+        m, s = [date6s.index(d) for d in date12_list[i].split('-')]
+        B[i, m:s] = np.diff(tbase)[m:s]
+
+    ts = np.zeros((len(date6s), data.shape[1]))
+    for p in range(data.shape[1]):
+        flag = mask[:,p] if masked else np.ones(len(date12_list), np.bool_)
+        w = weight[flag, p]
+        rate = np.linalg.lstsq(B[flag]*w.reshape(-1,1), data[flag, p]*w, rcond=-1)[0]
+        ts[1:, p] = np.cumsum(rate*np.diff(tbase))
+    return (ts*phase2range).reshape((len(date6s),)+shape)
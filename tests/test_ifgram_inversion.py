@@ -0,0 +1,192 @@
+#! /usr/bin/env python2
+# Regression tests of network inversion of interferograms into time-series, on small synthetic data,
+# against the reference inversion pixel by pixel with numpy least squares.
+# Run:
+#   python -m unittest discover -s tests
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import h5py
+
+import synthetic_data as sd
+import _datetime as ptime
+import _readfile as readfile
+import _pysar_utilities as ut
+import temporal_coherence as tcoh
+
+
+def drop_ifgram(ifgram_file, date12_list):
+    '''Mark interferograms with date12 in date12_list as dropped'''
+    h5 = h5py.File(ifgram_file, 'r+')
+    for ifgram in h5['interferograms'].keys():
+        if h5['interferograms'][ifgram].attrs['DATE12'] in date12_list:
+            h5['interferograms'][ifgram].attrs['drop_ifgram'] = 'yes'
+    h5.close()
+
+
+class TimeseriesInversionTest(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.ifgram_file = os.path.join(self.work_dir, 'unwrapIfgram.h5')
+        self.coh_file = os.path.join(self.work_dir, 'coherence.h5')
+        self.ts_file = os.path.join(self.work_dir, 'timeseries.h5')
+        ut.design_matrix_cache.clear()
+
+    def tearDown(self):
+        readfile.close_pooled_hdf5()
+        shutil.rmtree(self.work_dir)
+
+    def inverse(self, method='L2', memory_limit=4.0, outfile=None, **kwargs):
+        outfile = outfile or self.ts_file
+        ut.timeseries_inversion(self.ifgram_file, outfile, memory_limit=memory_limit, method=method, **kwargs)
+        return sd.read_stack(outfile)[1]
+
+    def test_L2(self):
+        sd.write_ifgram_file(self.ifgram_file)
+        ts = self.inverse('L2')
+        self.assertTrue(np.allclose(ts, sd.sbas_reference(self.ifgram_file), atol=1e-6))
+        # box by box with tiny memory limit
+        ts_box = self.inverse('L2', memory_limit=1e-5, outfile=os.path.join(self.work_dir, 'ts_box.h5'))
+        self.assertTrue(np.allclose(ts_box, ts, atol=1e-7))
+        atr = readfile.read_attribute(self.ts_file)
+        self.assertEqual(len(atr['P_BASELINE_TIMESERIES'].split()), ts.shape[0])
+
+    def test_L2_masked(self):
+        sd.write_ifgram_file(self.ifgram_file, gaps=True)
+        ts = self.inverse('L2_masked', memory_limit=1e-5)
+        self.assertTrue(np.allclose(ts, sd.sbas_reference(self.ifgram_file, masked=True), atol=1e-6))
+
+    def test_L2_sparse(self):
+        sd.write_ifgram_file(self.ifgram_file, date_num=20)
+        ts = self.inverse('L2')
+        ts_sparse = self.inverse('L2_sparse', outfile=os.path.join(self.work_dir, 'ts_sparse.h5'))
+        self.assertTrue(np.allclose(ts_sparse, ts, atol=1e-6))
+
+    def test_WLS(self):
+        sd.write_ifgram_file(self.ifgram_file, coherence_file=self.coh_file)
+        ts = self.inverse('WLS', memory_limit=1e-5, coherenceFile=self.coh_file)
+        self.assertTrue(np.allclose(ts, sd.sbas_reference(self.ifgram_file, weight_file=self.coh_file), atol=1e-6))
+
+    def test_L1(self):
+        # noise-free interferograms with outliers in one of them
+        sd.write_ifgram_file(self.ifgram_file, noise=0.)
+        ts_true = sd.sbas_reference(self.ifgram_file)
+        h5 = h5py.File(self.ifgram_file, 'r+')
+        ifgram = sorted(h5['interferograms'].keys())[4]
+        h5['interferograms'][ifgram][ifgram][5:15, :] += 10.
+        h5.close()
+        ts_l1 = self.inverse('L1')
+        ts_l2 = self.inverse('L2', outfile=os.path.join(self.work_dir, 'ts_l2.h5'))
+        self.assertLess(np.abs(ts_l1 - ts_true).max(), 1e-4)
+        self.assertGreater(np.abs(ts_l2 - ts_true).max(), 1e-3)
+
+    def test_parallel(self):
+        sd.write_ifgram_file(self.ifgram_file, gaps=True)
+        ts = self.inverse('L2_masked', memory_limit=1e-5)
+        ts_par = self.inverse('L2_masked', memory_limit=1e-5, parallel=2,\
+                              outfile=os.path.join(self.work_dir, 'ts_par.h5'))
+        self.assertTrue(np.array_equal(ts_par, ts))
+
+    def test_std_and_residual(self):
+        sd.write_ifgram_file(self.ifgram_file)
+        ts = self.inverse('L2', memory_limit=1e-5, residualRMS=True, timeseriesStd=True)
+        # temporal coherence and residual RMS in the same pass
+        temp_coh = readfile.read(os.path.join(self.work_dir, 'temporalCoherence.h5'))[0]
+        self.assertTrue(np.allclose(temp_coh, tcoh.temporal_coherence(self.ts_file, self.ifgram_file), atol=1e-5))
+        rms = readfile.read(os.path.join(self.work_dir, 'residualRMS.h5'))[0]
+        self.assertTrue(np.all(rms >= 0.) and np.all(np.isfinite(rms)))
+
+        # std against covariance of least squares: sigma^2 * T * (B^T*B)^-1 * T^T
+        ifgram_list, data = sd.read_stack(self.ifgram_file)
+        data -= data[:, sd.ref_y:sd.ref_y+1, sd.ref_x:sd.ref_x+1]
+        date12_list = ptime.list_ifgram2date12(ifgram_list)
+        B = ut.design_matrix(date12_list=date12_list)[1]
+        date8_list = ptime.yyyymmdd(sorted(list(set(sum([i.split('-') for i in date12_list], [])))))
+        dt = np.diff(ptime.date_list2tbase(date8_list)[0])
+        T = np.tril(np.ones((len(dt), len(dt)))) * dt
+        std = sd.read_stack(os.path.join(self.work_dir, 'timeseriesStd.h5'))[1]
+        for y, x in [(0,0), (10,7), (19,14)]:
+            d = data[:, y, x]
+            res = d - np.dot(B, np.linalg.lstsq(B, d, rcond=-1)[0])
+            cov = np.dot(res, res) / (B.shape[0] - B.shape[1]) * np.dot(np.dot(T, np.linalg.inv(np.dot(B.T, B))), T.T)
+            std_ref = np.sqrt(np.diag(cov)) * abs(sd.phase2range)
+            self.assertTrue(np.allclose(std[1:, y, x], std_ref, rtol=1e-4))
+        self.assertTrue(np.all(std[0] == 0.))
+
+    def test_design_matrix_cache(self):
+        sd.write_ifgram_file(self.ifgram_file)
+        date12_list = ptime.list_ifgram2date12(sd.read_stack(self.ifgram_file)[0])
+        inv_mat = ut.design_matrix_factorization(date12_list)
+        self.assertFalse(os.path.isfile(os.path.join(self.work_dir, 'designMatrix.h5')))
+
+        # disk cache on explicit cache directory
+        ut.design_matrix_cache.clear()
+        ut.design_matrix_factorization(date12_list, cache_dir=self.work_dir)
+        cache_file = os.path.join(self.work_dir, 'designMatrix.h5')
+        self.assertTrue(os.path.isfile(cache_file))
+        ut.design_matrix_cache.clear()
+        inv_mat_disk = ut.design_matrix_factorization(date12_list, cache_dir=self.work_dir)
+        self.assertTrue(np.array_equal(inv_mat_disk['B_inv'], inv_mat['B_inv']))
+
+        # calculate without cache if cache file is broken
+        f = open(cache_file, 'wb')
+        f.write(b'not a HDF5 file')
+        f.close()
+        ut.design_matrix_cache.clear()
+        inv_mat_broken = ut.design_matrix_factorization(date12_list, cache_dir=self.work_dir)
+        self.assertTrue(np.array_equal(inv_mat_broken['B_inv'], inv_mat['B_inv']))
+
+    def check_incremental_update(self, drop_date12_list=[]):
+        sd.write_ifgram_file(self.ifgram_file, date_num=12)
+        drop_ifgram(self.ifgram_file, drop_date12_list)
+        ts_full = self.inverse('L2', outfile=os.path.join(self.work_dir, 'ts_full.h5'))
+        date6_list = sd.date6_list(12)
+        for new_date_idx in [[10,11], [0], [5]]:
+            # previous network without interferograms of new dates
+            old_file = os.path.join(self.work_dir, 'unwrapIfgram_old.h5')
+            shutil.copy(self.ifgram_file, old_file)
+            h5 = h5py.File(old_file, 'r+')
+            for ifgram in list(h5['interferograms'].keys()):
+                if any(date6_list[i] in ifgram for i in new_date_idx):
+                    del h5['interferograms'][ifgram]
+            h5.close()
+            ut.timeseries_inversion(old_file, self.ts_file, memory_limit=1e-5)
+            ut.timeseries_inversion_incremental(self.ifgram_file, self.ts_file, memory_limit=1e-5)
+            ts = sd.read_stack(self.ts_file)[1]
+            self.assertEqual(ts.shape, ts_full.shape)
+            self.assertTrue(np.allclose(ts, ts_full, atol=1e-6))
+            self.assertEqual(readfile.read_attribute(self.ts_file)['NETWORK_MD5'],\
+                             readfile.read_attribute(os.path.join(self.work_dir, 'ts_full.h5'))['NETWORK_MD5'])
+
+    def test_incremental_update(self):
+        self.check_incremental_update()
+
+    def test_incremental_update_subsets(self):
+        # network of 2 subsets: 1st-6th and 7th-12th acquisitions
+        date6_list = sd.date6_list(12)
+        self.check_incremental_update([date6_list[i]+'-'+date6_list[j] for i in range(3,6) for j in range(6,9)])
+
+    def test_incremental_update_fallback(self):
+        # modified network among existing acquisitions: re-inverse the whole network
+        sd.write_ifgram_file(self.ifgram_file, date_num=12)
+        ts_full = self.inverse('L2', outfile=os.path.join(self.work_dir, 'ts_full.h5'))
+        old_file = os.path.join(self.work_dir, 'unwrapIfgram_old.h5')
+        shutil.copy(self.ifgram_file, old_file)
+        h5 = h5py.File(old_file, 'r+')
+        ifgram_list = sorted(h5['interferograms'].keys())
+        for ifgram in ifgram_list:
+            if sd.date6_list(12)[-1] in ifgram or ifgram == ifgram_list[0]:
+                del h5['interferograms'][ifgram]
+        h5.close()
+        ut.timeseries_inversion(old_file, self.ts_file, memory_limit=1e-5)
+        ut.timeseries_inversion_incremental(self.ifgram_file, self.ts_file, memory_limit=1e-5)
+        self.assertTrue(np.allclose(sd.read_stack(self.ts_file)[1], ts_full, atol=1e-7))
+
+
+if __name__ == '__main__':
+    unittest.main()
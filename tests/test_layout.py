@@ -0,0 +1,88 @@
+#! /usr/bin/env python2
+# Regression tests of timeseries / interferograms / coherence file in cube layout (convert_layout.py):
+# the same results as the stack layout from network inversion, temporal coherence and DEM error correction.
+# Run:
+#   python -m unittest discover -s tests
+
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import h5py
+
+import synthetic_data as sd
+import _readfile as readfile
+import _pysar_utilities as ut
+import convert_layout
+import temporal_coherence as tcoh
+import dem_error
+
+
+class CubeLayoutTest(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir(self.work_dir)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        readfile.close_pooled_hdf5()
+        shutil.rmtree(self.work_dir)
+
+    def test_convert_layout(self):
+        ifgram_file = sd.write_ifgram_file('unwrapIfgram.h5')[0]
+        ifgram_list, data = sd.read_stack(ifgram_file)
+        cube_file = convert_layout.convert2cube(ifgram_file, 'unwrapIfgram_cube.h5')
+        stack_file = convert_layout.convert2stack(cube_file, 'unwrapIfgram_stack.h5')
+        ifgram_list_stack, data_stack = sd.read_stack(stack_file)
+        self.assertEqual(ifgram_list_stack, ifgram_list)
+        self.assertTrue(np.array_equal(data_stack, data))
+        self.assertEqual(readfile.read_attribute(stack_file, epoch=ifgram_list[3])['DATE12'],\
+                         readfile.read_attribute(ifgram_file, epoch=ifgram_list[3])['DATE12'])
+
+    def test_timeseries_inversion(self):
+        ifgram_file = sd.write_ifgram_file('unwrapIfgram.h5', gaps=True, coherence_file='coherence.h5')[0]
+        # dropped interferogram
+        h5 = h5py.File(ifgram_file, 'r+')
+        h5['interferograms'][sorted(h5['interferograms'].keys())[3]].attrs['drop_ifgram'] = 'yes'
+        h5.close()
+        convert_layout.convert2cube(ifgram_file, 'unwrapIfgram_cube.h5')
+        convert_layout.convert2cube('coherence.h5', 'coherence_cube.h5')
+        for method in ['L2', 'L2_masked', 'WLS']:
+            ut.timeseries_inversion(ifgram_file, 'timeseries.h5', method=method, coherenceFile='coherence.h5')
+            ut.timeseries_inversion('unwrapIfgram_cube.h5', 'timeseries_fromCube.h5', method=method,\
+                                    coherenceFile='coherence_cube.h5')
+            date_list, ts = sd.read_stack('timeseries.h5')
+            date_list_cube, ts_cube = sd.read_stack('timeseries_fromCube.h5')
+            self.assertEqual(date_list_cube, date_list)
+            self.assertTrue(np.allclose(ts_cube, ts, atol=1e-7))
+            self.assertEqual(readfile.read_attribute('timeseries_fromCube.h5')['P_BASELINE_TIMESERIES'],\
+                             readfile.read_attribute('timeseries.h5')['P_BASELINE_TIMESERIES'])
+
+        convert_layout.convert2cube('timeseries.h5', 'timeseries_cube.h5')
+        temp_coh = tcoh.temporal_coherence('timeseries.h5', ifgram_file)
+        temp_coh_cube = tcoh.temporal_coherence('timeseries_cube.h5', 'unwrapIfgram_cube.h5')
+        self.assertTrue(np.allclose(temp_coh_cube, temp_coh, atol=1e-6))
+
+    def test_dem_error(self):
+        sd.write_timeseries_file(os.path.join(self.work_dir, 'timeseries.h5'))
+        convert_layout.convert2cube('timeseries.h5', 'timeseries_cube.h5')
+        sys_argv = sys.argv
+        try:
+            for fname in ['timeseries.h5', 'timeseries_cube.h5']:
+                sys.argv = ['dem_error.py', fname, '-i', 'incidence_angle.h5', '-r', 'range.h5',\
+                            '-o', fname.replace('.h5', '_demErr.h5')]
+                dem_error.main(sys.argv[1:])
+        finally:
+            sys.argv = sys_argv
+        ts_cor = sd.read_stack('timeseries_demErr.h5')[1]
+        ts_cor_cube = sd.read_stack('timeseries_cube_demErr.h5')[1]
+        self.assertTrue(np.allclose(ts_cor_cube, ts_cor, atol=1e-7))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+#! /usr/bin/env python2
+# Regression tests of _readfile: box reading of binary files, attribute cache, pooled HDF5 handles
+# and epoch reading of timeseries / interferograms file in stack and cube layout.
+# Run:
+#   python -m unittest discover -s tests
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import h5py
+
+import synthetic_data as sd
+import _readfile as readfile
+import _writefile as writefile
+import _pysar_utilities as ut
+import convert_layout
+
+
+def write_rsc(fname, length, width, processor='roipac'):
+    f = open(fname+'.rsc', 'w')
+    f.write('WIDTH %d\nFILE_LENGTH %d\nINSAR_PROCESSOR %s\n' % (width, length, processor))
+    f.close()
+
+
+class ReadfileTest(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.length, self.width = 37, 53
+        self.box = (5, 7, 31, 20)
+        self.rng = np.random.RandomState(0)
+
+    def tearDown(self):
+        readfile.close_pooled_hdf5()
+        readfile.invalidate_attribute_cache()
+        shutil.rmtree(self.work_dir)
+
+    def crop(self, data):
+        return data[self.box[1]:self.box[3], self.box[0]:self.box[2]]
+
+    def test_read_binary_box(self):
+        # RMG format: amplitude and phase side by side
+        amp = np.array(self.rng.rand(self.length, self.width), np.float32)
+        pha = np.array(self.rng.rand(self.length, self.width), np.float32)
+        fname = os.path.join(self.work_dir, 'filt_100102-100220.unw')
+        np.hstack((amp, pha)).tofile(fname)
+        write_rsc(fname, self.length, self.width)
+        self.assertTrue(np.array_equal(readfile.read(fname)[0], pha))
+        self.assertTrue(np.array_equal(readfile.read(fname, self.box)[0], self.crop(pha)))
+        amp_box, pha_box = readfile.read_float32(fname, self.box)[0:2]
+        self.assertTrue(np.array_equal(amp_box, self.crop(amp)))
+
+        # complex64 interferogram
+        data = np.array(self.rng.rand(self.length, self.width) + 1j*self.rng.rand(self.length, self.width), np.complex64)
+        fname = os.path.join(self.work_dir, 'filt_100102-100220.int')
+        data.tofile(fname)
+        write_rsc(fname, self.length, self.width)
+        self.assertTrue(np.allclose(readfile.read(fname, self.box)[0], np.angle(self.crop(data))))
+
+        # int16 DEM
+        dem = np.array(self.rng.randint(-100, 3000, (self.length, self.width)), np.int16)
+        fname = os.path.join(self.work_dir, 'radar.dem')
+        dem.tofile(fname)
+        write_rsc(fname, self.length, self.width)
+        self.assertTrue(np.array_equal(readfile.read(fname)[0], dem))
+        self.assertTrue(np.array_equal(readfile.read(fname, self.box)[0], self.crop(dem)))
+
+    def test_attribute_cache(self):
+        fname = os.path.join(self.work_dir, 'velocity.h5')
+        atr = {'FILE_TYPE':'velocity', 'FILE_LENGTH':'5', 'WIDTH':'6', 'VERSION':'1'}
+        writefile.write(np.ones((5,6), np.float32), atr, fname)
+        atr = readfile.read_attribute(fname)
+        atr['VERSION'] = 'modified by caller'
+        self.assertEqual(readfile.read_attribute(fname)['VERSION'], '1')
+
+        # modified by writers
+        ut.add_attribute(fname, {'VERSION':'2'})
+        self.assertEqual(readfile.read_attribute(fname)['VERSION'], '2')
+        atr['VERSION'] = '3'
+        writefile.write(np.ones((5,6), np.float32), atr, fname)
+        self.assertEqual(readfile.read_attribute(fname)['VERSION'], '3')
+
+        # modified metadata file of binary file
+        fname = os.path.join(self.work_dir, 'radar.dem')
+        np.zeros((self.length, self.width), np.int16).tofile(fname)
+        write_rsc(fname, self.length, self.width)
+        self.assertEqual(readfile.read_attribute(fname)['WIDTH'], str(self.width))
+        writefile.write_roipac_rsc({'WIDTH':str(self.width), 'FILE_LENGTH':str(self.length), 'NEW':'1'}, fname+'.rsc')
+        self.assertEqual(readfile.read_attribute(fname)['NEW'], '1')
+
+    def test_pooled_hdf5(self):
+        fname = sd.write_timeseries_file(os.path.join(self.work_dir, 'timeseries.h5'))[0]
+        date_list, ts = sd.read_stack(fname)
+        with readfile.pooled_hdf5(fname) as h5:
+            self.assertTrue(readfile.find_pooled_hdf5(fname) is h5)
+            data = readfile.read(fname, (2, 3, 10, 12), epoch=date_list[5])[0]
+        self.assertTrue(readfile.find_pooled_hdf5(fname) is None)
+        self.assertTrue(np.array_equal(data, ts[5, 3:12, 2:10]))
+
+        # write to the file after closing its pooled handle
+        h5 = readfile.open_pooled_hdf5(fname)
+        self.assertEqual(readfile.read_epoch_list(h5, 'timeseries'), date_list)
+        readfile.close_pooled_hdf5(fname)
+        h5 = h5py.File(fname, 'w')
+        h5.close()
+
+    def test_read_epoch_box(self):
+        fname = sd.write_timeseries_file(os.path.join(self.work_dir, 'timeseries.h5'))[0]
+        cube_file = convert_layout.convert2cube(fname, os.path.join(self.work_dir, 'timeseries_cube.h5'))
+        date_list, ts = sd.read_stack(fname)
+        epoch_list = [date_list[5], date_list[1], date_list[9], date_list[1]]
+        box = (2, 3, 9, 8)
+        for File in [fname, cube_file]:
+            h5 = h5py.File(File, 'r')
+            self.assertEqual(readfile.read_epoch_list(h5, 'timeseries'), date_list)
+            data = readfile.read_epoch_box(h5, 'timeseries', epoch_list, box)
+            h5.close()
+            self.assertTrue(np.array_equal(data, ts[[5,1,9,1], box[1]:box[3], box[0]:box[2]]))
+            self.assertTrue(np.array_equal(readfile.read(File, epoch=date_list[4])[0], ts[4]))
+
+
+if __name__ == '__main__':
+    unittest.main()
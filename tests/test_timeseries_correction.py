@@ -0,0 +1,107 @@
+#! /usr/bin/env python2
+# Regression tests of box-by-box processing of time-series file, on small synthetic data:
+# DEM error correction, velocity estimation and temporal coherence,
+# against the reference calculated pixel by pixel / all in memory with numpy.
+# Run:
+#   python -m unittest discover -s tests
+
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import synthetic_data as sd
+import _datetime as ptime
+import _readfile as readfile
+import _pysar_utilities as ut
+import dem_error
+import timeseries2velocity as ts2vel
+import temporal_coherence as tcoh
+
+
+def run_script(module, argv):
+    '''Run main() of script module parsing command line from sys.argv'''
+    sys_argv = sys.argv
+    sys.argv = [module.__name__+'.py'] + argv
+    try:
+        module.main(argv)
+    finally:
+        sys.argv = sys_argv
+
+
+class TimeseriesCorrectionTest(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir(self.work_dir)
+        self.ts_file = os.path.join(self.work_dir, 'timeseries.h5')
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        readfile.close_pooled_hdf5()
+        shutil.rmtree(self.work_dir)
+
+    def run_dem_error(self, outfile, options=[]):
+        run_script(dem_error, [self.ts_file, '-i', 'incidence_angle.h5', '-r', 'range.h5', '-o', outfile] + options)
+        shutil.move('demRadar_error.h5', os.path.splitext(outfile)[0]+'_demErr.h5')
+        return sd.read_stack(outfile)[1], readfile.read(os.path.splitext(outfile)[0]+'_demErr.h5')[0]
+
+    def test_dem_error(self):
+        vel, dz = sd.write_timeseries_file(self.ts_file, noise=0.)[1:]
+        ts_cor, dem_err = self.run_dem_error('timeseries_demErr.h5', ['--poly-order', '1'])
+        self.assertTrue(np.allclose(dem_err, dz, atol=1e-2))
+        # corrected time series of linear velocity
+        date8_list = sd.read_stack(self.ts_file)[0]
+        years = np.array(ptime.date_list2tbase(date8_list)[0]) / 365.25
+        ts_cor -= ts_cor[0]
+        self.assertTrue(np.allclose(ts_cor, years.reshape(-1,1,1)*vel, atol=1e-5))
+
+        # box by box, in parallel
+        ts_box, dem_err_box = self.run_dem_error('timeseries_box.h5', ['--poly-order', '1', '--memory-limit', '1e-5'])
+        ts_par, dem_err_par = self.run_dem_error('timeseries_par.h5', ['--poly-order', '1', '--memory-limit', '1e-5',\
+                                                                        '--parallel'])
+        ts_cor = sd.read_stack('timeseries_demErr.h5')[1]
+        for data, data_ref in [(ts_box, ts_cor), (ts_par, ts_cor), (dem_err_box, dem_err), (dem_err_par, dem_err)]:
+            self.assertTrue(np.allclose(data, data_ref, atol=1e-6))
+
+    def test_velocity(self):
+        sd.write_timeseries_file(self.ts_file)
+        date8_list, ts = sd.read_stack(self.ts_file)
+        years = np.array(ptime.date_list2vector(date8_list)[1])
+        B = np.vstack((years-years[0], np.ones(len(years)))).T
+        X, ssr = np.linalg.lstsq(B, ts.reshape(len(years), -1), rcond=-1)[0:2]
+        vel_ref = X[0].reshape(ts.shape[1:])
+        rmse_ref = np.sqrt(ssr / len(years)).reshape(ts.shape[1:])
+        std_ref = np.sqrt(ssr / (len(years)-2) * np.linalg.inv(np.dot(B.T, B))[0,0]).reshape(ts.shape[1:])
+
+        for memory_limit in ['4', '1e-5']:
+            vel_file = os.path.join(self.work_dir, 'velocity.h5')
+            run_script(ts2vel, [self.ts_file, '-o', vel_file, '--memory-limit', memory_limit])
+            self.assertTrue(np.allclose(readfile.read(vel_file)[0], vel_ref, atol=1e-6))
+            self.assertTrue(np.allclose(readfile.read(vel_file.replace('.h5','Rmse.h5'))[0], rmse_ref, atol=1e-6))
+            self.assertTrue(np.allclose(readfile.read(vel_file.replace('.h5','Std.h5'))[0], std_ref, atol=1e-6))
+
+    def test_temporal_coherence(self):
+        ifgram_file = sd.write_ifgram_file(os.path.join(self.work_dir, 'unwrapIfgram.h5'))[0]
+        ut.timeseries_inversion(ifgram_file, self.ts_file)
+
+        # reference: all interferograms and time series in memory
+        ifgram_list, data = sd.read_stack(ifgram_file)
+        data -= data[:, sd.ref_y:sd.ref_y+1, sd.ref_x:sd.ref_x+1]
+        ts = sd.read_stack(self.ts_file)[1] / sd.phase2range
+        A = ut.design_matrix(date12_list=ptime.list_ifgram2date12(ifgram_list))[0]
+        data -= np.dot(A, ts[1:].reshape(ts.shape[0]-1, -1)).reshape(data.shape)
+        temp_coh_ref = np.abs(np.sum(np.exp(1j*data), axis=0)) / len(ifgram_list)
+
+        temp_coh = tcoh.temporal_coherence(self.ts_file, ifgram_file)
+        temp_coh_box = tcoh.temporal_coherence(self.ts_file, ifgram_file, memory_limit=1e-5, parallel=2)
+        self.assertTrue(np.allclose(temp_coh, temp_coh_ref, atol=1e-5))
+        self.assertTrue(np.allclose(temp_coh_box, temp_coh, atol=1e-6))
+
+
+if __name__ == '__main__':
+    unittest.main()
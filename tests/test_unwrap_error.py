@@ -0,0 +1,138 @@
+#! /usr/bin/env python2
+# Regression tests of phase closure of interferograms network, on small synthetic data with unwrapping errors:
+# triangle enumeration, closure statistics (ifgram_closure.py) and unwrapping error correction (unwrap_error.py).
+# Run:
+#   python -m unittest discover -s tests
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import h5py
+
+import synthetic_data as sd
+import _readfile as readfile
+import _pysar_utilities as ut
+import ifgram_closure
+import unwrap_error
+
+
+def write_unwrap_error_file(ifgram_file, seed=1):
+    '''Write interferograms file with unwrapping errors of +/-2*pi in random boxes of 40% interferograms'''
+    sd.write_ifgram_file(ifgram_file, length=30, width=25, seed=seed)
+    rng = np.random.RandomState(seed)
+    h5 = h5py.File(ifgram_file, 'r+')
+    for ifgram in sorted(h5['interferograms'].keys()):
+        data = h5['interferograms'][ifgram][ifgram][:] * 20.
+        if rng.rand() < 0.4:
+            y0, x0 = rng.randint(0, 20), rng.randint(0, 15)
+            data[y0:y0+10, x0:x0+10] += 2*np.pi*rng.choice([-1,1])
+        h5['interferograms'][ifgram][ifgram][:] = data
+    h5.close()
+    return ifgram_file
+
+
+def closure_phase(ifgram_file):
+    '''Closure phase of all triangles of the network, enumerated by brute force
+    Outputs: triangle_list - list of tuple of 3 string, date12 of d1-d2, d1-d3, d2-d3
+             curl          - 2D np.array in size of (triangle_num, pixel_num)
+    '''
+    h5 = h5py.File(ifgram_file, 'r')
+    data_dict = dict()
+    for ifgram in h5['interferograms'].keys():
+        data_dict[h5['interferograms'][ifgram].attrs['DATE12']] = h5['interferograms'][ifgram][ifgram][:].flatten()
+    h5.close()
+    date_list = sorted(list(set(sum([i.split('-') for i in data_dict.keys()], []))))
+    triangle_list = []
+    curl = []
+    for i in range(len(date_list)):
+        for j in range(i+1, len(date_list)):
+            for k in range(j+1, len(date_list)):
+                tri = (date_list[i]+'-'+date_list[j], date_list[i]+'-'+date_list[k], date_list[j]+'-'+date_list[k])
+                if all(d12 in data_dict for d12 in tri):
+                    triangle_list.append(tri)
+                    curl.append(data_dict[tri[0]] + data_dict[tri[2]] - data_dict[tri[1]])
+    return triangle_list, np.array(curl)
+
+
+class PhaseClosureTest(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir(self.work_dir)
+        self.ifgram_file = write_unwrap_error_file(os.path.join(self.work_dir, 'unwrapIfgram.h5'))
+        mask = np.ones((30, 25), np.float32)
+        mask[:3, :] = 0.
+        self.mask_file = sd.write_mask_file(os.path.join(self.work_dir, 'mask.h5'), mask)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        readfile.close_pooled_hdf5()
+        shutil.rmtree(self.work_dir)
+
+    def test_get_triangles(self):
+        triangle_list, curl_ref = closure_phase(self.ifgram_file)
+        h5 = h5py.File(self.ifgram_file, 'r')
+        curls, Triangles, C = ut.get_triangles(h5)
+        data = ut.read_ifgram_box(h5, list(h5['interferograms'].keys()), (0, 0, 25, 30))
+        h5.close()
+        self.assertEqual(sorted([tuple(i) for i in Triangles]), sorted(triangle_list))
+        order = [triangle_list.index(tuple(i)) for i in Triangles]
+        self.assertTrue(np.allclose(C.dot(data), curl_ref[order], atol=1e-4))
+
+    def test_ifgram_closure(self):
+        ifgram_closure.ifgram_closure(self.ifgram_file, 'closure.h5', memory_limit=1e-5)
+        self.assertFalse(os.path.isfile('curls.h5'))
+        curl_ref = closure_phase(self.ifgram_file)[1]
+        mean_abs = readfile.read('closure.h5')[0]
+        self.assertTrue(np.allclose(mean_abs.flatten(), np.mean(np.abs(curl_ref), axis=0), atol=1e-4))
+        num_nonzero = readfile.read('closureNumNonzero.h5')[0]
+        self.assertTrue(np.array_equal(num_nonzero.flatten(), np.sum(np.abs(curl_ref) >= 0.5, axis=0)))
+
+        # closure phase written in the same pass, if curl file is given
+        ifgram_closure.ifgram_closure(self.ifgram_file, 'closure2.h5', curl_file='curls.h5')
+        h5 = h5py.File('curls.h5','r')
+        self.assertEqual(len(h5['interferograms'].keys()), curl_ref.shape[0])
+        h5.close()
+
+    def test_unwrap_error_phase_closure(self):
+        cor_file = unwrap_error.unwrap_error_correction_phase_closure(self.ifgram_file, self.mask_file,\
+                                                                      'unwrapIfgram_unwCor.h5')
+        self.assertFalse(os.path.isfile('curls.h5'))
+        data = sd.read_stack(self.ifgram_file)[1]
+        data_cor = sd.read_stack(cor_file)[1]
+
+        # correction in integer cycles, on pixels in mask only
+        cycle = (data_cor - data) / (2*np.pi)
+        self.assertTrue(np.allclose(cycle, np.round(cycle), atol=1e-3))
+        self.assertTrue(np.all(cycle[:, :3, :] == 0.))
+        # less non-zero closure phase
+        curl_num = np.sum(np.abs(closure_phase(self.ifgram_file)[1]) > np.pi)
+        curl_num_cor = np.sum(np.abs(closure_phase(cor_file)[1]) > np.pi)
+        self.assertLess(curl_num_cor, curl_num)
+
+        # box by box, with closure phase written out
+        cor_file_box = unwrap_error.unwrap_error_correction_phase_closure(self.ifgram_file, self.mask_file,\
+                                                                          'unwrapIfgram_unwCor_box.h5',\
+                                                                          memory_limit=1e-6, curl_file='curls.h5')
+        self.assertTrue(np.array_equal(sd.read_stack(cor_file_box)[1], data_cor))
+        self.assertTrue(os.path.isfile('curls.h5'))
+
+    def test_unwrap_error_bridging(self):
+        mask = np.ones((30, 25), np.float32)
+        mask[:, 13:] = 2.
+        mask[:2, :] = 0.
+        mask_file = sd.write_mask_file(os.path.join(self.work_dir, 'mask2.h5'), mask)
+        for ramp_type in ['plane', 'quadratic']:
+            cor_file = unwrap_error.unwrap_error_correction_bridging(self.ifgram_file, mask_file, [10,10], [11,15],\
+                                                                     ramp_type, 'cor.h5')[0]
+            cor_file_par = unwrap_error.unwrap_error_correction_bridging(self.ifgram_file, mask_file, [10,10], [11,15],\
+                                                                         ramp_type, 'cor_par.h5', parallel=True)[0]
+            self.assertTrue(np.array_equal(sd.read_stack(cor_file_par)[1], sd.read_stack(cor_file)[1]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+#! /usr/bin/env python2
+# Regression tests of _writefile: compression of HDF5 datasets and writing 3D data in cube layout.
+# Run:
+#   python -m unittest discover -s tests
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import h5py
+
+import synthetic_data as sd
+import _readfile as readfile
+import _writefile as writefile
+
+
+class WritefileTest(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.compression = os.environ.pop('PYSAR_COMPRESSION', None)
+
+    def tearDown(self):
+        os.environ.pop('PYSAR_COMPRESSION', None)
+        if self.compression:
+            os.environ['PYSAR_COMPRESSION'] = self.compression
+        readfile.invalidate_attribute_cache()
+        shutil.rmtree(self.work_dir)
+
+    def test_compression_kwargs(self):
+        self.assertEqual(writefile.compression_kwargs('none'), dict())
+        self.assertEqual(writefile.compression_kwargs('lzf'), {'compression':'lzf'})
+        self.assertEqual(writefile.compression_kwargs('gzip4'), {'compression':'gzip', 'compression_opts':4})
+        self.assertEqual(writefile.compression_kwargs('shuffle+lzf'), {'compression':'lzf', 'shuffle':True})
+        self.assertRaises(ValueError, writefile.compression_kwargs, 'zip')
+
+        # environment variable
+        os.environ['PYSAR_COMPRESSION'] = 'lzf'
+        self.assertEqual(writefile.compression_kwargs(), {'compression':'lzf'})
+        data = np.array(np.random.RandomState(0).rand(20, 15), np.float32)
+        fname = writefile.write(data, {'FILE_TYPE':'velocity', 'FILE_LENGTH':'20', 'WIDTH':'15'},\
+                                os.path.join(self.work_dir, 'velocity.h5'))
+        h5 = h5py.File(fname, 'r')
+        self.assertEqual(h5['velocity']['velocity'].compression, 'lzf')
+        h5.close()
+        self.assertTrue(np.array_equal(readfile.read(fname)[0], data))
+
+    def test_write_cube(self):
+        fname = sd.write_timeseries_file(os.path.join(self.work_dir, 'timeseries.h5'))[0]
+        date_list, ts = sd.read_stack(fname)
+        atr = readfile.read_attribute(fname)
+        outfile = writefile.write(ts, atr, os.path.join(self.work_dir, 'timeseries_cube.h5'), epoch_list=date_list)
+        h5 = h5py.File(outfile, 'r')
+        self.assertTrue(readfile.is_cube_file(h5, 'timeseries'))
+        self.assertEqual(readfile.read_epoch_list(h5, 'timeseries'), date_list)
+        h5.close()
+        self.assertTrue(np.array_equal(readfile.read(outfile, epoch=date_list[4])[0], ts[4]))
+        self.assertEqual(readfile.read_attribute(outfile)['P_BASELINE_TIMESERIES'], atr['P_BASELINE_TIMESERIES'])
+
+        # 3D data without epoch list
+        self.assertEqual(writefile.write(ts, atr, os.path.join(self.work_dir, 'timeseries2.h5')), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()